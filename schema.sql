@@ -1,17 +1,14 @@
+-- The schema is built by the versioned migrations in src/migrations, apply
+-- them to a database with
 --
--- PostgreSQL database dump
+--     POSTGRES_URI=... python -m src.migrate
 --
+-- The following statements describe the inserts required for
+-- v1_manual_test, run them on a migrated database.
 
--- Dumped from database version 15.6
--- Dumped by pg_dump version 15.8 (Homebrew)
-
--- NOTE: The contents of this dump have been significantly modified. 
---       Therefore, this file is not suitable for any sort of production
---       or automation use. Any subsequent schema updates will require
---       manual updates to this file. 
-
--- The following statements describe the inserts required for 
--- v1_manual_test
+-- Customers
+INSERT INTO customers (customer_id, customer_name) VALUES
+(1, 'Robert California');
 
 -- Recipes
 INSERT INTO recipes (id, name, instructions, difficulty, time) VALUES
@@ -21,427 +18,10 @@ INSERT INTO recipes (id, name, instructions, difficulty, time) VALUES
 INSERT INTO reviews (review_id, recipe_id, customer_id, rating, review) VALUES
 (1, 1, 1, 5, 'I love this recipe');
 
--- Customers
-INSERT INTO customers (customer_id, customer_name) VALUES
-(1, 'Robert California');
-
---
--- Name: cart_items; Type: TABLE; Schema: public; Owner: postgres
---
-
-CREATE TABLE public.cart_items (
-    cart_id bigint NOT NULL,
-    item_id bigint NOT NULL,
-    quantity integer
-);
-
-
-ALTER TABLE public.cart_items OWNER TO postgres;
-
---
--- Name: cart_items_cart_id_seq; Type: SEQUENCE; Schema: public; Owner: postgres
---
-
-ALTER TABLE public.cart_items ALTER COLUMN cart_id ADD GENERATED BY DEFAULT AS IDENTITY (
-    SEQUENCE NAME public.cart_items_cart_id_seq
-    START WITH 1
-    INCREMENT BY 1
-    NO MINVALUE
-    NO MAXVALUE
-    CACHE 1
-);
-
-
---
--- Name: carts; Type: TABLE; Schema: public; Owner: postgres
---
-
-CREATE TABLE public.carts (
-    cart_id bigint NOT NULL,
-    customer_id bigint NOT NULL,
-    payment_id bigint
-);
-
-
-ALTER TABLE public.carts OWNER TO postgres;
-
---
--- Name: carts_id_seq; Type: SEQUENCE; Schema: public; Owner: postgres
---
-
-ALTER TABLE public.carts ALTER COLUMN cart_id ADD GENERATED BY DEFAULT AS IDENTITY (
-    SEQUENCE NAME public.carts_id_seq
-    START WITH 1
-    INCREMENT BY 1
-    NO MINVALUE
-    NO MAXVALUE
-    CACHE 1
-);
-
-
---
--- Name: customers; Type: TABLE; Schema: public; Owner: postgres
---
-
-CREATE TABLE public.customers (
-    customer_id bigint NOT NULL,
-    customer_name text NOT NULL
-);
-
-
-ALTER TABLE public.customers OWNER TO postgres;
-
---
--- Name: customers_customer_id_seq; Type: SEQUENCE; Schema: public; Owner: postgres
---
-
-ALTER TABLE public.customers ALTER COLUMN customer_id ADD GENERATED BY DEFAULT AS IDENTITY (
-    SEQUENCE NAME public.customers_customer_id_seq
-    START WITH 1
-    INCREMENT BY 1
-    NO MINVALUE
-    NO MAXVALUE
-    CACHE 1
-);
-
-
---
--- Name: ingredients; Type: TABLE; Schema: public; Owner: postgres
---
-
-CREATE TABLE public.ingredients (
-    ingredient_id bigint NOT NULL,
-    ingredient_name text NOT NULL,
-    price double precision,
-    item_type integer
-);
-
-
-ALTER TABLE public.ingredients OWNER TO postgres;
-
---
--- Name: ingredients_id_seq; Type: SEQUENCE; Schema: public; Owner: postgres
---
-
-ALTER TABLE public.ingredients ALTER COLUMN ingredient_id ADD GENERATED BY DEFAULT AS IDENTITY (
-    SEQUENCE NAME public.ingredients_id_seq
-    START WITH 1
-    INCREMENT BY 1
-    NO MINVALUE
-    NO MAXVALUE
-    CACHE 1
-);
-
-
---
--- Name: payments; Type: TABLE; Schema: public; Owner: postgres
---
-
-CREATE TABLE public.payments (
-    payment_id bigint NOT NULL,
-    card_num bigint NOT NULL,
-    exp_date text,
-    cvv integer,
-    customer_id bigint
-);
-
-
-ALTER TABLE public.payments OWNER TO postgres;
-
---
--- Name: payments_payment_id_seq; Type: SEQUENCE; Schema: public; Owner: postgres
---
-
-ALTER TABLE public.payments ALTER COLUMN payment_id ADD GENERATED BY DEFAULT AS IDENTITY (
-    SEQUENCE NAME public.payments_payment_id_seq
-    START WITH 1
-    INCREMENT BY 1
-    NO MINVALUE
-    NO MAXVALUE
-    CACHE 1
-);
-
-
---
--- Name: recipe_ingredients; Type: TABLE; Schema: public; Owner: postgres
---
-
-CREATE TABLE public.recipe_ingredients (
-    recipe_id bigint NOT NULL,
-    ingredient_id bigint NOT NULL,
-    amount_units text
-);
-
-
-ALTER TABLE public.recipe_ingredients OWNER TO postgres;
-
---
--- Name: recipe_ingredients_recipe_id_seq; Type: SEQUENCE; Schema: public; Owner: postgres
---
-
-ALTER TABLE public.recipe_ingredients ALTER COLUMN recipe_id ADD GENERATED BY DEFAULT AS IDENTITY (
-    SEQUENCE NAME public.recipe_ingredients_recipe_id_seq
-    START WITH 1
-    INCREMENT BY 1
-    NO MINVALUE
-    NO MAXVALUE
-    CACHE 1
-);
-
-
---
--- Name: recipe_supplies; Type: TABLE; Schema: public; Owner: postgres
---
-
-CREATE TABLE public.recipe_supplies (
-    recipe_id bigint NOT NULL,
-    supply_id bigint NOT NULL
-);
-
-
-ALTER TABLE public.recipe_supplies OWNER TO postgres;
-
---
--- Name: recipe_supplies_recipe_id_seq; Type: SEQUENCE; Schema: public; Owner: postgres
---
-
-ALTER TABLE public.recipe_supplies ALTER COLUMN recipe_id ADD GENERATED BY DEFAULT AS IDENTITY (
-    SEQUENCE NAME public.recipe_supplies_recipe_id_seq
-    START WITH 1
-    INCREMENT BY 1
-    NO MINVALUE
-    NO MAXVALUE
-    CACHE 1
-);
-
-
---
--- Name: recipes; Type: TABLE; Schema: public; Owner: postgres
---
-
-CREATE TABLE public.recipes (
-    id bigint NOT NULL,
-    name text NOT NULL,
-    instructions text,
-    difficulty text,
-    "time" integer
-    ingredients text[] NOT NULL DEFAULT '{}',
-    supplies_needed text[] NOT NULL DEFAULT '{}'
-);
-
-
-ALTER TABLE public.recipes OWNER TO postgres;
-
---
--- Name: recipes_id_seq; Type: SEQUENCE; Schema: public; Owner: postgres
---
-
-ALTER TABLE public.recipes ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY (
-    SEQUENCE NAME public.recipes_id_seq
-    START WITH 1
-    INCREMENT BY 1
-    NO MINVALUE
-    NO MAXVALUE
-    CACHE 1
-);
-
-
---
--- Name: reviews; Type: TABLE; Schema: public; Owner: postgres
---
-
-CREATE TABLE public.reviews (
-    review_id bigint NOT NULL,
-    recipe_id bigint NOT NULL,
-    customer_id bigint,
-    rating integer,
-    review text
-);
-
-
-ALTER TABLE public.reviews OWNER TO postgres;
-
---
--- Name: reviews_id_seq; Type: SEQUENCE; Schema: public; Owner: postgres
---
-
-ALTER TABLE public.reviews ALTER COLUMN review_id ADD GENERATED BY DEFAULT AS IDENTITY (
-    SEQUENCE NAME public.reviews_id_seq
-    START WITH 1
-    INCREMENT BY 1
-    NO MINVALUE
-    NO MAXVALUE
-    CACHE 1
-);
-
-
---
--- Name: supplies; Type: TABLE; Schema: public; Owner: postgres
---
-
-CREATE TABLE public.supplies (
-    supply_id bigint NOT NULL,
-    supply_name text NOT NULL
-);
-
-
-ALTER TABLE public.supplies OWNER TO postgres;
-
---
--- Name: supplies_id_seq; Type: SEQUENCE; Schema: public; Owner: postgres
---
-
-ALTER TABLE public.supplies ALTER COLUMN supply_id ADD GENERATED BY DEFAULT AS IDENTITY (
-    SEQUENCE NAME public.supplies_id_seq
-    START WITH 1
-    INCREMENT BY 1
-    NO MINVALUE
-    NO MAXVALUE
-    CACHE 1
-);
-
-
---
--- Name: cart_items cart_items_pkey; Type: CONSTRAINT; Schema: public; Owner: postgres
---
-
-ALTER TABLE ONLY public.cart_items
-    ADD CONSTRAINT cart_items_pkey PRIMARY KEY (cart_id, item_id);
-
-
---
--- Name: carts carts_pkey; Type: CONSTRAINT; Schema: public; Owner: postgres
---
-
-ALTER TABLE ONLY public.carts
-    ADD CONSTRAINT carts_pkey PRIMARY KEY (cart_id);
-
-
---
--- Name: customers customers_pkey; Type: CONSTRAINT; Schema: public; Owner: postgres
---
-
-ALTER TABLE ONLY public.customers
-    ADD CONSTRAINT customers_pkey PRIMARY KEY (customer_id);
-
-
---
--- Name: ingredients ingredients_pkey; Type: CONSTRAINT; Schema: public; Owner: postgres
---
-
-ALTER TABLE ONLY public.ingredients
-    ADD CONSTRAINT ingredients_pkey PRIMARY KEY (ingredient_id);
-
-
---
--- Name: payments payments_pkey; Type: CONSTRAINT; Schema: public; Owner: postgres
---
-
-ALTER TABLE ONLY public.payments
-    ADD CONSTRAINT payments_pkey PRIMARY KEY (payment_id);
-
-
---
--- Name: recipe_ingredients recipe_ingredients_pkey; Type: CONSTRAINT; Schema: public; Owner: postgres
---
-
-ALTER TABLE ONLY public.recipe_ingredients
-    ADD CONSTRAINT recipe_ingredients_pkey PRIMARY KEY (recipe_id, ingredient_id);
-
-
---
--- Name: recipe_supplies recipe_supplies_pkey; Type: CONSTRAINT; Schema: public; Owner: postgres
---
-
-ALTER TABLE ONLY public.recipe_supplies
-    ADD CONSTRAINT recipe_supplies_pkey PRIMARY KEY (recipe_id, supply_id);
-
-
---
--- Name: recipes recipes_pkey; Type: CONSTRAINT; Schema: public; Owner: postgres
---
-
-ALTER TABLE ONLY public.recipes
-    ADD CONSTRAINT recipes_pkey PRIMARY KEY (id);
-
-
---
--- Name: reviews reviews_pkey; Type: CONSTRAINT; Schema: public; Owner: postgres
---
-
-ALTER TABLE ONLY public.reviews
-    ADD CONSTRAINT reviews_pkey PRIMARY KEY (review_id);
-    ADD CONSTRAINT fk_recipe FOREIGN KEY (recipe_id) REFERENCES public.recipes(id),
-    ADD CONSTRAINT fk_customer FOREIGN KEY (customer_id) REFERENCES public.customers(customer_id);
-
-
---
--- Name: supplies supplies_pkey; Type: CONSTRAINT; Schema: public; Owner: postgres
---
-
-ALTER TABLE ONLY public.supplies
-    ADD CONSTRAINT supplies_pkey PRIMARY KEY (supply_id);
-
-
---
--- Name: cart_items; Type: ROW SECURITY; Schema: public; Owner: postgres
---
-
-ALTER TABLE public.cart_items ENABLE ROW LEVEL SECURITY;
-
---
--- Name: carts; Type: ROW SECURITY; Schema: public; Owner: postgres
---
-
-ALTER TABLE public.carts ENABLE ROW LEVEL SECURITY;
-
---
--- Name: customers; Type: ROW SECURITY; Schema: public; Owner: postgres
---
-
-ALTER TABLE public.customers ENABLE ROW LEVEL SECURITY;
-
---
--- Name: ingredients; Type: ROW SECURITY; Schema: public; Owner: postgres
---
-
-ALTER TABLE public.ingredients ENABLE ROW LEVEL SECURITY;
-
---
--- Name: payments; Type: ROW SECURITY; Schema: public; Owner: postgres
---
-
-ALTER TABLE public.payments ENABLE ROW LEVEL SECURITY;
-
---
--- Name: recipe_ingredients; Type: ROW SECURITY; Schema: public; Owner: postgres
---
-
-ALTER TABLE public.recipe_ingredients ENABLE ROW LEVEL SECURITY;
-    ADD CONSTRAINT fk_recipe_ingredients_recipe FOREIGN KEY (recipe_id) REFERENCES public.recipes(id),
-    ADD CONSTRAINT fk_recipe_ingredients_ingredient FOREIGN KEY (ingredient_id) REFERENCES public.ingredients(ingredient_id);
-
---
--- Name: recipe_supplies; Type: ROW SECURITY; Schema: public; Owner: postgres
---
-
-ALTER TABLE public.recipe_supplies ENABLE ROW LEVEL SECURITY;
-    ADD CONSTRAINT fk_recipe_supplies_recipe FOREIGN KEY (recipe_id) REFERENCES public.recipes(id),
-    ADD CONSTRAINT fk_recipe_supplies_supply FOREIGN KEY (supply_id) REFERENCES public.supplies(supply_id);
---
--- Name: recipes; Type: ROW SECURITY; Schema: public; Owner: postgres
---
-
-ALTER TABLE public.recipes ENABLE ROW LEVEL SECURITY;
-
---
--- Name: reviews; Type: ROW SECURITY; Schema: public; Owner: postgres
---
-
-ALTER TABLE public.reviews ENABLE ROW LEVEL SECURITY;
-
---
--- Name: supplies; Type: ROW SECURITY; Schema: public; Owner: postgres
---
+-- the ids above were given explicitly, move the identity sequences past them
+SELECT setval(pg_get_serial_sequence('customers', 'customer_id'), 1);
+SELECT setval(pg_get_serial_sequence('recipes', 'id'), 1);
+SELECT setval(pg_get_serial_sequence('reviews', 'review_id'), 1);
 
-ALTER TABLE public.supplies ENABLE ROW LEVEL SECURITY;
+-- the review was inserted behind the review endpoints' back, rebuild the
+-- aggregates afterwards with `python -m src.review_stats`
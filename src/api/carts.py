@@ -1,4 +1,7 @@
 from fastapi import APIRouter, HTTPException, status
+from pydantic import BaseModel
+from typing import List
+from src import cart_totals
 from src import database as db
 import sqlalchemy
 import re
@@ -8,111 +11,168 @@ router = APIRouter(
     tags=["cart"],
 )
 
+class CartItem(BaseModel):
+    item_id: int
+    quantity: int
+
+class CartItemResult(BaseModel):
+    item_id: int
+    quantity: int
+    status: str
+
+BULK_ITEMS_LIMIT = 100
+
 @router.post("/create/")
-def create_cart(customer_id: int):
+@db.transactional
+def create_cart(connection, customer_id: int):
     """ create cart """
-    
-    with db.engine.begin() as connection:
-      response = connection.execute(sqlalchemy.text(
-         """
-         SELECT customer_id
-         FROM customers
-         WHERE customer_id = :customer_id
-         """), {"customer_id": customer_id}).one_or_none()
-      
-      if response is None:
-         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid customer id')
-        
-      cart_id = connection.execute(sqlalchemy.text(
-         """
-        INSERT INTO carts(customer_id)
-        VALUES (:customer_id)
-        RETURNING cart_id
-        """), [{"customer_id": customer_id}]).scalar_one()
+
+    response = connection.execute(sqlalchemy.text(
+       """
+       SELECT customer_id
+       FROM customers
+       WHERE customer_id = :customer_id
+       """), {"customer_id": customer_id}).one_or_none()
+
+    if response is None:
+       raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid customer id')
+
+    cart_id = connection.execute(sqlalchemy.text(
+       """
+      INSERT INTO carts(customer_id)
+      VALUES (:customer_id)
+      RETURNING cart_id
+      """), [{"customer_id": customer_id}]).scalar_one()
 
     return {"cart_id":cart_id}
 
 @router.post("/{cart_id}/items/{item_id}")
-def set_item_quantity(cart_id: int, item_id: int, quantity: int):
-   """ add items to cart """
+@db.transactional
+def set_item_quantity(connection, cart_id: int, item_id: int, quantity: int):
+   """ set how many of an item are in a cart, 0 removes it """
 
-   if quantity <= 0:
+   if quantity < 0:
       raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid quantity')
 
-   with db.engine.begin() as connection:
-      response = connection.execute(sqlalchemy.text(
-            """
-            SELECT 
-            (SELECT ingredient_id FROM ingredients WHERE ingredient_id = :ingredient_id) AS item,
-            (SELECT cart_id FROM carts WHERE cart_id = :cart_id) AS cart
-            """
-        ), [{"ingredient_id": item_id, "cart_id": cart_id}]).one_or_none()
-      
-      if response.item is None:
-         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Ingredient not found')
-
-      if response.cart is None:
-         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Cart not found')
-
-      connection.execute(sqlalchemy.text(
-        """
-        INSERT INTO cart_items (cart_id, item_id, quantity)
-        VALUES (:cart_id, :item_id, :quantity)
-        """),[{"cart_id": cart_id, "item_id": item_id, "quantity": quantity}])
+   # the cart row stays locked until commit, so changes to one cart apply their totals in turn
+   response = connection.execute(sqlalchemy.text(
+         """
+         SELECT
+         (SELECT ingredient_id FROM ingredients WHERE ingredient_id = :ingredient_id) AS item,
+         (SELECT price FROM ingredients WHERE ingredient_id = :ingredient_id) AS price,
+         (SELECT cart_id FROM carts WHERE cart_id = :cart_id FOR UPDATE) AS cart
+         """
+     ), [{"ingredient_id": item_id, "cart_id": cart_id}]).one_or_none()
+
+   if response.item is None:
+      raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Ingredient not found')
+
+   if response.cart is None:
+      raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Cart not found')
+
+   cart_totals.set_quantity(connection, cart_id, item_id, quantity, response.price)
 
    return {"Success": True}
 
 
+@router.post("/{cart_id}/items", response_model=List[CartItemResult])
+@db.transactional
+def set_item_quantities(connection, cart_id: int, items: List[CartItem]):
+   """
+   set the quantity of several items at once, 0 removes an item. Items that do
+   not exist or have a negative quantity are skipped, the status of each item
+   says what happened to it.
+   """
+
+   if not items or len(items) > BULK_ITEMS_LIMIT:
+      raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f'Send between 1 and {BULK_ITEMS_LIMIT} items')
+
+   if len({item.item_id for item in items}) != len(items):
+      raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Duplicate item id')
+
+   # one query for the cart, locked like in set_item_quantity, and every ingredient's price
+   found = connection.execute(sqlalchemy.text(
+         """
+         SELECT
+         requested.item_id,
+         ingredients.ingredient_id AS item,
+         ingredients.price,
+         (SELECT cart_id FROM carts WHERE cart_id = :cart_id FOR UPDATE) AS cart
+         FROM unnest(CAST(:item_ids AS bigint[])) AS requested(item_id)
+         LEFT JOIN ingredients ON ingredients.ingredient_id = requested.item_id
+         """
+     ), [{"item_ids": [item.item_id for item in items], "cart_id": cart_id}]).all()
+
+   if found[0].cart is None:
+      raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Cart not found')
+
+   prices = {row.item_id: row.price for row in found if row.item is not None}
+
+   results = []
+   changes = []
+   for item in items:
+      if item.item_id not in prices:
+         item_status = "not_found"
+      elif item.quantity < 0:
+         item_status = "invalid_quantity"
+      else:
+         item_status = "removed" if item.quantity == 0 else "set"
+         changes.append((item.item_id, item.quantity, prices[item.item_id]))
+      results.append(CartItemResult(item_id=item.item_id, quantity=item.quantity, status=item_status))
+
+   cart_totals.set_quantities(connection, cart_id, changes)
+
+   return results
+
+
 @router.post("/{cart_id}/checkout")
-def checkout(cart_id: int, card_num: int, exp_date: str, customer_id: int, cvv: int):
+@db.transactional
+def checkout(connection, cart_id: int, card_num: int, exp_date: str, customer_id: int, cvv: int):
    """purchase items. exp_date must be of the form MM/YY """
 
    # MM/YY regex to compare against exp_date
    regex = r"^(0[1-9]|1[0-2])\/([0-9]{2})$"
-    
+
    # Check if expiration date matches the regex
    if not re.match(regex, exp_date):
       raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid expiration date')
-   
-   with db.engine.begin() as connection:
-      response = connection.execute(sqlalchemy.text(
-            """
-            SELECT 
-            (SELECT customer_id FROM customers WHERE customer_id = :customer_id) AS customer,
-            (SELECT cart_id FROM carts WHERE cart_id = :cart_id) AS cart
-            """
-        ), [{"customer_id": customer_id, "cart_id": cart_id}]).one_or_none()
-      
-      if response.customer is None:
-         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid customer id')
-      
-      if response.cart is None:
-         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Cart not found')
-
-      connection.execute(sqlalchemy.text(
+
+   response = connection.execute(sqlalchemy.text(
          """
-         INSERT INTO payments (card_num, exp_date, cvv, customer_id)
-         VALUES (:card_num, :exp_date, :cvv, :customer_id)
-         """), [{"card_num": card_num,
-                  "exp_date": exp_date,
-                  "cvv": cvv,
-                  "customer_id": customer_id}])
-      
-      cart_checkout = connection.execute(sqlalchemy.text(
-           """
-        SELECT cart_items.cart_id,
-        SUM(cart_items.quantity) AS total_ingredients_purchased,
-        SUM(cart_items.quantity*ingredients.price) AS total_amount_paid
-        FROM cart_items
-        JOIN ingredients ON ingredients.ingredient_id = cart_items.item_id
-        WHERE cart_items.cart_id = :cart_id
-        GROUP BY cart_items.cart_id
-            """), [{"cart_id": cart_id}]).one()
-      
-      total_ingredients_purchased = cart_checkout.total_ingredients_purchased
-      total_amount_paid = cart_checkout.total_amount_paid
+         SELECT
+         (SELECT customer_id FROM customers WHERE customer_id = :customer_id) AS customer,
+         (SELECT cart_id FROM carts WHERE cart_id = :cart_id) AS cart
+         """
+     ), [{"customer_id": customer_id, "cart_id": cart_id}]).one_or_none()
+
+   if response.customer is None:
+      raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid customer id')
+
+   if response.cart is None:
+      raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Cart not found')
+
+   # running totals kept by set_item_quantity, locked so the cart cannot change under the payment
+   totals = connection.execute(sqlalchemy.text(
+      """
+      SELECT item_count, total_amount
+      FROM carts
+      WHERE cart_id = :cart_id
+      FOR UPDATE
+      """), [{"cart_id": cart_id}]).one()
+
+   if totals.item_count == 0:
+      raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Cart is empty')
+
+   connection.execute(sqlalchemy.text(
+      """
+      INSERT INTO payments (card_num, exp_date, cvv, customer_id)
+      VALUES (:card_num, :exp_date, :cvv, :customer_id)
+      """), [{"card_num": card_num,
+               "exp_date": exp_date,
+               "cvv": cvv,
+               "customer_id": customer_id}])
 
    return {
-            "total_ingredients_purchased": total_ingredients_purchased,
-            "total_amount_paid": total_amount_paid
-   }
\ No newline at end of file
+            "total_ingredients_purchased": totals.item_count,
+            "total_amount_paid": totals.total_amount
+   }
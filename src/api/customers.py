@@ -8,19 +8,19 @@ router = APIRouter(
 )
 
 @router.post("/register")
-def register_customer(customer_name: str):
+@db.transactional
+def register_customer(connection, customer_name: str):
     """
     Register a customer - allows customers to create an id for themselves
     """
 
-    with db.engine.begin() as connection:
-        customer_id = connection.execute(sqlalchemy.text(
-            """
-            INSERT INTO customers (customer_name)
-            VALUES (:customer_name)
-            RETURNING customer_id
-            """
-        ), [{"customer_name": customer_name}]).scalar_one()
+    customer_id = connection.execute(sqlalchemy.text(
+        """
+        INSERT INTO customers (customer_name)
+        VALUES (:customer_name)
+        RETURNING customer_id
+        """
+    ), [{"customer_name": customer_name}]).scalar_one()
 
     return {
         "customer_id": customer_id
@@ -0,0 +1,39 @@
+from fastapi import APIRouter, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from typing import AsyncIterator, Dict, Any, Iterator
+import anyio
+from src import recipe_import
+
+router = APIRouter(
+    prefix="/recipes",
+    tags=["recipes"]
+)
+
+def _lines(chunks: AsyncIterator[bytes]) -> Iterator[bytes]:
+    """
+    The lines of a request body as the client sends it. Runs in the import's
+    worker thread, each chunk is awaited on the event loop when the import
+    is ready for more. Lines are decoded one by one when they are parsed, so
+    a line that is not UTF-8 is reported like any other invalid line.
+    """
+
+    pending = b""
+    while True:
+        try:
+            chunk = anyio.from_thread.run(chunks.__anext__)
+        except StopAsyncIteration:
+            break
+        # a newline byte never occurs inside a multi-byte UTF-8 character
+        *lines, pending = (pending + chunk).split(b"\n")
+        yield from lines
+    if pending:
+        yield pending
+
+@router.post("/import", response_model=Dict[str, Any], status_code=200)
+async def import_recipes(request: Request, chunk_size: int = Query(recipe_import.CHUNK_SIZE, gt=0)):
+    """
+    Bulk import recipes. The body is JSONL, one create recipe document per line.
+    Returns the number imported, per-line errors and recipes per second.
+    """
+
+    return await run_in_threadpool(recipe_import.import_recipes, _lines(request.stream().__aiter__()), chunk_size)
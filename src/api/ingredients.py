@@ -1,7 +1,9 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Response
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 from src import database as db
+from src import ingredient_index
+from src import pagination
 import sqlalchemy
 
 router = APIRouter(
@@ -9,29 +11,89 @@ router = APIRouter(
     tags=["ingredients"]
 )
 
+AUTOCOMPLETE_LIMIT = 50
+
 @router.get("/")
-def get_ingredient_by_name(name: str):
-    with db.engine.begin() as connection:
-        # gets all matching ingreidents by name
-        ingredients = connection.execute(sqlalchemy.text(
-            """
-            SELECT ingredient_id as id, ingredient_name as name, price
-            FROM ingredients
-            WHERE ingredient_name like :name
-            """
-        ), {"name": name}).all()
-        
-        if not ingredients:
-            raise HTTPException(status_code=204, detail="Ingredient not found")
-
-        response = [
-            {
-                "name": row.name,
-                "id": row.id,
-                "price": row.price
-            }
-            for row in ingredients
-        ]
-
-        return response
+@db.transactional(read_only=True)
+def get_ingredient_by_name(
+    connection,
+    name: str,
+    response: Response,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    stream: bool = False
+):
+    """
+    Ingredients whose name is like the given pattern, in id order. Pass limit
+    to page through them (see the Next-Cursor header), or stream=true for NDJSON.
+    """
+
+    pagination.check_limit(limit)
+    after = pagination.decode_cursor(cursor, 1)
+
+    query = """
+        SELECT ingredient_id as id, ingredient_name as name, price
+        FROM ingredients
+        WHERE ingredient_name like :name
+        AND (CAST(:after AS bigint) IS NULL OR ingredient_id > :after)
+        ORDER BY ingredient_id
+        LIMIT :limit
+        """
+    params = {
+        "name": name,
+        "after": after[0] if after else None,
+        "limit": limit + 1 if limit else None
+    }
+
+    if stream:
+        params["limit"] = limit
+        return pagination.stream_rows(query, params, lambda row: {
+            "name": row["name"],
+            "id": row["id"],
+            "price": row["price"]
+        })
+
+    # gets all matching ingreidents by name
+    ingredients = connection.execute(sqlalchemy.text(query), params).all()
+
+    if not ingredients:
+        raise HTTPException(status_code=204, detail="Ingredient not found")
+
+    ingredients = pagination.page(ingredients, limit, response, lambda row: [row.id])
+
+    return [
+        {
+            "name": row.name,
+            "id": row.id,
+            "price": row.price
+        }
+        for row in ingredients
+    ]
+
+
+
+@router.get("/autocomplete")
+def autocomplete_ingredients(q: str, limit: int = 10, fuzzy: bool = False):
+    """
+    Ingredient names for a search box: the ones starting with q, in
+    alphabetical order, then with fuzzy=true the closest misspellings.
+    Answered from the in-memory ingredient index, the database is only read
+    if the index has not been loaded yet.
+    """
+
+    if not 1 <= limit <= AUTOCOMPLETE_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {AUTOCOMPLETE_LIMIT}")
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="q cannot be empty.")
+
+    if not ingredient_index.index.loaded:
+        with db.engine.begin() as connection:
+            ingredient_index.index.ensure_loaded(connection)
 
+    return [
+        {
+            "name": name,
+            "id": ingredient_id
+        }
+        for ingredient_id, name in ingredient_index.index.complete(q, limit, fuzzy)
+    ]
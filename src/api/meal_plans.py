@@ -0,0 +1,115 @@
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import BaseModel
+from typing import List, Optional
+from src import database as db
+from src import ingredient_index
+from src import meal_plan
+from src import pantry
+import sqlalchemy
+
+router = APIRouter(
+    prefix="/meal-plans",
+    tags=["meal plans"]
+)
+
+class PlannedRecipe(BaseModel):
+    id: int
+    name: str
+    missing_ingredients: List[str]
+
+class ShoppingItem(BaseModel):
+    id: int
+    name: str
+    price: Optional[float]
+    item_type: Optional[str]
+    meals: int
+
+class MealPlan(BaseModel):
+    recipes: List[PlannedRecipe]
+    shopping_list: List[ShoppingItem]
+    total_cost: float
+    reused_ingredients: int
+    complete: bool
+
+
+@router.get("/", response_model=MealPlan, status_code=200)
+@db.transactional(read_only=True, cpu_bound=True)
+def get_meal_plan(
+    connection,
+    ingredients: Optional[List[str]] = Query([]),
+    supplies: Optional[List[str]] = Query(None),
+    difficulty: Optional[str] = None,
+    meals: int = 7
+):
+    """
+    Pick meals recipes that are cheap to complete together given the
+    ingredients you have: what they still need is bought once, so recipes
+    sharing ingredients are preferred. With supplies only recipes needing
+    nothing else are planned.
+    """
+
+    if not 1 <= meals <= meal_plan.MAX_MEALS:
+        raise HTTPException(status_code=400, detail=f"meals must be between 1 and {meal_plan.MAX_MEALS}")
+
+    # Normalize input
+    if difficulty:
+        difficulty = difficulty.strip().lower()
+
+    ingredient_index.index.ensure_loaded(connection)
+    ingredient_index.index.ensure_prices(connection)
+    pantry.matcher.ensure_loaded(connection)
+
+    plan = meal_plan.plan(ingredients, meals, difficulty=difficulty or None, supplies=supplies or None)
+
+    if not plan.recipe_ids:
+        raise HTTPException(status_code = 204, detail = "No recipes found.")
+
+    names = dict(connection.execute(sqlalchemy.text(
+        """
+        SELECT id, name
+        FROM recipes
+        WHERE id = ANY(:recipe_ids)
+        """
+    ), {"recipe_ids": plan.recipe_ids}).all())
+
+    # the index sees this process's writes at once, a lagging replica may not
+    # have their rows yet, like the recipes those are left out
+    to_buy = {
+        row.ingredient_id: row
+        for row in connection.execute(sqlalchemy.text(
+            """
+            SELECT ingredient_id, ingredient_name, price, item_type
+            FROM ingredients
+            WHERE ingredient_id = ANY(:ingredient_ids)
+            """
+        ), {"ingredient_ids": plan.to_buy})
+    }
+
+    return MealPlan(
+        recipes=[
+            PlannedRecipe(
+                id=recipe_id,
+                name=names[recipe_id],
+                missing_ingredients=sorted(
+                    to_buy[ingredient_id].ingredient_name
+                    for ingredient_id in plan.missing[recipe_id]
+                    if ingredient_id in to_buy
+                )
+            )
+            for recipe_id in plan.recipe_ids
+            if recipe_id in names
+        ],
+        shopping_list=[
+            ShoppingItem(
+                id=ingredient_id,
+                name=row.ingredient_name,
+                price=row.price,
+                item_type=row.item_type,
+                meals=plan.needed[ingredient_id]
+            )
+            for ingredient_id, row in sorted(to_buy.items(), key=lambda item: item[1].ingredient_name)
+        ],
+        total_cost=plan.cost,
+        reused_ingredients=plan.reused,
+        complete=plan.complete
+    )
@@ -1,7 +1,13 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Response
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import Iterator, List, Optional, Dict, Any
 from src import database as db
+from src import ingredient_index
+from src import name_cache
+from src import pagination
+from src import pantry
+from src import recipe_cache
+from src import search_index
 import sqlalchemy
 
 router = APIRouter(
@@ -37,210 +43,175 @@ class Recipe(BaseModel):
 
 class RecipeResponse(Recipe):
     id: int
+    coverage: Optional[float]
 
 class SuggestedRecipe(BaseModel):
     id: int
     name: str
     missing_ingredients: List[Ingredient]
 
+class RecipeBatch(BaseModel):
+    recipes: List[Recipe]
+    missing: List[int]
+
+class SearchResult(Recipe):
+    score: float
+
+BATCH_LIMIT = 100
+SEARCH_LIMIT = 10
+
 
 # 1.1 get recipes 
 @router.get("/", response_model=List[RecipeResponse], status_code=200)
+@db.transactional(read_only=True, cpu_bound=True)
 def get_recipes(
+    connection,
+    response: Response,
     ingredients: Optional[List[str]] = Query(None), 
     difficulty: Optional[str] = None, 
-    supplies: Optional[List[str]] = Query(None)
+    supplies: Optional[List[str]] = Query(None),
+    all_supplies: bool = False,
+    sort: str = "id",
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    stream: bool = False
 ):
+    """
+    Recipes using any of the given ingredients and supplies. With all_supplies
+    only recipes whose every supply is in the list are returned. sort can be
+    "id" or "coverage" (share of the recipe's ingredients you already have).
+    Pass limit to page through them (see the Next-Cursor header), or
+    stream=true for NDJSON in id order.
+    """
+
+    if sort not in ("id", "coverage"):
+        raise HTTPException(status_code=400, detail="sort must be one of: id, coverage")
+    if stream and sort != "id":
+        raise HTTPException(status_code=400, detail="stream only supports sort=id")
+    pagination.check_limit(limit)
+    after = pagination.decode_cursor(cursor, 2)
 
     # Normalize input
     if difficulty:
         difficulty = difficulty.strip().lower()
-    if ingredients:
-        ingredients = [ingredient.strip().lower() for ingredient in ingredients]
-    if supplies:
-        supplies = [supply.strip().lower() for supply in supplies]
 
-    # Prepare dynamic parameters
-    params = {
-        "difficulty": difficulty or None,
-        "ingredients": ingredients or None,
-        "supplies": supplies or None
-    }
-
-    # SQL query
-    query = """
-        WITH 
-        FilteredRecipes AS (
-            SELECT r.id
-            FROM recipes AS r
-            WHERE (:difficulty IS NULL OR r.difficulty = :difficulty)
-        ),
-        FilteredIngredients AS (
-            SELECT ri.recipe_id
-            FROM recipe_ingredients AS ri
-            JOIN ingredients AS i ON i.ingredient_id = ri.ingredient_id
-            WHERE (:ingredients IS NULL OR i.ingredient_name = ANY(:ingredients))
-            GROUP BY ri.recipe_id
-        ),
-        FilteredSupplies AS (
-            SELECT rs.recipe_id
-            FROM recipe_supplies AS rs
-            JOIN supplies AS s ON rs.supply_id = s.supply_id
-            WHERE (:supplies IS NULL OR s.supply_name = ANY(:supplies))
-            GROUP BY rs.recipe_id
+    # filter the whole catalog with the in-memory bitsets
+    pantry.matcher.ensure_loaded(connection)
+    matches = pantry.matcher.match(
+        ingredients=ingredients or None,
+        difficulty=difficulty or None,
+        supplies=supplies or None,
+        all_supplies=all_supplies
+    )
+
+    # matches are (recipe_id, coverage) pairs, cursors hold the last one returned
+    if sort == "coverage":
+        sort_key = lambda match: (-(match[1] or 0), match[0])
+        matches.sort(key=sort_key)
+    else:
+        sort_key = lambda match: match[0]
+
+    if after:
+        last = sort_key(tuple(after))
+        matches = [match for match in matches if sort_key(match) > last]
+    if limit:
+        matches = pagination.page(matches[:limit + 1], limit, response, list)
+
+    if not matches:
+        raise HTTPException(status_code = 204, detail = "No recipes found.")
+
+    # only fetch the details of the matched recipes
+    coverages = dict(matches)
+
+    if stream:
+        return pagination.ndjson(
+            RecipeResponse(**recipe.dict(), coverage=coverages[recipe.id])
+            for recipe in stream_recipes([recipe_id for recipe_id, _ in matches])
         )
-        SELECT DISTINCT
-            r.id, 
-            r.name, 
-            r.instructions, 
-            r.time, 
-            r.difficulty,
-            i.ingredient_name, 
-            ri.amount_units, 
-            i.price, 
-            i.item_type,
-            s.supply_name
-        FROM recipes AS r
-        LEFT JOIN recipe_ingredients AS ri ON r.id = ri.recipe_id
-        LEFT JOIN ingredients AS i ON i.ingredient_id = ri.ingredient_id
-        LEFT JOIN recipe_supplies AS rs ON r.id = rs.recipe_id
-        LEFT JOIN supplies AS s ON rs.supply_id = s.supply_id
-        WHERE 
-            r.id IN (SELECT id FROM FilteredRecipes)
-            AND (:ingredients IS NULL OR r.id IN (SELECT recipe_id FROM FilteredIngredients))
-            AND (:supplies IS NULL OR r.id IN (SELECT recipe_id FROM FilteredSupplies))
-        ORDER BY r.id
-    """
 
-    with db.engine.begin() as connection:
-        result = connection.execute(sqlalchemy.text(query), params).mappings().all()
-        response = map_to_recipes(result)
-        
-        if not response:
-            raise HTTPException(status_code = 204, detail = "No recipes found.")
+    recipes = load_recipes(connection, [recipe_id for recipe_id, _ in matches])
 
-    return response
+    recipes_response = [
+        RecipeResponse(**recipes[recipe_id].dict(), coverage=coverage)
+        for recipe_id, coverage in matches
+        if recipe_id in recipes
+    ]
 
+    if not recipes_response:
+        raise HTTPException(status_code = 204, detail = "No recipes found.")
 
+    return recipes_response
 
-# 1.2 create recipe
-@router.post("/", response_model=Dict[str, Any], status_code=201)
-def create_recipe(recipe: CreateRecipe):
 
-    # start of added input validation for recipe 
-    if recipe.time <= 0:
-        raise HTTPException(status_code=400, detail="Time must be a positive integer.")
-    if not recipe.name.strip():
-        raise HTTPException(status_code=400, detail="Recipe name cannot be empty.")
 
-    # input validation for ingredient 
-    ingredient_names = set()
-    for ingredient in recipe.ingredients:
-        if not ingredient.name.strip():
-            raise HTTPException(status_code=400, detail="Ingredient name cannot be empty.")
-        if ingredient.amount_units is not None and not ingredient.amount_units.strip():
-            raise HTTPException(status_code=400, detail=f"Ingredient {ingredient.name}: amount units cannot be empty.")
-        if ingredient.name.lower() in ingredient_names:
-            raise HTTPException(status_code=400, detail=f"Duplicate ingredient: {ingredient.name}")
-        ingredient_names.add(ingredient.name.lower().strip())
+# 1.2 create recipe
+@router.post("/", response_model=Dict[str, Any], status_code=201)
+@db.transactional
+def create_recipe(connection, recipe: CreateRecipe):
+
+    validate_recipe(recipe)
+
+    # insert the recipe the person wants to create into the recipes table
+    recipe_result = connection.execute(sqlalchemy.text(
+        """
+        INSERT INTO recipes (name, instructions, time, difficulty)
+        VALUES (:name, :instructions, :time, :difficulty)
+        RETURNING id
+        """
+    ), {
+        "name": recipe.name.strip(),
+        "instructions": recipe.instructions,
+        "time": recipe.time,
+        "difficulty": recipe.difficulty.strip()
+    })
+    recipe_id = recipe_result.scalar_one()
+
+    # resolve every ingredient and supply in one go, inserting the new ones
+    ingredient_ids = resolve_ingredients(connection, recipe.ingredients)
+    supply_ids = resolve_supplies(connection, [supply.supply_name for supply in recipe.supplies])
+    recipe_ingredient_names = {
+        ingredient_ids[normalize_name(ingredient.name)]: ingredient.name
+        for ingredient in recipe.ingredients
+    }
 
-    #input validation for supplies 
-    supply_names = set()
-    for supply in recipe.supplies:
-        if not supply.supply_name.strip():
-            raise HTTPException(status_code=400, detail="Supply name cannot be empty.")
-        if supply.supply_name.lower() in supply_names:
-            raise HTTPException(status_code=400, detail=f"Duplicate supply: {supply.supply_name}")
-        supply_names.add(supply.supply_name.lower().strip())
+    # link them to the recipe with one multi-row insert each
+    if recipe.ingredients:
+        connection.execute(sqlalchemy.text(
+            """
+            INSERT INTO recipe_ingredients (recipe_id, ingredient_id, amount_units)
+            SELECT :recipe_id, link.ingredient_id, link.amount_units
+            FROM unnest(CAST(:ingredient_ids AS bigint[]), CAST(:amount_units AS text[]))
+                AS link(ingredient_id, amount_units)
+            """
+        ), {
+            "recipe_id": recipe_id,
+            "ingredient_ids": [ingredient_ids[normalize_name(ingredient.name)] for ingredient in recipe.ingredients],
+            "amount_units": [ingredient.amount_units for ingredient in recipe.ingredients]
+        })
 
-    with db.engine.begin() as connection:
-        # insert the recipe the person wants to create into the recipes table
-        recipe_result = connection.execute(sqlalchemy.text(
+    if supply_ids:
+        connection.execute(sqlalchemy.text(
             """
-            INSERT INTO recipes (name, instructions, time, difficulty)
-            VALUES (:name, :instructions, :time, :difficulty)
-            RETURNING id
+            INSERT INTO recipe_supplies (recipe_id, supply_id)
+            SELECT :recipe_id, supply_id
+            FROM unnest(CAST(:supply_ids AS bigint[])) AS supply_id
             """
         ), {
-            "name": recipe.name.strip(),
-            "instructions": recipe.instructions,
-            "time": recipe.time,
-            "difficulty": recipe.difficulty.strip()
+            "recipe_id": recipe_id,
+            "supply_ids": list(supply_ids.values())
         })
-        recipe_id = recipe_result.scalar_one()
-
-        # insert each ingredient for the recipe
-        for ingredient in recipe.ingredients:
-            # check if the ingredient already exists (case insensitive)
-            existing_ingredient_result = connection.execute(sqlalchemy.text(
-                """
-                SELECT ingredient_id FROM ingredients WHERE LOWER(ingredient_name) = LOWER(:ingredient_name)
-                """
-            ), {"ingredient_name": ingredient.name})
-            existing_ingredient_id = existing_ingredient_result.scalar()
-
-            # if the ingredient does not exist, insert it
-            if existing_ingredient_id is None:
-                ingredient_insert_result = connection.execute(sqlalchemy.text(
-                    """
-                    INSERT INTO ingredients (ingredient_name, price, item_type)
-                    VALUES (LOWER(:ingredient_name), :price, :item_type)
-                    RETURNING ingredient_id
-                    """
-                ), {
-                    "ingredient_name": ingredient.name,
-                    "price": ingredient.price,
-                    "item_type": ingredient.item_type
-                })
-                ingredient_id = ingredient_insert_result.scalar_one()
-            else:
-                ingredient_id = existing_ingredient_id
-
-            # insert into recipe_ingredients with the retrieved or new ingredient_id
-            connection.execute(sqlalchemy.text(
-                """
-                INSERT INTO recipe_ingredients (recipe_id, ingredient_id, amount_units)
-                VALUES (:recipe_id, :ingredient_id, :amount_units)
-                """
-            ), {
-                "recipe_id": recipe_id,
-                "ingredient_id": ingredient_id,
-                "amount_units": ingredient.amount_units
-            })
-
-        # insert each supply for the recipe
-        for supply in recipe.supplies:
-            # check if the supply already exists (case insensitive)
-            existing_supply_result = connection.execute(sqlalchemy.text(
-                """
-                SELECT supply_id FROM supplies WHERE LOWER(supply_name) = LOWER(:supply_name)
-                """
-            ), {"supply_name": supply.supply_name})
-            existing_supply_id = existing_supply_result.scalar()
-
-            # if the supply does not exist, insert it
-            if existing_supply_id is None:
-                supply_insert_result = connection.execute(sqlalchemy.text(
-                    """
-                    INSERT INTO supplies (supply_name)
-                    VALUES (LOWER(:supply_name))
-                    RETURNING supply_id
-                    """
-                ), {"supply_name": supply.supply_name})
-                supply_id = supply_insert_result.scalar_one()
-            else:
-                supply_id = existing_supply_id
-
-            # insert into recipe_supplies with the retrieved or new supply_id
-            connection.execute(sqlalchemy.text(
-                """
-                INSERT INTO recipe_supplies (recipe_id, supply_id)
-                VALUES (:recipe_id, :supply_id)
-                """
-            ), {
-                "recipe_id": recipe_id,
-                "supply_id": supply_id
-            })
+
+    # only index the recipe once the transaction has committed
+    db.after_commit(connection, ingredient_index.index.set_recipe, recipe_id, recipe_ingredient_names)
+    db.after_commit(connection, search_index.index.set_recipe, recipe_id, recipe.name.strip(), recipe.instructions)
+    db.after_commit(
+        connection,
+        pantry.matcher.set_recipe,
+        recipe_id,
+        recipe.difficulty.strip(),
+        [ingredient.name for ingredient in recipe.ingredients],
+        [supply.supply_name for supply in recipe.supplies]
+    )
 
     return {
         "recipe_created": "Recipe created successfully",
@@ -250,352 +221,629 @@ def create_recipe(recipe: CreateRecipe):
 
 # 1.6 recipe suggestions
 @router.get("/suggestions", response_model=List[SuggestedRecipe], status_code=200)
-def get_recipe_suggestions(ingredients: Optional[List[str]] = Query([])):
-    """ get recipe suggestions """
+@db.transactional(read_only=True, cpu_bound=True)
+def get_recipe_suggestions(
+    connection,
+    ingredients: Optional[List[str]] = Query([]),
+    sort: str = "id",
+    limit: Optional[int] = None,
+    max_missing: Optional[int] = None
+):
+    """
+    Recipes using some of the given ingredients that still need more. sort can
+    be "id", "missing" (fewest missing ingredients), "cost" (cheapest missing
+    ingredients) or "coverage" (largest share already owned). limit keeps the
+    best ones, max_missing drops recipes needing more than that many.
+    """
+
+    if sort not in ingredient_index.SUGGESTION_SORTS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of: {', '.join(ingredient_index.SUGGESTION_SORTS)}")
+    pagination.check_limit(limit)
+    if max_missing is not None and max_missing < 1:
+        raise HTTPException(status_code=400, detail="max_missing must be at least 1")
 
     # create normalized_ingredients so we dont worry about case or spacing
     normalized_ingredients = {ingredient.strip().lower() for ingredient in ingredients}
     suggestions = []
 
-    with db.engine.begin() as connection:
-        # get all recipes that contain at least one of the ingredients provided by the user
-        recipes_result = connection.execute(sqlalchemy.text(
-            """
-            SELECT r.id AS recipe_id, r.name AS recipe_name, i.ingredient_name AS ingredient_name, 
-                ri.amount_units, i.price, i.item_type
-            FROM recipes AS r
-            INNER JOIN recipe_ingredients AS ri ON r.id = ri.recipe_id
-            INNER JOIN ingredients AS i ON i.ingredient_id = ri.ingredient_id
-            WHERE EXISTS (
-                SELECT 1
-                FROM unnest(:ingredients) AS ingredient_pattern
-                WHERE LOWER(i.ingredient_name) LIKE '%' || ingredient_pattern || '%'
-            )
-            OR r.id IN (
-                SELECT DISTINCT recipe_id
-                FROM recipe_ingredients ri
-                INNER JOIN ingredients i ON ri.ingredient_id = i.ingredient_id
-                WHERE EXISTS (
-                    SELECT 1
-                    FROM unnest(:ingredients) AS ingredient_pattern
-                    WHERE LOWER(i.ingredient_name) LIKE '%' || ingredient_pattern || '%'
-                )
-            )
-            """
-        ), {"ingredients": list(normalized_ingredients)})
-        
-        # get all rows returned by the query
-        recipes_data = recipes_result.mappings().all()
-
-        # organize recipes and their ingredients by recipe_id
-        recipe_dict = {}
-        for row in recipes_data:
-            recipe_id = row["recipe_id"]
-
-            # if the recipe does not exist in the dictionary add it
-            if recipe_id not in recipe_dict:
-                recipe_dict[recipe_id] = {
-                    "id": recipe_id,
-                    "name": row["recipe_name"],
-                    "ingredients": []
-                }
-
-            # create the ingredient dictionary and append it to the recipes ingredient list
-            ingredient_info = Ingredient(
-                name=row["ingredient_name"],
-                amount_units=row["amount_units"],
-                price=row["price"],
-                item_type=row["item_type"]
+    ingredient_index.index.ensure_loaded(connection)
+
+    # ingredients created since the index was loaded need their price for the ranking
+    ingredient_index.index.ensure_prices(connection)
+
+    # find and rank recipes that contain at least one of the ingredients provided
+    # by the user and still miss something, using the in-memory index
+    ranked = ingredient_index.index.suggest(normalized_ingredients, sort, limit, max_missing)
+    if not ranked:
+        return suggestions
+
+    # only fetch the missing ingredient rows for the recipes returned
+    recipes_result = connection.execute(sqlalchemy.text(
+        """
+        SELECT r.id AS recipe_id, r.name AS recipe_name, i.ingredient_id, i.ingredient_name AS ingredient_name,
+            ri.amount_units, i.price, i.item_type
+        FROM recipes AS r
+        INNER JOIN recipe_ingredients AS ri ON r.id = ri.recipe_id
+        INNER JOIN ingredients AS i ON i.ingredient_id = ri.ingredient_id
+        WHERE r.id = ANY(:recipe_ids)
+        AND ri.ingredient_id = ANY(:missing_ids)
+        ORDER BY r.id, ri.ingredient_id
+        """
+    ), {
+        "recipe_ids": [recipe_id for recipe_id, _ in ranked],
+        "missing_ids": list(set().union(*(missing for _, missing in ranked)))
+    })
+
+    # organize recipes and their missing ingredients by recipe_id
+    missing_by_recipe = dict(ranked)
+    recipe_dict = {}
+    for row in recipes_result.mappings():
+        recipe_id = row["recipe_id"]
+
+        # the ids are the union over all recipes, keep this recipe's own
+        if row["ingredient_id"] not in missing_by_recipe[recipe_id]:
+            continue
+
+        # if the recipe does not exist in the dictionary add it
+        if recipe_id not in recipe_dict:
+            recipe_dict[recipe_id] = SuggestedRecipe(
+                id=recipe_id,
+                name=row["recipe_name"],
+                missing_ingredients=[]
             )
-            recipe_dict[recipe_id]["ingredients"].append(ingredient_info)
-
-        # create suggestions by finding missing ingredients for each recipe
-        for recipe in recipe_dict.values():
-            missing_ingredients = []
-            for ingredient in recipe["ingredients"]:
-                # check if the ingredient is not in the user's provided list
-                if ingredient.name.lower() not in normalized_ingredients:
-                    missing_ingredients.append(ingredient)
-
-            # add the recipe to the suggestions list if there are missing ingredients
-            if missing_ingredients:
-                suggested_recipe = SuggestedRecipe(
-                    id=recipe["id"],
-                    name=recipe["name"],
-                    missing_ingredients=missing_ingredients
-                )
-                suggestions.append(suggested_recipe)
+
+        recipe_dict[recipe_id].missing_ingredients.append(Ingredient(
+            name=row["ingredient_name"],
+            amount_units=row["amount_units"],
+            price=row["price"],
+            item_type=row["item_type"]
+        ))
+
+    suggestions = [recipe_dict[recipe_id] for recipe_id, _ in ranked if recipe_id in recipe_dict]
 
     return suggestions
 
 
-# 1.3 get recipe by id
-@router.get("/{id}", response_model=Recipe, status_code=200)
-def get_recipe_by_id(id: int):
+# 1.9 get recipes by ids, declared before /{id} so "batch" is not taken for an id
+@router.get("/batch", response_model=RecipeBatch, status_code=200)
+@db.transactional(read_only=True, cpu_bound=True)
+def get_recipes_batch(connection, ids: List[int] = Query(...)):
+    """
+    Up to BATCH_LIMIT recipes by id, in the order they were asked for. Ids
+    that do not exist are listed in missing.
+    """
 
-    with db.engine.begin() as connection:
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > BATCH_LIMIT:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_LIMIT} ids per request.")
 
-        # gets all matching ingreidents by id 
-        ingredients = connection.execute(sqlalchemy.text(
-            """
-            SELECT i.ingredient_name AS name, ri.amount_units, i.price, i.item_type
-            FROM recipe_ingredients AS ri
-            INNER JOIN ingredients AS i ON i.ingredient_id = ri.ingredient_id
-            WHERE ri.recipe_id = :id
-            """
-        ), {"id": id}).all()
-        
-        final_ingredients = [
-            {
-                "name": row.name,
-                "amount_units": row.amount_units,
-                "price": row.price,
-                "item_type": row.item_type
-            }
-            for row in ingredients
-        ]
-
-        # gets all matching supplies by id 
-        supplies = connection.execute(sqlalchemy.text(
-            """
-            SELECT s.supply_name
-            FROM recipe_supplies AS rs
-            INNER JOIN supplies AS s ON s.supply_id = rs.supply_id
-            WHERE rs.recipe_id = :id
-            """
-        ), {"id": id}).all()
+    recipes = load_recipes(connection, ids)
 
-        final_supplies = [{"supply_name": row.supply_name} for row in supplies]
+    return RecipeBatch(
+        recipes=[recipes[recipe_id] for recipe_id in ids if recipe_id in recipes],
+        missing=[recipe_id for recipe_id in ids if recipe_id not in recipes]
+    )
 
-        # gets all recipes by id 
-        recipe = connection.execute(sqlalchemy.text(
-            """
-            SELECT id, name, instructions, time, difficulty
-            FROM recipes
-            WHERE id = :id
-            """
-        ), {"id": id}).one_or_none()
 
-        # if no recipe exists raise error 
-        if not recipe:
-            raise HTTPException(status_code=404, detail="Recipe not found")
+# 1.10 full-text search, declared before /{id} so "search" is not taken for an id
+@router.get("/search", response_model=List[SearchResult], status_code=200)
+@db.transactional(read_only=True, cpu_bound=True)
+def search_recipes(
+    connection,
+    q: str,
+    difficulty: Optional[str] = None,
+    supplies: Optional[List[str]] = Query(None),
+    all_supplies: bool = False,
+    limit: int = SEARCH_LIMIT
+):
+    """
+    The recipes whose name and instructions best match q, best first, scored
+    with BM25 (words in the name weigh more). difficulty, supplies and
+    all_supplies narrow them down like they do for GET /recipes.
+    """
 
-        return {
-            "id": recipe.id,
-            "name": recipe.name,
-            "instructions": recipe.instructions,
-            "time": recipe.time,
-            "difficulty": recipe.difficulty,
-            "ingredients": final_ingredients,
-            "supplies": final_supplies
+    pagination.check_limit(limit)
+
+    # Normalize input
+    if difficulty:
+        difficulty = difficulty.strip().lower()
+
+    search_index.index.ensure_loaded(connection)
+
+    recipe_ids = None
+    if difficulty or supplies:
+        pantry.matcher.ensure_loaded(connection)
+        recipe_ids = {
+            recipe_id for recipe_id, _ in
+            pantry.matcher.match(difficulty=difficulty or None, supplies=supplies or None, all_supplies=all_supplies)
         }
 
+    ranked = search_index.index.search(q, limit, recipe_ids)
+    if not ranked:
+        raise HTTPException(status_code = 204, detail = "No recipes found.")
+
+    recipes = load_recipes(connection, [recipe_id for recipe_id, _ in ranked])
+
+    return [
+        SearchResult(**recipes[recipe_id].dict(), score=round(score, 4))
+        for recipe_id, score in ranked
+        if recipe_id in recipes
+    ]
+
+
+# 1.3 get recipe by id
+@router.get("/{id}", response_model=Recipe, status_code=200)
+@recipe_cache.cached
+# on the primary: a lagging replica could hand the cache a body from before an invalidation
+@db.transactional
+def get_recipe_by_id(connection, id: int):
+
+    # gets all matching ingreidents by id 
+    ingredients = connection.execute(sqlalchemy.text(
+        """
+        SELECT i.ingredient_name AS name, ri.amount_units, i.price, i.item_type
+        FROM recipe_ingredients AS ri
+        INNER JOIN ingredients AS i ON i.ingredient_id = ri.ingredient_id
+        WHERE ri.recipe_id = :id
+        """
+    ), {"id": id}).all()
+    
+    final_ingredients = [
+        {
+            "name": row.name,
+            "amount_units": row.amount_units,
+            "price": row.price,
+            "item_type": row.item_type
+        }
+        for row in ingredients
+    ]
+
+    # gets all matching supplies by id 
+    supplies = connection.execute(sqlalchemy.text(
+        """
+        SELECT s.supply_name
+        FROM recipe_supplies AS rs
+        INNER JOIN supplies AS s ON s.supply_id = rs.supply_id
+        WHERE rs.recipe_id = :id
+        """
+    ), {"id": id}).all()
+
+    final_supplies = [{"supply_name": row.supply_name} for row in supplies]
+
+    # gets all recipes by id 
+    recipe = connection.execute(sqlalchemy.text(
+        """
+        SELECT id, name, instructions, time, difficulty
+        FROM recipes
+        WHERE id = :id
+        """
+    ), {"id": id}).one_or_none()
+
+    # if no recipe exists raise error 
+    if not recipe:
+        raise HTTPException(status_code=404, detail="Recipe not found")
+
+    return {
+        "id": recipe.id,
+        "name": recipe.name,
+        "instructions": recipe.instructions,
+        "time": recipe.time,
+        "difficulty": recipe.difficulty,
+        "ingredients": final_ingredients,
+        "supplies": final_supplies
+    }
+
 
 # 1.4 update recipe
 @router.put("/{id}", response_model=Dict[str, str], status_code=200)
-def update_recipe(id: int, recipe: Recipe):
+@db.transactional
+def update_recipe(connection, id: int, recipe: Recipe):
+
+    # update main recipe details in the recipes table
+    result = connection.execute(sqlalchemy.text(
+        """
+        UPDATE recipes
+        SET name = :name, instructions = :instructions,
+            time = :time, difficulty = :difficulty
+        WHERE id = :id
+        """
+    ), {
+        "id": id,
+        "name": recipe.name,
+        "instructions": recipe.instructions,
+        "time": recipe.time,
+        "difficulty": recipe.difficulty
+    })
+
+    # check if any rows were updated
+    if result.rowcount == 0:
+        raise HTTPException(status_code=404, detail="Recipe was not found in db")
+
+    # the same ingredient or supply listed twice is linked once, the last one wins
+    ingredients_by_name = {normalize_name(ingredient.name): ingredient for ingredient in recipe.ingredients}
+    ingredient_ids = resolve_ingredients(connection, list(ingredients_by_name.values()))
+    supply_ids = resolve_supplies(connection, [supply.supply_name for supply in recipe.supplies])
+    recipe_ingredient_names = {
+        ingredient_ids[name]: ingredient.name
+        for name, ingredient in ingredients_by_name.items()
+    }
 
-    with db.engine.begin() as connection:
-        # update main recipe details in the recipes table
-        result = connection.execute(sqlalchemy.text(
+    # only write the difference against the current links:
+    # drop the ones no longer used, add new ones and fix changed amounts
+    connection.execute(sqlalchemy.text(
+        """
+        DELETE FROM recipe_ingredients
+        WHERE recipe_id = :id
+        AND ingredient_id <> ALL(CAST(:ingredient_ids AS bigint[]))
+        """
+    ), {"id": id, "ingredient_ids": list(ingredient_ids.values())})
+
+    if ingredients_by_name:
+        connection.execute(sqlalchemy.text(
             """
-            UPDATE recipes
-            SET name = :name, instructions = :instructions,
-                time = :time, difficulty = :difficulty
-            WHERE id = :id
+            INSERT INTO recipe_ingredients (recipe_id, ingredient_id, amount_units)
+            SELECT :id, link.ingredient_id, link.amount_units
+            FROM unnest(CAST(:ingredient_ids AS bigint[]), CAST(:amount_units AS text[]))
+                AS link(ingredient_id, amount_units)
+            ON CONFLICT (recipe_id, ingredient_id) DO UPDATE
+            SET amount_units = EXCLUDED.amount_units
+            WHERE recipe_ingredients.amount_units IS DISTINCT FROM EXCLUDED.amount_units
             """
         ), {
             "id": id,
-            "name": recipe.name,
-            "instructions": recipe.instructions,
-            "time": recipe.time,
-            "difficulty": recipe.difficulty
+            "ingredient_ids": [ingredient_ids[name] for name in ingredients_by_name],
+            "amount_units": [ingredient.amount_units for ingredient in ingredients_by_name.values()]
         })
 
-        # check if any rows were updated
-        if result.rowcount == 0:
-            raise HTTPException(status_code=404, detail="Recipe was not found in db")
+    connection.execute(sqlalchemy.text(
+        """
+        DELETE FROM recipe_supplies
+        WHERE recipe_id = :id
+        AND supply_id <> ALL(CAST(:supply_ids AS bigint[]))
+        """
+    ), {"id": id, "supply_ids": list(supply_ids.values())})
 
-        # delete existing ingredients for the recipe to avoid duplicates
-        connection.execute(sqlalchemy.text(
-            "DELETE FROM recipe_ingredients WHERE recipe_id = :id"
-        ), {"id": id})
-
-        # insert or update each ingredient in the recipe
-        for ingredient in recipe.ingredients:
-            # check if the ingredient already exists in the ingredients table 
-            existing_ingredient_id = connection.execute(sqlalchemy.text(
-                """
-                SELECT ingredient_id FROM ingredients WHERE LOWER(ingredient_name) = LOWER(:ingredient_name)
-                """
-            ), {"ingredient_name": ingredient.name}).scalar()
-
-            # if the ingredient does not exist, insert it
-            if not existing_ingredient_id:
-                ingredient_id = connection.execute(sqlalchemy.text(
-                    """
-                    INSERT INTO ingredients (ingredient_name, price, item_type)
-                    VALUES (:ingredient_name, :price, :item_type)
-                    RETURNING ingredient_id
-                    """
-                ), {
-                    "ingredient_name": ingredient.name.lower().strip(),  
-                    "price": ingredient.price,
-                    "item_type": ingredient.item_type
-                }).scalar_one()
-            else:
-                ingredient_id = existing_ingredient_id
-
-            # insert ingredient into recipe_ingredients table with amount_units
-            connection.execute(sqlalchemy.text(
-                """
-                INSERT INTO recipe_ingredients (recipe_id, ingredient_id, amount_units)
-                VALUES (:recipe_id, :ingredient_id, :amount_units)
-                """
-            ), {
-                "recipe_id": id,
-                "ingredient_id": ingredient_id,
-                "amount_units": ingredient.amount_units
-            })
-
-        # delete existing supplies for the recipe to avoid duplicates
+    if supply_ids:
         connection.execute(sqlalchemy.text(
-            "DELETE FROM recipe_supplies WHERE recipe_id = :id"
-        ), {"id": id})
-
-        # insert or update each supply in the recipe
-        for supply in recipe.supplies:
-            # check if the supply already exists in the supplies table 
-            existing_supply_id = connection.execute(sqlalchemy.text(
-                """
-                SELECT supply_id FROM supplies WHERE LOWER(supply_name) = LOWER(:supply_name)
-                """
-            ), {"supply_name": supply.supply_name}).scalar()
-
-            # if the supply doesnt  exist insert it
-            if not existing_supply_id:
-                supply_id = connection.execute(sqlalchemy.text(
-                    """
-                    INSERT INTO supplies (supply_name)
-                    VALUES (:supply_name)
-                    RETURNING supply_id
-                    """
-                ), {"supply_name": supply.supply_name.lower().strip()}).scalar_one()
-            else:
-                supply_id = existing_supply_id
-
-            # insert supply into recipe_supplies table with recipe_id and supply_id
-            connection.execute(sqlalchemy.text(
-                """
-                INSERT INTO recipe_supplies (recipe_id, supply_id)
-                VALUES (:recipe_id, :supply_id)
-                """
-            ), {
-                "recipe_id": id,
-                "supply_id": supply_id
-            })
+            """
+            INSERT INTO recipe_supplies (recipe_id, supply_id)
+            SELECT :id, supply_id
+            FROM unnest(CAST(:supply_ids AS bigint[])) AS supply_id
+            ON CONFLICT (recipe_id, supply_id) DO NOTHING
+            """
+        ), {"id": id, "supply_ids": list(supply_ids.values())})
+
+    db.after_commit(connection, recipe_cache.cache.invalidate, id)
+    db.after_commit(connection, ingredient_index.index.set_recipe, id, recipe_ingredient_names)
+    db.after_commit(connection, search_index.index.set_recipe, id, recipe.name, recipe.instructions)
+    db.after_commit(
+        connection,
+        pantry.matcher.set_recipe,
+        id,
+        recipe.difficulty,
+        [ingredient.name for ingredient in recipe.ingredients],
+        [supply.supply_name for supply in recipe.supplies]
+    )
 
     return {"recipe_updated": "Recipe updated successfully"}
 
 
 # 1.5 delete recipe
 @router.delete("/{id}", response_model=Dict[str, str], status_code=200)
-def delete_recipe(id: int):
-
-    with db.engine.begin() as connection:
+@db.transactional
+def delete_recipe(connection, id: int):
 
-        # delete in recipe
-        result = connection.execute(sqlalchemy.text(
-            """
-            DELETE FROM recipes
-            WHERE id = :id
-            """
-        ), {"id": id})
+    # delete in recipe
+    result = connection.execute(sqlalchemy.text(
+        """
+        DELETE FROM recipes
+        WHERE id = :id
+        """
+    ), {"id": id})
 
     if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Recipe was not found in db")
 
+    db.after_commit(connection, recipe_cache.cache.forget, id)
+    db.after_commit(connection, ingredient_index.index.remove_recipe, id)
+    db.after_commit(connection, search_index.index.remove_recipe, id)
+    db.after_commit(connection, pantry.matcher.remove_recipe, id)
+
     return {"deleted_complete": "Recipe deleted"}
 
 @router.get("/highest-reviewed/", response_model = List[Dict[str, Any]], status_code = 200)
-def get_highest_review():
+@db.transactional(read_only=True, cpu_bound=True)
+def get_highest_review(
+    connection,
+    response: Response,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    stream: bool = False
+):
     """
-    Get the best 3 reviews per recipe and average rating
+    Get the best 3 reviews per recipe and average rating. Pass limit to page
+    through them (see the Next-Cursor header), or stream=true for NDJSON.
     """
 
-    response = []
-    with db.engine.begin() as connection:
-        best_reviews =connection.execute(sqlalchemy.text(
+    pagination.check_limit(limit)
+    after = pagination.decode_cursor(cursor, 3)
+
+    # read the aggregates kept up to date by the review endpoints
+    query = """
+        SELECT recipes.id AS recipe_id,
+            recipes.name AS recipe,
+            reviews.review,
+            reviews.rating,
+            stats.average_rating AS avgrating,
+            top.row_num
+        FROM recipe_review_stats AS stats
+        INNER JOIN recipes ON recipes.id = stats.recipe_id
+        CROSS JOIN LATERAL unnest(stats.top_review_ids) WITH ORDINALITY AS top(review_id, row_num)
+        INNER JOIN reviews ON reviews.review_id = top.review_id
+        WHERE CAST(:after_recipe AS text) IS NULL
+            OR (recipes.name, recipes.id, top.row_num) > (:after_recipe, :after_recipe_id, :after_row_num)
+        ORDER BY recipes.name, recipes.id, top.row_num
+        LIMIT :limit
+        """
+    after_recipe, after_recipe_id, after_row_num = after or (None, None, None)
+    params = {
+        "after_recipe": after_recipe,
+        "after_recipe_id": after_recipe_id,
+        "after_row_num": after_row_num,
+        "limit": limit + 1 if limit else None
+    }
+
+    def to_item(review):
+        return {
+            "recipe": review['recipe'],
+            "review": review['review'],
+            "rating": review['rating'],
+            "average_rating": review['avgrating']
+        }
+
+    if stream:
+        params["limit"] = limit
+        return pagination.stream_rows(query, params, to_item)
+
+    best_reviews = connection.execute(sqlalchemy.text(query), params).mappings().all()
+
+    best_reviews = pagination.page(
+        best_reviews, limit, response,
+        lambda review: [review['recipe'], review['recipe_id'], review['row_num']]
+    )
+
+    if not best_reviews:
+        raise HTTPException(status_code = 204, detail = "This recipe has no reviews.")
+
+    return [to_item(review) for review in best_reviews]
+
+def load_recipes(connection, recipe_ids: List[int]) -> Dict[int, Recipe]:
+    """
+    The given recipes with their ingredients and supplies keyed by id, in
+    three queries however many ids there are. Ids that do not exist are
+    left out.
+    """
+
+    if not recipe_ids:
+        return {}
+
+    params = {"recipe_ids": list(recipe_ids)}
+
+    recipes = {
+        row.id: {
+            "id": row.id,
+            "name": row.name,
+            "instructions": row.instructions,
+            "time": row.time,
+            "difficulty": row.difficulty,
+            "ingredients": [],
+            "supplies": []
+        }
+        for row in connection.execute(sqlalchemy.text(
             """
-            WITH rankedReviews AS (
-            SELECT reviews.review, 
-                reviews.rating, 
-                reviews.recipe_id,
-                recipes.name AS recipe,
-                AVG(reviews.rating) OVER (PARTITION BY reviews.recipe_id) AS avgRating,
-                ROW_NUMBER() OVER (PARTITION BY reviews.recipe_id ORDER BY reviews.rating DESC, reviews.review_id ASC) AS row_num
-            FROM reviews
-            INNER JOIN recipes ON recipes.id = reviews.recipe_id
-            )
-            SELECT recipe, 
-                review, 
-                rating, 
-                ROUND(avgRating,2) AS avgrating
-            FROM rankedReviews
-            WHERE row_num <= 3
-            ORDER BY recipe, row_num;
-            """))
-
-        for review in best_reviews.mappings():
-            response.append(
-                {
-                "recipe": review['recipe'],
-                "review": review['review'],
-                "rating": review['rating'],
-                "average_rating": review['avgrating']
-            }
+            SELECT id, name, instructions, time, difficulty
+            FROM recipes
+            WHERE id = ANY(:recipe_ids)
+            """
+        ), params)
+    }
+
+    ingredients = connection.execute(sqlalchemy.text(
+        """
+        SELECT ri.recipe_id, i.ingredient_name AS name, ri.amount_units, i.price, i.item_type
+        FROM recipe_ingredients AS ri
+        INNER JOIN ingredients AS i ON i.ingredient_id = ri.ingredient_id
+        WHERE ri.recipe_id = ANY(:recipe_ids)
+        ORDER BY ri.recipe_id, ri.ingredient_id
+        """
+    ), params)
+
+    supplies = connection.execute(sqlalchemy.text(
+        """
+        SELECT rs.recipe_id, s.supply_name
+        FROM recipe_supplies AS rs
+        INNER JOIN supplies AS s ON s.supply_id = rs.supply_id
+        WHERE rs.recipe_id = ANY(:recipe_ids)
+        ORDER BY rs.recipe_id, rs.supply_id
+        """
+    ), params)
+
+    # one pass over each result, duplicate links are skipped with a set lookup
+    seen = set()
+    for row in ingredients:
+        key = (row.recipe_id, row.name, row.amount_units, row.price, row.item_type)
+        if row.recipe_id in recipes and key not in seen:
+            seen.add(key)
+            recipes[row.recipe_id]["ingredients"].append(Ingredient(
+                name=row.name,
+                amount_units=row.amount_units,
+                price=row.price,
+                item_type=row.item_type
+            ))
+
+    seen = set()
+    for row in supplies:
+        key = (row.recipe_id, row.supply_name)
+        if row.recipe_id in recipes and key not in seen:
+            seen.add(key)
+            recipes[row.recipe_id]["supplies"].append(Supply(supply_name=row.supply_name))
+
+    return {recipe_id: Recipe(**recipe) for recipe_id, recipe in recipes.items()}
+
+def stream_recipes(recipe_ids: List[int]) -> Iterator[Recipe]:
+    """ load_recipes in batches, in order, on a connection of its own for streamed responses """
+
+    # the handler's connection is closed by the time the body is sent
+    with db.read_engine().connect() as connection:
+        for start in range(0, len(recipe_ids), pagination.STREAM_BATCH_SIZE):
+            batch = recipe_ids[start:start + pagination.STREAM_BATCH_SIZE]
+            recipes = load_recipes(connection, batch)
+            for recipe_id in batch:
+                if recipe_id in recipes:
+                    yield recipes[recipe_id]
+
+def validate_recipe(recipe: CreateRecipe):
+    """ raises a 400 for recipes create_recipe would not accept """
+
+    # start of added input validation for recipe 
+    if recipe.time <= 0:
+        raise HTTPException(status_code=400, detail="Time must be a positive integer.")
+    if not recipe.name.strip():
+        raise HTTPException(status_code=400, detail="Recipe name cannot be empty.")
+
+    # input validation for ingredient 
+    ingredient_names = set()
+    for ingredient in recipe.ingredients:
+        if not ingredient.name.strip():
+            raise HTTPException(status_code=400, detail="Ingredient name cannot be empty.")
+        if ingredient.amount_units is not None and not ingredient.amount_units.strip():
+            raise HTTPException(status_code=400, detail=f"Ingredient {ingredient.name}: amount units cannot be empty.")
+        if normalize_name(ingredient.name) in ingredient_names:
+            raise HTTPException(status_code=400, detail=f"Duplicate ingredient: {ingredient.name}")
+        ingredient_names.add(normalize_name(ingredient.name))
+
+    #input validation for supplies 
+    supply_names = set()
+    for supply in recipe.supplies:
+        if not supply.supply_name.strip():
+            raise HTTPException(status_code=400, detail="Supply name cannot be empty.")
+        if normalize_name(supply.supply_name) in supply_names:
+            raise HTTPException(status_code=400, detail=f"Duplicate supply: {supply.supply_name}")
+        supply_names.add(normalize_name(supply.supply_name))
+
+def normalize_name(name: str) -> str:
+    return name.strip().lower()
+
+def resolve_ingredients(connection, ingredients: List[Ingredient]) -> Dict[str, int]:
+    """
+    Ids of the given ingredients keyed by normalized name. Names missing from
+    the name cache are looked up, and inserted when they do not exist yet,
+    all of them in one statement.
+    """
+
+    if not ingredients:
+        return {}
+
+    names = [normalize_name(ingredient.name) for ingredient in ingredients]
+    ids = name_cache.ingredients.get_many(names)
+    missing = [ingredient for name, ingredient in zip(names, ingredients) if name not in ids]
+    if not missing:
+        return ids
+
+    missing_names = [normalize_name(ingredient.name) for ingredient in missing]
+
+    # relies on the unique index on lower(ingredient_name). The SELECT half reads the
+    # snapshot the statement started with, it does not see the rows the INSERT half
+    # adds (those come back through RETURNING) nor rows a concurrent transaction
+    # committed while the INSERT waited on them, those are looked up afterwards.
+    rows = connection.execute(sqlalchemy.text(
+        """
+        WITH inserted AS (
+            INSERT INTO ingredients (ingredient_name, price, item_type)
+            SELECT new.ingredient_name, new.price, new.item_type
+            FROM unnest(
+                CAST(:names AS text[]),
+                CAST(:prices AS double precision[]),
+                CAST(:item_types AS text[])
+            ) AS new(ingredient_name, price, item_type)
+            ON CONFLICT ((lower(ingredient_name))) DO NOTHING
+            RETURNING ingredient_id, lower(ingredient_name) AS name
         )
+        SELECT ingredient_id, name
+        FROM inserted
+        UNION ALL
+        SELECT ingredient_id, lower(ingredient_name) AS name
+        FROM ingredients
+        WHERE lower(ingredient_name) = ANY(CAST(:names AS text[]))
+        """
+    ), {
+        "names": missing_names,
+        "prices": [ingredient.price for ingredient in missing],
+        "item_types": [ingredient.item_type for ingredient in missing]
+    }).all()
+
+    raced = list(set(missing_names) - {row.name for row in rows})
+    if raced:
+        rows += connection.execute(sqlalchemy.text(
+            """
+            SELECT ingredient_id, lower(ingredient_name) AS name
+            FROM ingredients
+            WHERE lower(ingredient_name) = ANY(CAST(:names AS text[]))
+            """
+        ), {"names": raced}).all()
 
-    if not response:
-        raise HTTPException(status_code = 204, detail = "This recipe has no reviews.")
+    resolved = {row.name: row.ingredient_id for row in rows}
+    # rows this transaction inserted only exist once it commits
+    db.after_commit(connection, name_cache.ingredients.put_many, resolved)
+    ids.update(resolved)
+    return ids
 
-    return response
-
-def map_to_recipes(sql_result: List[dict]) -> List[Recipe]:
-    # Temporary dictionary to group by recipe ID
-    recipes_dict = {}
-
-    for row in sql_result:
-        recipe_id = row["id"]
-
-        # Ensure the recipe exists in the dictionary
-        if recipe_id not in recipes_dict:
-            recipes_dict[recipe_id] = {
-                "id": recipe_id,
-                "name": row["name"],
-                "instructions": row["instructions"],
-                "time": row["time"],
-                "difficulty": row["difficulty"],
-                "ingredients": [],
-                "supplies": [],
-            }
-
-        # Add ingredient if present
-        if row.get("ingredient_name"):
-            ingredient = Ingredient(
-                name=row["ingredient_name"],
-                amount_units=row.get("amount_units"),
-                price=row.get("price"),
-                item_type=row.get("item_type"),
-            )
-            if ingredient not in recipes_dict[recipe_id]["ingredients"]:
-                recipes_dict[recipe_id]["ingredients"].append(ingredient)
+def resolve_supplies(connection, supply_names: List[str]) -> Dict[str, int]:
+    """
+    Ids of the given supplies keyed by normalized name. Names missing from
+    the name cache are looked up, and inserted when they do not exist yet,
+    all of them in one statement.
+    """
 
-        # Add supply if present
-        if row.get("supply_name"):
-            supply = Supply(supply_name=row["supply_name"])
-            if supply not in recipes_dict[recipe_id]["supplies"]:
-                recipes_dict[recipe_id]["supplies"].append(supply)
+    if not supply_names:
+        return {}
+
+    names = list(dict.fromkeys(normalize_name(name) for name in supply_names))
+    ids = name_cache.supplies.get_many(names)
+    missing_names = [name for name in names if name not in ids]
+    if not missing_names:
+        return ids
+
+    # relies on the unique index on lower(supply_name), see resolve_ingredients
+    rows = connection.execute(sqlalchemy.text(
+        """
+        WITH inserted AS (
+            INSERT INTO supplies (supply_name)
+            SELECT supply_name
+            FROM unnest(CAST(:names AS text[])) AS supply_name
+            ON CONFLICT ((lower(supply_name))) DO NOTHING
+            RETURNING supply_id, lower(supply_name) AS name
+        )
+        SELECT supply_id, name
+        FROM inserted
+        UNION ALL
+        SELECT supply_id, lower(supply_name) AS name
+        FROM supplies
+        WHERE lower(supply_name) = ANY(CAST(:names AS text[]))
+        """
+    ), {"names": missing_names}).all()
+
+    raced = list(set(missing_names) - {row.name for row in rows})
+    if raced:
+        rows += connection.execute(sqlalchemy.text(
+            """
+            SELECT supply_id, lower(supply_name) AS name
+            FROM supplies
+            WHERE lower(supply_name) = ANY(CAST(:names AS text[]))
+            """
+        ), {"names": raced}).all()
 
-    # Convert the dictionary into Recipe objects
-    return [Recipe(**data) for data in recipes_dict.values()]
+    resolved = {row.name: row.supply_id for row in rows}
+    db.after_commit(connection, name_cache.supplies.put_many, resolved)
+    ids.update(resolved)
+    return ids
@@ -1,5 +1,8 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, HTTPException, Response, status
+from typing import Dict, Optional
 from src import database as db
+from src import pagination
+from src import review_stats
 import sqlalchemy
 
 router = APIRouter(
@@ -7,96 +10,140 @@ router = APIRouter(
     tags=["reviews"],
 )
 
+REVIEW_COUNT_HEADER = "Review-Count"
+AVERAGE_RATING_HEADER = "Average-Rating"
+RATING_COUNTS_HEADER = "Rating-Counts"
+
+
+def summary_headers(summary) -> Dict[str, str]:
+    """ a recipe's review summary as response headers, Rating-Counts lists how many reviews gave 0 to 5 """
+
+    headers = {
+        REVIEW_COUNT_HEADER: str(summary.review_count),
+        RATING_COUNTS_HEADER: ",".join(map(str, summary.rating_counts))
+    }
+    if summary.average_rating is not None:
+        headers[AVERAGE_RATING_HEADER] = str(summary.average_rating)
+    return headers
+
+
 @router.get("/{recipe_id}")
-def get_reviews(recipe_id: int):
+@db.transactional(read_only=True)
+def get_reviews(
+    connection,
+    recipe_id: int,
+    response: Response,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    stream: bool = False
+):
     """
-    Get the reviews for a given recipe
+    Get the reviews for a given recipe, oldest first. Pass limit to page
+    through them (see the Next-Cursor header), or stream=true for NDJSON.
+    Every response carries the recipe's review count, average rating and
+    rating histogram in its headers.
     """
 
-    with db.engine.begin() as connection:
-        recipe = connection.execute(sqlalchemy.text(
-            """
-            SELECT id
-            FROM recipes
-            WHERE id = :recipe_id
-            """
-        ), {"recipe_id": recipe_id}).one_or_none()
-
-        if recipe is None:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Recipe not found')
-        
-        reviews = connection.execute(sqlalchemy.text(
-            """
-            SELECT review, rating, customer_name, name as recipe_name
-            FROM reviews
-            INNER JOIN customers on customers.customer_id=reviews.customer_id
-            INNER JOIN recipes on recipes.id=reviews.recipe_id
-            WHERE recipe_id = :desired_recipe_id
-            """
-        ), {"desired_recipe_id": recipe_id})
-
-        response = [
-            {
-                "recipe_name": review['recipe_name'],
-                "rating": review['rating'],
-                "review": review['review'],
-                "customer": review['customer_name']
-            } for review in reviews.mappings()
-        ]
-        
-        return response
+    pagination.check_limit(limit)
+    after = pagination.decode_cursor(cursor, 1)
+
+    query = """
+        SELECT review_id, review, rating, customer_name
+        FROM reviews
+        INNER JOIN customers on customers.customer_id=reviews.customer_id
+        WHERE recipe_id = :desired_recipe_id
+        AND (CAST(:after AS bigint) IS NULL OR review_id > :after)
+        ORDER BY review_id
+        LIMIT :limit
+        """
+    params = {
+        "desired_recipe_id": recipe_id,
+        "after": after[0] if after else None,
+        "limit": limit + 1 if limit else None
+    }
+
+    # the summary doubles as the existence check and has the recipe's name
+    summary = review_stats.summary(connection, recipe_id)
+
+    if summary is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Recipe not found')
+
+    def to_item(review):
+        return {
+            "recipe_name": summary.name,
+            "rating": review['rating'],
+            "review": review['review'],
+            "customer": review['customer_name']
+        }
+
+    if stream:
+        params["limit"] = limit
+        streamed = pagination.stream_rows(query, params, to_item)
+        streamed.headers.update(summary_headers(summary))
+        return streamed
+
+    response.headers.update(summary_headers(summary))
+    reviews = connection.execute(sqlalchemy.text(query), params).mappings().all()
+    reviews = pagination.page(reviews, limit, response, lambda review: [review['review_id']])
+
+    return [to_item(review) for review in reviews]
 
 @router.post("/create/{recipe_id}")
-def create_review(recipe_id: int, customer_id: int, rating: int, review: str):
+@db.transactional
+def create_review(connection, recipe_id: int, customer_id: int, rating: int, review: str):
     """
     Create a review for a given recipe, on a 0-5 integer scale
     """
 
-    if rating not in range(0, 6):
+    if rating not in review_stats.RATINGS:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid review')
 
-    with db.engine.begin() as connection:
-        response = connection.execute(sqlalchemy.text(
-            """
-            SELECT 
-            (SELECT id FROM recipes WHERE id = :recipe_id) AS recipe,
-            (SELECT customer_id FROM customers WHERE customer_id = :customer_id) AS customer
-            """
-        ), [{"recipe_id": recipe_id, "customer_id": customer_id}]).one_or_none()
-
-        if response.recipe is None:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Recipe not found')
-        
-        if response.customer is None:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid customer id')
-        
-        review_id = connection.execute(sqlalchemy.text(
-            """
-            INSERT INTO reviews (recipe_id, customer_id, rating, review)
-            VALUES (:recipe_id, :customer_id, :rating, :review)
-            RETURNING review_id
-            """
-        ), [{"recipe_id": recipe_id, "customer_id": customer_id, "rating": rating, "review": review}]).scalar_one()
+    response = connection.execute(sqlalchemy.text(
+        """
+        SELECT 
+        (SELECT id FROM recipes WHERE id = :recipe_id) AS recipe,
+        (SELECT customer_id FROM customers WHERE customer_id = :customer_id) AS customer
+        """
+    ), [{"recipe_id": recipe_id, "customer_id": customer_id}]).one_or_none()
+
+    if response.recipe is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Recipe not found')
     
-        return {
-            "review_id": review_id
-        }
+    if response.customer is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid customer id')
+    
+    review_id = connection.execute(sqlalchemy.text(
+        """
+        INSERT INTO reviews (recipe_id, customer_id, rating, review)
+        VALUES (:recipe_id, :customer_id, :rating, :review)
+        RETURNING review_id
+        """
+    ), [{"recipe_id": recipe_id, "customer_id": customer_id, "rating": rating, "review": review}]).scalar_one()
+
+    review_stats.record_review(connection, recipe_id, rating)
+    
+    return {
+        "review_id": review_id
+    }
 
 @router.delete("/delete/{review_id}")
-def delete_review(review_id: int):
+@db.transactional
+def delete_review(connection, review_id: int):
     """
     Delete a review for a given recipe
     """
 
-    with db.engine.begin() as connection:
-        result = connection.execute(sqlalchemy.text(
-            """
-            DELETE FROM reviews
-            WHERE review_id = :review_id
-            """
-        ), {"review_id": review_id})
+    deleted = connection.execute(sqlalchemy.text(
+        """
+        DELETE FROM reviews
+        WHERE review_id = :review_id
+        RETURNING recipe_id, rating
+        """
+    ), {"review_id": review_id}).one_or_none()
+
+    if deleted is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Review not found")
 
-        if result.rowcount == 0:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Review not found")
+    review_stats.remove_review(connection, deleted.recipe_id, deleted.rating)
 
     return "OK"
\ No newline at end of file
@@ -1,7 +1,14 @@
 from fastapi import FastAPI, exceptions
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import ValidationError
-from src.api import reviews, recipes, carts, customers, ingredients
+from src.api import reviews, recipes, carts, customers, ingredients, imports, meal_plans
+from src import database as db
+from src import ingredient_index
+from src import pantry
+from src import metrics
+from src import name_cache
+from src import query_timing
+from src import search_index
 import json
 import logging
 import sys
@@ -31,11 +38,36 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# per-request statement count and DB time in Server-Timing, plus the slow query log
+for name, engine in db.engines().items():
+    query_timing.instrument(getattr(engine, "sync_engine", engine), name)
+app.add_middleware(query_timing.QueryTimingMiddleware)
+app.add_middleware(db.ReadYourWritesMiddleware)
+app.add_middleware(metrics.MetricsMiddleware, routes=app.routes)
+
 app.include_router(reviews.router)
 app.include_router(recipes.router)
 app.include_router(carts.router)
 app.include_router(customers.router)
 app.include_router(ingredients.router)
+app.include_router(imports.router)
+app.include_router(meal_plans.router)
+
+@app.on_event("startup")
+def load_indexes():
+    with db.engine.begin() as connection:
+        ingredient_index.index.load(connection)
+        pantry.matcher.load(connection)
+        search_index.index.load(connection)
+        name_cache.ingredients.load(connection)
+        name_cache.supplies.load(connection)
+
+@app.on_event("shutdown")
+async def close_async_engines():
+    if db.async_engine is not None:
+        await db.async_engine.dispose()
+    for replica in db.async_replica_engines:
+        await replica.dispose()
 
 @app.exception_handler(exceptions.RequestValidationError)
 @app.exception_handler(ValidationError)
@@ -51,3 +83,8 @@ async def validation_exception_handler(request, exc):
 @app.get("/")
 async def root():
     return {"message": "Welcome to the Meal Planner."}
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    pools = {name: engine.pool for name, engine in db.engines().items()}
+    return PlainTextResponse(metrics.render(pools), media_type="text/plain; version=0.0.4")
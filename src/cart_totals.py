@@ -0,0 +1,150 @@
+"""
+Running per-cart totals.
+
+carts.item_count and carts.total_amount hold how many items a cart has and
+what they cost: quantity times the line's cart_items.price, the ingredient's
+price when the line's quantity was last set (a missing price counts as 0).
+set_quantities changes cart_items and the totals in the same statement, inside
+the endpoint's transaction, so checkout reads the totals instead of summing
+the cart's items.
+
+Run `python -m src.cart_totals` to check every cart against cart_items. It
+lists the carts whose totals are off and exits with status 1 if there are
+any, with --repair their totals are recomputed instead.
+"""
+
+import argparse
+import sys
+from typing import List, Tuple
+from src import database as db
+import sqlalchemy
+
+# total_amount is a running float sum, allow for its rounding
+TOLERANCE = 0.005
+
+EXPECTED_TOTALS = """
+    SELECT carts.cart_id,
+        carts.item_count,
+        carts.total_amount,
+        COALESCE(items.item_count, 0) AS expected_item_count,
+        COALESCE(items.total_amount, 0) AS expected_total_amount
+    FROM carts
+    LEFT JOIN (
+        SELECT cart_items.cart_id,
+            SUM(cart_items.quantity) AS item_count,
+            SUM(cart_items.quantity * COALESCE(cart_items.price, 0)) AS total_amount
+        FROM cart_items
+        GROUP BY cart_items.cart_id
+    ) AS items ON items.cart_id = carts.cart_id
+"""
+
+
+def set_quantity(connection, cart_id: int, item_id: int, quantity: int, price: float):
+    """ set_quantities for a single item """
+    set_quantities(connection, cart_id, [(item_id, quantity, price)])
+
+
+def set_quantities(connection, cart_id: int, items: List[Tuple[int, int, float]]):
+    """
+    Set the quantity of every (item_id, quantity, price) in a cart, 0 removes
+    the item, price the lines at the given prices and move the cart's totals
+    by the difference, all in one statement. Item ids must be distinct. The caller must hold the cart's row
+    lock, so the quantities read here are still current when the totals are
+    updated.
+    """
+
+    if not items:
+        return
+
+    item_ids, quantities, prices = zip(*items)
+    connection.execute(sqlalchemy.text(
+        """
+        WITH new AS (
+            SELECT item_id, quantity, COALESCE(price, 0) AS price
+            FROM unnest(
+                CAST(:item_ids AS bigint[]),
+                CAST(:quantities AS integer[]),
+                CAST(:prices AS double precision[])
+            ) AS new(item_id, quantity, price)
+        ), previous AS (
+            SELECT new.item_id,
+                COALESCE(cart_items.quantity, 0) AS quantity,
+                COALESCE(cart_items.price, 0) AS price
+            FROM new
+            LEFT JOIN cart_items ON cart_items.cart_id = :cart_id AND cart_items.item_id = new.item_id
+        ), removed AS (
+            DELETE FROM cart_items
+            USING new
+            WHERE cart_items.cart_id = :cart_id AND cart_items.item_id = new.item_id AND new.quantity = 0
+        ), upserted AS (
+            INSERT INTO cart_items (cart_id, item_id, quantity, price)
+            SELECT :cart_id, item_id, quantity, price
+            FROM new
+            WHERE quantity > 0
+            ON CONFLICT (cart_id, item_id) DO UPDATE
+            SET quantity = EXCLUDED.quantity,
+                price = EXCLUDED.price
+        )
+        UPDATE carts
+        SET item_count = carts.item_count + delta.item_count,
+            total_amount = carts.total_amount + delta.total_amount
+        FROM (
+            SELECT SUM(new.quantity - previous.quantity) AS item_count,
+                SUM(new.quantity * new.price - previous.quantity * previous.price) AS total_amount
+            FROM new
+            JOIN previous ON previous.item_id = new.item_id
+        ) AS delta
+        WHERE carts.cart_id = :cart_id
+        """
+    ), {"cart_id": cart_id, "item_ids": list(item_ids), "quantities": list(quantities), "prices": list(prices)})
+
+
+def mismatches(connection):
+    """ carts whose totals do not match their items, with what they should be """
+
+    return connection.execute(sqlalchemy.text(
+        EXPECTED_TOTALS + """
+        WHERE carts.item_count <> COALESCE(items.item_count, 0)
+            OR abs(carts.total_amount - COALESCE(items.total_amount, 0)) > :tolerance
+        ORDER BY carts.cart_id
+        """
+    ), {"tolerance": TOLERANCE}).all()
+
+
+def repair(connection) -> int:
+    """ recompute the totals of every cart that is off, returns how many were """
+
+    # block item changes so none land between the scan and the update
+    connection.execute(sqlalchemy.text("LOCK TABLE cart_items IN SHARE MODE"))
+    return connection.execute(sqlalchemy.text(
+        f"""
+        UPDATE carts
+        SET item_count = expected.expected_item_count,
+            total_amount = expected.expected_total_amount
+        FROM ({EXPECTED_TOTALS}) AS expected
+        WHERE expected.cart_id = carts.cart_id
+            AND (expected.item_count <> expected.expected_item_count
+                OR abs(expected.total_amount - expected.expected_total_amount) > :tolerance)
+        """
+    ), {"tolerance": TOLERANCE}).rowcount
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the running cart totals against cart_items")
+    parser.add_argument("--repair", action="store_true", help="recompute the totals that are off")
+    args = parser.parse_args()
+
+    if args.repair:
+        with db.engine.begin() as connection:
+            repaired = repair(connection)
+        print(f"cart totals repaired for {repaired} carts")
+        sys.exit(0)
+
+    with db.engine.begin() as connection:
+        found = mismatches(connection)
+
+    for row in found:
+        print(f"cart {row.cart_id}: {row.item_count} items, {row.total_amount} "
+              f"(expected {row.expected_item_count} items, {row.expected_total_amount})")
+    print(f"{len(found)} carts with totals off")
+    sys.exit(1 if found else 0)
@@ -1,10 +1,201 @@
+import contextvars
+import functools
+import inspect
+import itertools
+import math
 import os
+import time
+from typing import Any, Dict, List, Tuple
 import dotenv
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine
+from starlette.requests import Request
+from src import metrics
+
+DRIVERS = ("sync", "async")
+PRIMARY_COOKIE = "read_primary_until"
 
 def database_connection_url():
     dotenv.load_dotenv()
 
     return os.environ.get("POSTGRES_URI")
 
-engine = create_engine(database_connection_url(), pool_pre_ping=True)
\ No newline at end of file
+def database_driver():
+    """ sync (psycopg2 on the threadpool) or async (asyncpg on the event loop), from DATABASE_DRIVER """
+    dotenv.load_dotenv()
+
+    driver = os.environ.get("DATABASE_DRIVER", "sync")
+    if driver not in DRIVERS:
+        raise ValueError(f"DATABASE_DRIVER must be one of: {', '.join(DRIVERS)}")
+    return driver
+
+def replica_connection_urls() -> List[str]:
+    """ read replicas of the primary, comma separated in POSTGRES_REPLICA_URIS """
+    dotenv.load_dotenv()
+
+    return [url.strip() for url in os.environ.get("POSTGRES_REPLICA_URIS", "").split(",") if url.strip()]
+
+def pool_options(prefix: str) -> Dict[str, int]:
+    """ {prefix}_POOL_SIZE, {prefix}_MAX_OVERFLOW and {prefix}_POOL_TIMEOUT, SQLAlchemy's defaults when unset """
+    dotenv.load_dotenv()
+
+    options = {}
+    for option in ("pool_size", "max_overflow", "pool_timeout"):
+        value = os.environ.get(f"{prefix}_{option.upper()}")
+        if value is not None:
+            options[option] = int(value)
+    return options
+
+def async_connection_url(url):
+    """ the same database, addressed through asyncpg """
+    return "postgresql+asyncpg://" + url.split("://", 1)[1]
+
+# the sync engine is always there: streaming responses, COPY imports and
+# startup jobs use it in either mode
+engine = create_engine(database_connection_url(), pool_pre_ping=True, **pool_options("POSTGRES"))
+driver = database_driver()
+async_engine = (
+    create_async_engine(async_connection_url(database_connection_url()), pool_pre_ping=True, **pool_options("POSTGRES"))
+    if driver == "async" else None
+)
+
+# read-only handlers round robin over the replicas, each with a pool of its
+# own, and fall back to the primary when there are none
+replica_engines = [
+    create_engine(url, pool_pre_ping=True, **pool_options("POSTGRES_REPLICA"))
+    for url in replica_connection_urls()
+]
+async_replica_engines = [
+    create_async_engine(async_connection_url(url), pool_pre_ping=True, **pool_options("POSTGRES_REPLICA"))
+    for url in replica_connection_urls()
+] if driver == "async" else []
+
+# how long after a write a client's reads stay on the primary, 0 turns it off
+READ_YOUR_WRITES_SECONDS = float(os.environ.get("READ_YOUR_WRITES_SECONDS", 0))
+
+_pinned: contextvars.ContextVar[bool] = contextvars.ContextVar("pinned_to_primary", default=False)
+_rotation = itertools.count()
+
+def engines() -> Dict[str, Any]:
+    """ every engine by the name its metrics are labelled with """
+
+    named = {"sync": engine}
+    if async_engine is not None:
+        named["async"] = async_engine
+    for number, replica in enumerate(replica_engines, 1):
+        named[f"sync-replica-{number}"] = replica
+    for number, replica in enumerate(async_replica_engines, 1):
+        named[f"async-replica-{number}"] = replica
+    return named
+
+def _route(read_only: bool, mode: str) -> Tuple[str, Any]:
+    """ (name, engine) of the sync or async engine a transaction should run on """
+
+    replicas = replica_engines if mode == "sync" else async_replica_engines
+    if read_only and replicas and not _pinned.get():
+        number = next(_rotation) % len(replicas)
+        return f"{mode}-replica-{number + 1}", replicas[number]
+    return mode, engine if mode == "sync" else async_engine
+
+def read_engine():
+    """ the sync engine for reads on a connection of their own, like streamed responses """
+    return _route(True, "sync")[1]
+
+class ReadYourWritesMiddleware:
+    """
+    ASGI middleware keeping a client's reads on the primary for
+    READ_YOUR_WRITES_SECONDS after it wrote something, so it sees its own
+    writes however far the replicas lag. A write is any request that is not a
+    GET or HEAD and succeeded, the client is told with a cookie.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not READ_YOUR_WRITES_SECONDS or not replica_engines:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            pinned_until = float(Request(scope).cookies.get(PRIMARY_COOKIE, 0))
+        except ValueError:
+            pinned_until = 0
+        token = _pinned.set(pinned_until > time.time())
+        writing = scope["method"] not in ("GET", "HEAD")
+
+        async def send_with_cookie(message):
+            if writing and message["type"] == "http.response.start" and message["status"] < 400:
+                cookie = (
+                    f"{PRIMARY_COOKIE}={time.time() + READ_YOUR_WRITES_SECONDS:.3f}; "
+                    f"Max-Age={math.ceil(READ_YOUR_WRITES_SECONDS)}; Path=/; HttpOnly; SameSite=Lax"
+                )
+                message["headers"] = list(message.get("headers", [])) + [(b"set-cookie", cookie.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_cookie)
+        finally:
+            _pinned.reset(token)
+
+def after_commit(connection, callback, *args):
+    """ run callback(*args) once the transaction of a transactional handler has committed """
+    connection.info["after_commit"].append(functools.partial(callback, *args))
+
+def _run(connection, handler, args, kwargs):
+    connection.info["after_commit"] = callbacks = []
+    try:
+        return handler(connection, *args, **kwargs), callbacks
+    finally:
+        del connection.info["after_commit"]
+
+def transactional(handler=None, *, read_only: bool = False, cpu_bound: bool = False):
+    """
+    Turn handler(connection, ...) into an endpoint that runs it in a single
+    transaction. With DATABASE_DRIVER=async the endpoint is a coroutine on
+    the asyncpg engine, the handler body runs through run_sync so waiting on
+    Postgres never holds a threadpool worker. Otherwise it is a plain def on
+    the psycopg2 engine, as before.
+
+    run_sync runs the handler's Python on the event loop, where it holds up
+    every other request of the worker. Handlers doing real work in Python
+    (in-memory indexes, the meal plan solver, building large responses) are
+    declared with @transactional(cpu_bound=True) and stay a plain def on the
+    psycopg2 engine in either mode, on the threadpool like FastAPI's response
+    validation of them.
+
+    Handlers that only read can be declared with
+    @transactional(read_only=True) to run on a read replica when there are
+    any, unless ReadYourWritesMiddleware pinned the request to the primary.
+    """
+
+    if handler is None:
+        return functools.partial(transactional, read_only=read_only, cpu_bound=cpu_bound)
+
+    if driver == "async" and not cpu_bound:
+        async def endpoint(*args, **kwargs):
+            name, chosen = _route(read_only, "async")
+            started = time.perf_counter()
+            async with chosen.begin() as connection:
+                metrics.pool_wait.observe(time.perf_counter() - started, (name,))
+                result, callbacks = await connection.run_sync(_run, handler, args, kwargs)
+            for callback in callbacks:
+                callback()
+            return result
+    else:
+        def endpoint(*args, **kwargs):
+            name, chosen = _route(read_only, "sync")
+            started = time.perf_counter()
+            with chosen.begin() as connection:
+                metrics.pool_wait.observe(time.perf_counter() - started, (name,))
+                result, callbacks = _run(connection, handler, args, kwargs)
+            for callback in callbacks:
+                callback()
+            return result
+
+    # FastAPI reads the parameters from the signature, the connection is ours to fill in
+    functools.update_wrapper(endpoint, handler)
+    del endpoint.__wrapped__
+    signature = inspect.signature(handler)
+    endpoint.__signature__ = signature.replace(parameters=list(signature.parameters.values())[1:])
+    return endpoint
@@ -0,0 +1,331 @@
+import heapq
+import threading
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import sqlalchemy
+
+GRAM_SIZE = 3
+# share of trigrams two names need in common to count as similar, pg_trgm's default
+SIMILARITY_THRESHOLD = 0.3
+SUGGESTION_SORTS = ("id", "missing", "cost", "coverage")
+
+
+def normalize(name: str) -> str:
+    return name.strip().lower()
+
+
+def grams(text: str) -> Set[str]:
+    """ every GRAM_SIZE character substring of text """
+    return {text[i:i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)}
+
+
+def word_grams(text: str) -> Set[str]:
+    """
+    Trigrams of every word padded like pg_trgm does ("  to", " to", ..., "to "),
+    so short words and typos near the start or end still share most of them.
+    """
+
+    found = set()
+    for word in text.split():
+        found |= grams("  " + word + " ")
+    return found
+
+
+class IngredientIndex:
+    """
+    In-process inverted index from ingredient names to the recipes that use them.
+
+    Ingredient names are normalized (stripped, lower case) and broken into
+    trigrams so that a substring pattern can be answered by intersecting the
+    posting lists of its trigrams instead of running LIKE '%pattern%' over
+    every ingredient. Each ingredient then points at the set of recipe ids
+    that use it.
+
+    The index only sees writes made through this process, so it is updated
+    by the recipe endpoints after their transaction commits.
+
+    For autocomplete the distinct names are also kept sorted, so the names
+    starting with a prefix are a bisect away, and every ingredient's padded
+    word trigrams are indexed to rank names by similarity to a misspelled
+    query.
+
+    Suggestions are ranked from every ingredient's price and every recipe's
+    total cost, kept next to its ingredient set, so the cost of what a recipe
+    still needs is its total minus the few ingredients the user has.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.loaded = False
+        self._names: Dict[int, str] = {}
+        self._ids_by_name: Dict[str, Set[int]] = defaultdict(set)
+        self._grams: Dict[str, Set[int]] = defaultdict(set)
+        self._recipes_by_ingredient: Dict[int, Set[int]] = defaultdict(set)
+        self._ingredients_by_recipe: Dict[int, Set[int]] = {}
+        self._sorted_names: List[str] = []
+        self._word_grams: Dict[str, Set[int]] = defaultdict(set)
+        self._word_gram_counts: Dict[int, int] = {}
+        self._prices: Dict[int, Optional[float]] = {}
+        self._recipe_costs: Dict[int, float] = {}
+
+    def load(self, connection):
+        """ rebuild the whole index from the database """
+
+        ingredients = connection.execute(sqlalchemy.text(
+            """
+            SELECT ingredient_id, ingredient_name, price
+            FROM ingredients
+            """
+        )).all()
+
+        links = connection.execute(sqlalchemy.text(
+            """
+            SELECT recipe_id, ingredient_id
+            FROM recipe_ingredients
+            """
+        )).all()
+
+        with self._lock:
+            self._names.clear()
+            self._ids_by_name.clear()
+            self._grams.clear()
+            self._recipes_by_ingredient.clear()
+            self._ingredients_by_recipe.clear()
+            self._sorted_names.clear()
+            self._word_grams.clear()
+            self._word_gram_counts.clear()
+            self._prices.clear()
+            self._recipe_costs.clear()
+
+            for row in ingredients:
+                self._add_ingredient(row.ingredient_id, row.ingredient_name)
+                self._prices[row.ingredient_id] = row.price
+
+            for row in links:
+                self._recipes_by_ingredient[row.ingredient_id].add(row.recipe_id)
+                self._ingredients_by_recipe.setdefault(row.recipe_id, set()).add(row.ingredient_id)
+
+            for recipe_id in self._ingredients_by_recipe:
+                self._update_cost(recipe_id)
+
+            self.loaded = True
+
+    def ensure_loaded(self, connection):
+        if not self.loaded:
+            self.load(connection)
+
+    def _add_ingredient(self, ingredient_id: int, name: str):
+        name = normalize(name)
+        if self._names.get(ingredient_id) == name:
+            return
+
+        self._names[ingredient_id] = name
+        if name not in self._ids_by_name:
+            insort(self._sorted_names, name)
+        # the same name can exist under several ids, so keep all of them
+        self._ids_by_name[name].add(ingredient_id)
+        for gram in grams(name):
+            self._grams[gram].add(ingredient_id)
+
+        name_grams = word_grams(name)
+        self._word_gram_counts[ingredient_id] = len(name_grams)
+        for gram in name_grams:
+            self._word_grams[gram].add(ingredient_id)
+
+    def set_recipe(self, recipe_id: int, ingredients: Dict[int, str]):
+        """ replace the ingredients of a recipe, ingredients maps ingredient_id -> name """
+
+        with self._lock:
+            self._remove_recipe(recipe_id)
+            for ingredient_id, name in ingredients.items():
+                self._add_ingredient(ingredient_id, name)
+                self._recipes_by_ingredient[ingredient_id].add(recipe_id)
+            self._ingredients_by_recipe[recipe_id] = set(ingredients)
+            self._update_cost(recipe_id)
+
+    def ensure_prices(self, connection):
+        """ look up the price of ingredients set_recipe added since the index was loaded """
+
+        with self._lock:
+            unpriced = self._names.keys() - self._prices.keys()
+        if not unpriced:
+            return
+
+        prices = connection.execute(sqlalchemy.text(
+            """
+            SELECT ingredient_id, price
+            FROM ingredients
+            WHERE ingredient_id = ANY(:ingredient_ids)
+            """
+        ), {"ingredient_ids": list(unpriced)}).all()
+        self.set_prices({row.ingredient_id: row.price for row in prices})
+
+    def set_prices(self, prices: Dict[int, Optional[float]]):
+        with self._lock:
+            self._prices.update(prices)
+            for ingredient_id in prices:
+                for recipe_id in self._recipes_by_ingredient.get(ingredient_id, ()):
+                    self._update_cost(recipe_id)
+
+    def _update_cost(self, recipe_id: int):
+        # unknown prices count as 0, like a NULL price
+        self._recipe_costs[recipe_id] = sum(
+            self._prices.get(ingredient_id) or 0 for ingredient_id in self._ingredients_by_recipe[recipe_id]
+        )
+
+    def remove_recipe(self, recipe_id: int):
+        with self._lock:
+            self._remove_recipe(recipe_id)
+
+    def _remove_recipe(self, recipe_id: int):
+        for ingredient_id in self._ingredients_by_recipe.pop(recipe_id, ()):
+            self._recipes_by_ingredient[ingredient_id].discard(recipe_id)
+        self._recipe_costs.pop(recipe_id, None)
+
+    def _match(self, pattern: str) -> Set[int]:
+        """ ids of ingredients whose name contains pattern """
+
+        pattern = normalize(pattern)
+        if len(pattern) < GRAM_SIZE:
+            candidates = self._names.keys()
+        else:
+            postings = sorted((self._grams.get(gram, set()) for gram in grams(pattern)), key=len)
+            candidates = set.intersection(*postings)
+
+        # trigrams only narrow the candidates, confirm the actual substring
+        return {ingredient_id for ingredient_id in candidates if pattern in self._names[ingredient_id]}
+
+    def _exact(self, names: Iterable[str]) -> Set[int]:
+        """ ids of ingredients whose normalized name matches exactly """
+
+        ids = set()
+        for name in names:
+            ids |= self._ids_by_name.get(normalize(name), set())
+        return ids
+
+    def ingredient_ids(self, names: Iterable[str]) -> Set[int]:
+        with self._lock:
+            return self._exact(names)
+
+    def recipes_using(self, ingredient_id: int) -> Set[int]:
+        with self._lock:
+            return set(self._recipes_by_ingredient.get(ingredient_id, ()))
+
+    def snapshot(self, recipe_ids: Iterable[int]) -> Tuple[Dict[int, Set[int]], Dict[int, float], Dict[int, Optional[float]]]:
+        """
+        The ingredient ids and total cost of each of the recipes the index
+        knows, and every ingredient's price. Recipe ingredient sets are
+        replaced, never changed, once published, so they are handed out as is
+        and must not be modified.
+        """
+
+        with self._lock:
+            ingredients = {
+                recipe_id: self._ingredients_by_recipe[recipe_id]
+                for recipe_id in recipe_ids
+                if recipe_id in self._ingredients_by_recipe
+            }
+            costs = {recipe_id: self._recipe_costs[recipe_id] for recipe_id in ingredients}
+            return ingredients, costs, dict(self._prices)
+
+    def complete(self, prefix: str, limit: int, fuzzy: bool = False) -> List[Tuple[int, str]]:
+        """
+        Up to limit (ingredient_id, name) pairs for a partly typed name. Names
+        starting with prefix come first, in alphabetical order. With fuzzy the
+        rest is filled with names sharing at least SIMILARITY_THRESHOLD of
+        their trigrams with it, most similar first.
+        """
+
+        prefix = normalize(prefix)
+        found = []
+
+        with self._lock:
+            position = bisect_left(self._sorted_names, prefix)
+            while len(found) < limit and position < len(self._sorted_names):
+                name = self._sorted_names[position]
+                if not name.startswith(prefix):
+                    break
+                found.extend((ingredient_id, name) for ingredient_id in sorted(self._ids_by_name[name]))
+                position += 1
+            found = found[:limit]
+
+            if fuzzy and len(found) < limit:
+                found += self._similar(prefix, limit - len(found), {ingredient_id for ingredient_id, _ in found})
+
+        return found
+
+    def _similar(self, text: str, limit: int, exclude: Set[int]) -> List[Tuple[int, str]]:
+        """ the limit ingredients most similar to text, by shared trigrams over all trigrams """
+
+        query_grams = word_grams(text)
+        if not query_grams:
+            return []
+
+        shared = Counter()
+        for gram in query_grams:
+            shared.update(self._word_grams.get(gram, ()))
+
+        scored = []
+        for ingredient_id, count in shared.items():
+            similarity = count / (len(query_grams) + self._word_gram_counts[ingredient_id] - count)
+            if similarity >= SIMILARITY_THRESHOLD and ingredient_id not in exclude:
+                scored.append((similarity, ingredient_id))
+
+        best = heapq.nsmallest(limit, scored, key=lambda item: (-item[0], self._names[item[1]], item[1]))
+        return [(ingredient_id, self._names[ingredient_id]) for _, ingredient_id in best]
+
+    def suggest(
+        self,
+        patterns: Iterable[str],
+        sort: str = "id",
+        limit: Optional[int] = None,
+        max_missing: Optional[int] = None
+    ) -> List[Tuple[int, Set[int]]]:
+        """
+        Recipes that use at least one ingredient matching one of the patterns and
+        still need something the user does not have, as (recipe_id, ids of the
+        missing ingredients) pairs ranked by sort:
+          id        recipe id
+          missing   fewest missing ingredients first
+          cost      cheapest missing ingredients first
+          coverage  largest share of the recipe already owned first
+        Ties go to fewer missing ingredients, then the lower id. Recipes missing
+        more than max_missing ingredients are left out, and with a limit only
+        that many are kept, through a heap of that size instead of a full sort.
+        """
+
+        patterns = {normalize(pattern) for pattern in patterns}
+
+        with self._lock:
+            owned = self._exact(patterns)
+
+            matched_recipes = set()
+            for pattern in patterns:
+                for ingredient_id in self._match(pattern):
+                    matched_recipes |= self._recipes_by_ingredient.get(ingredient_id, set())
+
+            def ranked():
+                for recipe_id in matched_recipes:
+                    ingredients = self._ingredients_by_recipe[recipe_id]
+                    # the user owns a handful of ingredients, so only those are looked at
+                    have = owned & ingredients
+                    missing = len(ingredients) - len(have)
+                    if missing == 0 or (max_missing is not None and missing > max_missing):
+                        continue
+
+                    if sort == "missing":
+                        key = (missing, recipe_id)
+                    elif sort == "cost":
+                        cost = self._recipe_costs[recipe_id] - sum(self._prices.get(ingredient_id) or 0 for ingredient_id in have)
+                        key = (cost, missing, recipe_id)
+                    elif sort == "coverage":
+                        key = (-len(have) / len(ingredients), missing, recipe_id)
+                    else:
+                        key = (recipe_id,)
+                    yield key, recipe_id
+
+            best = heapq.nsmallest(limit, ranked()) if limit is not None else sorted(ranked())
+            return [(recipe_id, self._ingredients_by_recipe[recipe_id] - owned) for _, recipe_id in best]
+
+index = IngredientIndex()
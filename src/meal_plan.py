@@ -0,0 +1,292 @@
+"""
+Meal plans.
+
+plan() picks a number of meals for a pantry so that buying what they still
+need costs as little as possible. Every ingredient is bought once however
+many meals use it, so recipes sharing ingredients make cheaper plans, and
+between plans costing the same the one reusing more ingredients (from the
+pantry or another meal of the plan) wins.
+
+The candidate recipes come from the pantry matcher (difficulty, supplies)
+and their ingredient sets and prices from the ingredient index, both
+already in memory. A greedy pass adds the recipe that adds the least cost
+until the plan is full, then a local search swaps planned recipes for the
+CANDIDATE_POOL most promising others while that makes the plan better.
+To get out of local optima the best plan is then shaken up (KICK_SIZE of
+its recipes swapped at random) and searched again, until KICKS shakes in
+a row found nothing better. The search stops when the time budget
+(MEAL_PLAN_TIME_BUDGET_MS, default 200) is spent, and the plan says
+whether it got to finish. The greedy plan is always completed, however
+little budget is left, so the plan is never worse than the greedy one. The random swaps are seeded, the same
+request gets the same plan.
+"""
+
+import heapq
+import os
+import random
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from src import ingredient_index
+from src import pantry
+
+TIME_BUDGET_MS = float(os.environ.get("MEAL_PLAN_TIME_BUDGET_MS", 200))
+CANDIDATE_POOL = 200
+KICKS = 15
+KICK_SIZE = 2
+MAX_MEALS = 21
+# costs are float sums, differences below this are ties
+EPSILON = 1e-9
+
+
+class MealPlan:
+    """ the planned recipes, what they are missing and how good the plan is """
+
+    def __init__(self, recipe_ids: List[int], missing: Dict[int, Set[int]], needed: Dict[int, int], cost: float, reused: int, complete: bool):
+        self.recipe_ids = recipe_ids
+        self.missing = missing
+        self.needed = needed
+        self.cost = cost
+        self.reused = reused
+        self.complete = complete
+
+    @property
+    def to_buy(self) -> List[int]:
+        return sorted(set().union(*self.missing.values()))
+
+
+class _Plan:
+    """
+    Recipes being planned, with how many of them need each ingredient so that
+    adding, removing and trying a swap only look at the recipes involved.
+    """
+
+    def __init__(self, ingredients: Dict[int, Set[int]], prices: Dict[int, float], owned: Set[int]):
+        self.ingredients = ingredients
+        self.prices = prices
+        self.owned = owned
+        self.recipe_ids: List[int] = []
+        self.needed: Dict[int, int] = {}
+        self.cost = 0.0
+        self.uses = 0
+        self.bought = 0
+        # per recipe, the ingredients that are not owned, shared by copies
+        self._to_buy: Dict[int, Set[int]] = {}
+        # the halves of swap_key, valid until the plan changes
+        self._leaving: Dict[int, Tuple[Set[int], float, int]] = {}
+        self._joining: Dict[int, Tuple[float, int]] = {}
+
+    def copy(self) -> "_Plan":
+        copied = _Plan(self.ingredients, self.prices, self.owned)
+        copied.recipe_ids = list(self.recipe_ids)
+        copied.needed = dict(self.needed)
+        copied.cost = self.cost
+        copied.uses = self.uses
+        copied.bought = self.bought
+        copied._to_buy = self._to_buy
+        return copied
+
+    def price(self, ingredient_ids: Iterable[int]) -> float:
+        return sum(map(self.prices.__getitem__, ingredient_ids))
+
+    def to_buy(self, recipe_id: int) -> Set[int]:
+        found = self._to_buy.get(recipe_id)
+        if found is None:
+            found = self._to_buy[recipe_id] = self.ingredients[recipe_id] - self.owned
+        return found
+
+    def key(self) -> Tuple[float, int]:
+        """ what the search minimizes: cost to buy, then minus the ingredient uses that need nothing new """
+        return self.cost, self.bought - self.uses
+
+    def marginal(self, recipe_id: int) -> Tuple[float, int]:
+        """ how key() would grow if the recipe was added """
+
+        new = self.to_buy(recipe_id) - self.needed.keys()
+        return self.price(new), len(new) - len(self.ingredients[recipe_id])
+
+    def add(self, recipe_id: int):
+        new = self.to_buy(recipe_id) - self.needed.keys()
+        self.cost += self.price(new)
+        self.bought += len(new)
+        for ingredient_id in self.ingredients[recipe_id]:
+            self.needed[ingredient_id] = self.needed.get(ingredient_id, 0) + 1
+        self.uses += len(self.ingredients[recipe_id])
+        self.recipe_ids.append(recipe_id)
+        self._changed()
+
+    def remove(self, recipe_id: int):
+        for ingredient_id in self.ingredients[recipe_id]:
+            self.needed[ingredient_id] -= 1
+            if self.needed[ingredient_id] == 0:
+                del self.needed[ingredient_id]
+                if ingredient_id not in self.owned:
+                    self.cost -= self.prices[ingredient_id]
+                    self.bought -= 1
+        self.uses -= len(self.ingredients[recipe_id])
+        self.recipe_ids.remove(recipe_id)
+        self._changed()
+
+    def _changed(self):
+        self._leaving = {}
+        self._joining = {}
+
+    def swap_key(self, leaving_id: int, joining_id: int) -> Tuple[float, int]:
+        """ key() with one planned recipe replaced by another, without changing the plan """
+
+        # the leaving recipe drops what only it needs, unless the joining one needs it
+        # too, and the joining one adds what nothing needs yet, which is its marginal
+        leaving = self._leaving.get(leaving_id)
+        if leaving is None:
+            alone = {ingredient_id for ingredient_id in self.to_buy(leaving_id) if self.needed[ingredient_id] == 1}
+            leaving = self._leaving[leaving_id] = (
+                alone,
+                self.cost - self.price(alone),
+                self.bought - self.uses - len(alone) + len(self.ingredients[leaving_id])
+            )
+        joining = self._joining.get(joining_id)
+        if joining is None:
+            joining = self._joining[joining_id] = self.marginal(joining_id)
+
+        alone, cost, key = leaving
+        kept = alone.intersection(self.ingredients[joining_id])
+        if kept:
+            return cost + joining[0] + self.price(kept), key + joining[1] + len(kept)
+        return cost + joining[0], key + joining[1]
+
+
+def _better(key: Tuple[float, int], than: Tuple[float, int]) -> bool:
+    return key[0] < than[0] - EPSILON or (abs(key[0] - than[0]) <= EPSILON and key[1] < than[1])
+
+
+def _greedy(plan: _Plan, keys: Dict[int, tuple], meals: int):
+    """
+    Add the recipe with the smallest marginal key until the plan has meals
+    recipes. It does not look at the deadline: picking by keys that are out
+    of date could make a plan worse than the greedy one, and at most
+    MAX_MEALS steps each only update the recipes sharing an ingredient.
+    """
+
+    while len(plan.recipe_ids) < meals and keys:
+        recipe_id = min(keys, key=keys.get)
+        del keys[recipe_id]
+        newly_needed = plan.ingredients[recipe_id] - plan.needed.keys()
+        plan.add(recipe_id)
+
+        # only recipes sharing an ingredient the plan did not need yet have a new marginal key
+        affected = set()
+        for ingredient_id in newly_needed:
+            affected |= ingredient_index.index.recipes_using(ingredient_id)
+        for other_id in affected:
+            if other_id in keys:
+                keys[other_id] = plan.marginal(other_id) + (other_id,)
+
+
+def _improve(plan: _Plan, pool: List[int], deadline: float) -> bool:
+    """ swap planned recipes for pool recipes while that helps, False if the deadline cut it short """
+
+    improved = True
+    while improved:
+        improved = False
+        for leaving_id in list(plan.recipe_ids):
+            if time.perf_counter() > deadline:
+                return False
+            best_key = plan.key()
+            best_id = None
+            for joining_id in pool:
+                if joining_id in plan.recipe_ids:
+                    continue
+                key = plan.swap_key(leaving_id, joining_id)
+                if key[0] < best_key[0] + EPSILON and _better(key, best_key):
+                    best_key, best_id = key, joining_id
+
+            if best_id is not None:
+                plan.remove(leaving_id)
+                plan.add(best_id)
+                improved = True
+    return True
+
+
+def _search(plan: _Plan, pool: List[int], deadline: float) -> Tuple[_Plan, bool]:
+    """ iterated local search from plan, the best plan found and whether it finished in time """
+
+    if not _improve(plan, pool, deadline):
+        return plan, False
+
+    rng = random.Random(0)
+    best = plan
+    stale = 0
+    while stale < KICKS:
+        trial = best.copy()
+        outside = [recipe_id for recipe_id in pool if recipe_id not in trial.recipe_ids]
+        if not outside:
+            break
+        for leaving_id, joining_id in zip(
+            rng.sample(trial.recipe_ids, min(KICK_SIZE, len(trial.recipe_ids))),
+            rng.sample(outside, min(KICK_SIZE, len(outside)))
+        ):
+            trial.remove(leaving_id)
+            trial.add(joining_id)
+
+        finished = _improve(trial, pool, deadline)
+        if _better(trial.key(), best.key()):
+            best = trial
+            stale = 0
+        else:
+            stale += 1
+        if not finished:
+            return best, False
+
+    return best, True
+
+
+def plan(
+    ingredients: Iterable[str],
+    meals: int,
+    difficulty: Optional[str] = None,
+    supplies: Optional[Iterable[str]] = None,
+    time_budget_ms: float = TIME_BUDGET_MS
+) -> MealPlan:
+    """
+    Plan up to meals recipes for someone owning the given ingredients. Only
+    recipes of the given difficulty, and needing nothing but the given
+    supplies, are considered when those are passed.
+    """
+
+    deadline = time.perf_counter() + time_budget_ms / 1000
+
+    candidates = [
+        recipe_id for recipe_id, _ in
+        pantry.matcher.match(difficulty=difficulty, supplies=supplies, all_supplies=True)
+    ]
+    owned = ingredient_index.index.ingredient_ids(ingredients)
+    recipe_ingredients, costs, known_prices = ingredient_index.index.snapshot(candidates)
+    # unknown prices count as 0, like a NULL price
+    prices = defaultdict(float, {ingredient_id: price or 0 for ingredient_id, price in known_prices.items()})
+
+    current = _Plan(recipe_ingredients, prices, owned)
+
+    # marginal keys against the empty plan, which only depend on the pantry
+    keys = {}
+    for recipe_id, needs in recipe_ingredients.items():
+        have = owned & needs
+        cost = costs[recipe_id] - current.price(have)
+        keys[recipe_id] = (cost, -len(have), recipe_id)
+
+    _greedy(current, keys, meals)
+
+    # the recipes that would add the least to the plan as it is now are the ones worth swapping in,
+    # and the greedy picks themselves, so a swap or a shake can bring them back
+    pool = list(current.recipe_ids) + [
+        recipe_id for _, recipe_id in heapq.nsmallest(CANDIDATE_POOL, ((key, recipe_id) for recipe_id, key in keys.items()))
+    ]
+    complete = True
+    if current.recipe_ids:
+        current, complete = _search(current, pool, deadline)
+
+    needed = {ingredient_id: count for ingredient_id, count in current.needed.items()}
+    missing = {recipe_id: recipe_ingredients[recipe_id] - owned for recipe_id in current.recipe_ids}
+    # summed again so the float drift of the incremental updates does not show
+    cost = current.price(needed.keys() - owned)
+
+    return MealPlan(current.recipe_ids, missing, needed, round(cost, 2), current.uses - current.bought, complete)
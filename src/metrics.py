@@ -0,0 +1,205 @@
+"""
+Prometheus metrics.
+
+MetricsMiddleware records, per method and route template (/recipes/{id},
+not /recipes/42):
+  http_request_duration_seconds  histogram of request latency
+  http_requests_in_flight        requests currently being handled
+  http_requests_total            responses by status code
+The transactional handlers record db_pool_wait_seconds, the time spent
+getting a connection from the pool, every statement's duration goes to
+db_statement_duration_seconds, both per engine (primary or replica), and
+render() adds each pool's checked out, overflow and size gauges when
+/metrics is scraped.
+
+Everything lives in this process, each uvicorn worker reports its own
+numbers. Updates are a dict lookup and a few additions behind an
+uncontended lock, cheap enough to leave on.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Tuple
+from starlette.routing import Match
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+UNMATCHED_ROUTE = "unmatched"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, description: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, label_names: Tuple[str, ...] = ()):
+        super().__init__(name, description, label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, labels: Tuple[str, ...] = (), amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{_labels(self.label_names, labels)} {value}" for labels, value in values
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, labels: Tuple[str, ...] = (), amount: float = 1):
+        self.inc(labels, -amount)
+
+    def set(self, labels: Tuple[str, ...], value: float):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, label_names: Tuple[str, ...] = (), buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, description, label_names)
+        self.buckets = tuple(buckets)
+        # per label set: a count for every bucket plus +Inf, the sum and the count
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, labels: Tuple[str, ...] = ()):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def totals(self) -> Dict[Tuple[str, ...], Tuple[float, int]]:
+        """ the sum and count of the observations, per label set """
+
+        with self._lock:
+            return {labels: (total, count) for labels, (_, total, count) in self._values.items()}
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._values.items()]
+
+        lines = self.header()
+        for labels, counts, total, count in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = _labels(self.label_names, labels, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {count}")
+        return lines
+
+
+request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template.", ("method", "route")
+)
+requests_in_flight = Gauge(
+    "http_requests_in_flight", "HTTP requests currently being handled.", ("method", "route")
+)
+requests_total = Counter(
+    "http_requests_total", "HTTP responses by route template and status code.", ("method", "route", "status")
+)
+pool_wait = Histogram(
+    "db_pool_wait_seconds", "Time spent getting a connection from the pool, pre-ping included.", ("engine",), POOL_WAIT_BUCKETS
+)
+statement_duration = Histogram(
+    "db_statement_duration_seconds", "SQL statement latency by engine.", ("engine",)
+)
+pool_checked_out = Gauge("db_pool_checked_out", "Connections currently checked out of the pool.", ("engine",))
+pool_overflow = Gauge("db_pool_overflow", "Connections open beyond the pool size.", ("engine",))
+pool_size = Gauge("db_pool_size", "Configured pool size.", ("engine",))
+
+REGISTRY = [
+    request_duration, requests_in_flight, requests_total, pool_wait, statement_duration,
+    pool_checked_out, pool_overflow, pool_size
+]
+
+
+def render(pools: Dict[str, object]) -> str:
+    """ every metric in the text exposition format, pools are read at call time """
+
+    for engine, pool in pools.items():
+        pool_checked_out.set((engine,), pool.checkedout())
+        # QueuePool counts overflow down from -size while the pool is not full yet
+        pool_overflow.set((engine,), max(pool.overflow(), 0))
+        pool_size.set((engine,), pool.size())
+
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """ ASGI middleware recording latency, in-flight requests and status codes per route template """
+
+    def __init__(self, app, routes: list):
+        self.app = app
+        self.routes = routes
+
+    def _route(self, scope) -> str:
+        partial = None
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+            if match == Match.PARTIAL and partial is None:
+                partial = route.path
+        return partial or UNMATCHED_ROUTE
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        labels = (scope["method"], self._route(scope))
+        status = "500"
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        requests_in_flight.inc(labels)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            request_duration.observe(time.perf_counter() - started, labels)
+            requests_in_flight.dec(labels)
+            requests_total.inc(labels + (status,))
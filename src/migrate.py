@@ -0,0 +1,222 @@
+"""
+Versioned schema migrations.
+
+src/migrations holds the schema as numbered steps, NNNN_description.sql,
+applied in order. schema_migrations records which versions a database has,
+so running the migrations again only applies the new steps. An advisory
+lock keeps two deployments from applying them at the same time.
+
+Most steps run in one transaction together with their schema_migrations
+row, they either apply completely or not at all. A step using CONCURRENTLY
+(index builds that must not block writes to a live table) cannot run in a
+transaction, its statements run one at a time instead and have to be safe
+to run again (IF NOT EXISTS): when one fails, rerunning the step picks up
+where it stopped. A failed concurrent build leaves an INVALID index behind
+that IF NOT EXISTS would keep, the step's invalid indexes are dropped before
+it runs.
+
+Statements in a step end with a ; at the end of a line.
+
+    python -m src.migrate               apply the pending steps
+    python -m src.migrate --status      list every step and whether it is applied
+    python -m src.migrate --baseline 1  record the steps up to 1 as applied without
+                                        running them, for a database that already
+                                        has that schema, then run python -m src.migrate
+                                        for the later steps
+"""
+
+import argparse
+import re
+import sys
+from pathlib import Path
+from typing import Dict, List
+from src import database as db
+import sqlalchemy
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent / "migrations"
+FILENAME = re.compile(r"^(\d{4})_(\w+)\.sql$")
+CONCURRENT = re.compile(r"\bCONCURRENTLY\b", re.IGNORECASE)
+CONCURRENT_INDEX = re.compile(
+    r"\bCREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)", re.IGNORECASE
+)
+# pg_advisory_lock key, any constant the app does not use for something else
+LOCK_KEY = 4242001
+
+
+class Migration:
+    """ one step of src/migrations """
+
+    def __init__(self, version: int, name: str, path: Path):
+        self.version = version
+        self.name = name
+        self.path = path
+        self.sql = path.read_text()
+
+    @property
+    def concurrent(self) -> bool:
+        return bool(CONCURRENT.search(self.sql))
+
+    @property
+    def statements(self) -> List[str]:
+        found = []
+        lines = []
+        for line in self.sql.splitlines():
+            if not lines and (not line.strip() or line.strip().startswith("--")):
+                continue
+            lines.append(line)
+            if line.rstrip().endswith(";"):
+                found.append("\n".join(lines))
+                lines = []
+        if any(line.strip() and not line.strip().startswith("--") for line in lines):
+            raise ValueError(f"{self.path.name}: the last statement does not end with ;")
+        return found
+
+    @property
+    def concurrent_indexes(self) -> List[str]:
+        return CONCURRENT_INDEX.findall(self.sql)
+
+
+def migrations() -> List[Migration]:
+    """ every step in src/migrations, in version order """
+
+    found: Dict[int, Migration] = {}
+    for path in sorted(MIGRATIONS_DIR.glob("*.sql")):
+        match = FILENAME.match(path.name)
+        if not match:
+            raise ValueError(f"{path.name}: migrations are named NNNN_description.sql")
+        version = int(match.group(1))
+        if version in found:
+            raise ValueError(f"{path.name}: version {version} is also {found[version].path.name}")
+        found[version] = Migration(version, match.group(2), path)
+    return [found[version] for version in sorted(found)]
+
+
+def _execute(connection, statement: str):
+    # no parameters, so psycopg2 leaves any % in the SQL alone
+    connection.execution_options(no_parameters=True).exec_driver_sql(statement)
+
+
+def _ensure_table(connection):
+    connection.execute(sqlalchemy.text(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version integer PRIMARY KEY,
+            name text NOT NULL,
+            applied_at timestamptz NOT NULL DEFAULT now()
+        )
+        """
+    ))
+
+
+def _record(connection, migration: Migration):
+    connection.execute(sqlalchemy.text(
+        """
+        INSERT INTO schema_migrations (version, name)
+        VALUES (:version, :name)
+        """
+    ), {"version": migration.version, "name": migration.name})
+
+
+def applied(connection) -> Dict[int, object]:
+    """ version -> applied_at of every step the database has """
+
+    _ensure_table(connection)
+    return dict(connection.execute(sqlalchemy.text(
+        """
+        SELECT version, applied_at
+        FROM schema_migrations
+        """
+    )).all())
+
+
+def _drop_invalid_indexes(connection, migration: Migration):
+    """ drop what an interrupted concurrent build of the step's indexes left behind """
+
+    invalid = connection.execute(sqlalchemy.text(
+        """
+        SELECT index_class.relname
+        FROM pg_index
+        JOIN pg_class AS index_class ON index_class.oid = pg_index.indexrelid
+        WHERE NOT pg_index.indisvalid
+            AND index_class.relname = ANY(:names)
+            AND pg_catalog.pg_table_is_visible(index_class.oid)
+        """
+    ), {"names": migration.concurrent_indexes}).scalars().all()
+
+    for name in invalid:
+        print(f"dropping invalid index {name} left by an earlier run")
+        _execute(connection, f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"')
+
+
+def _apply(engine, lock_connection, migration: Migration):
+    if migration.concurrent:
+        # the lock connection is in autocommit and idle between statements, so the
+        # concurrent builds do not end up waiting on a transaction of our own
+        _drop_invalid_indexes(lock_connection, migration)
+        for statement in migration.statements:
+            _execute(lock_connection, statement)
+        _record(lock_connection, migration)
+    else:
+        with engine.begin() as connection:
+            for statement in migration.statements:
+                _execute(connection, statement)
+            _record(connection, migration)
+
+
+def migrate(engine=None, baseline: int = None) -> List[Migration]:
+    """
+    Apply the pending steps, or with baseline only record the steps up to
+    that version as applied. Returns the steps applied or recorded.
+    """
+
+    engine = engine or db.engine
+    steps = migrations()
+    if baseline is not None and baseline not in {migration.version for migration in steps}:
+        raise ValueError(f"there is no migration {baseline:04d}")
+
+    done = []
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(sqlalchemy.text("SELECT pg_advisory_lock(:key)"), {"key": LOCK_KEY})
+        try:
+            already = applied(connection)
+            for migration in steps:
+                if migration.version in already:
+                    continue
+                if baseline is not None:
+                    if migration.version > baseline:
+                        break
+                    _record(connection, migration)
+                else:
+                    print(f"applying {migration.path.name}")
+                    _apply(engine, connection, migration)
+                done.append(migration)
+        finally:
+            connection.execute(sqlalchemy.text("SELECT pg_advisory_unlock(:key)"), {"key": LOCK_KEY})
+    return done
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply the schema migrations in src/migrations")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--status", action="store_true", help="list the migrations and whether they are applied")
+    group.add_argument("--baseline", type=int, metavar="VERSION",
+                       help="record the migrations up to VERSION as applied without running them")
+    args = parser.parse_args()
+
+    if args.status:
+        with db.engine.begin() as connection:
+            already = applied(connection)
+        for migration in migrations():
+            state = f"applied {already[migration.version]:%Y-%m-%d %H:%M}" if migration.version in already else "pending"
+            print(f"{migration.path.name:<40} {state}")
+        sys.exit(0)
+
+    try:
+        done = migrate(baseline=args.baseline)
+    except ValueError as error:
+        sys.exit(str(error))
+
+    if args.baseline is not None:
+        print(f"{len(done)} migrations recorded as applied")
+    else:
+        print(f"{len(done)} migrations applied")
@@ -0,0 +1,162 @@
+-- The schema as it was when migrations were introduced (the pg_dump that was
+-- schema.sql, with its syntax errors fixed): tables, keys and foreign keys.
+-- Databases created before then already have it, record it with
+-- `python -m src.migrate --baseline 1` instead of running it, then apply the
+-- later steps with `python -m src.migrate`.
+
+CREATE TABLE cart_items (
+    cart_id bigint NOT NULL,
+    item_id bigint NOT NULL,
+    quantity integer
+);
+
+ALTER TABLE cart_items ALTER COLUMN cart_id ADD GENERATED BY DEFAULT AS IDENTITY (
+    SEQUENCE NAME cart_items_cart_id_seq
+);
+
+CREATE TABLE carts (
+    cart_id bigint NOT NULL,
+    customer_id bigint NOT NULL,
+    payment_id bigint
+);
+
+ALTER TABLE carts ALTER COLUMN cart_id ADD GENERATED BY DEFAULT AS IDENTITY (
+    SEQUENCE NAME carts_id_seq
+);
+
+CREATE TABLE customers (
+    customer_id bigint NOT NULL,
+    customer_name text NOT NULL
+);
+
+ALTER TABLE customers ALTER COLUMN customer_id ADD GENERATED BY DEFAULT AS IDENTITY (
+    SEQUENCE NAME customers_customer_id_seq
+);
+
+CREATE TABLE ingredients (
+    ingredient_id bigint NOT NULL,
+    ingredient_name text NOT NULL,
+    price double precision,
+    item_type integer
+);
+
+ALTER TABLE ingredients ALTER COLUMN ingredient_id ADD GENERATED BY DEFAULT AS IDENTITY (
+    SEQUENCE NAME ingredients_id_seq
+);
+
+CREATE TABLE payments (
+    payment_id bigint NOT NULL,
+    card_num bigint NOT NULL,
+    exp_date text,
+    cvv integer,
+    customer_id bigint
+);
+
+ALTER TABLE payments ALTER COLUMN payment_id ADD GENERATED BY DEFAULT AS IDENTITY (
+    SEQUENCE NAME payments_payment_id_seq
+);
+
+CREATE TABLE recipe_ingredients (
+    recipe_id bigint NOT NULL,
+    ingredient_id bigint NOT NULL,
+    amount_units text
+);
+
+ALTER TABLE recipe_ingredients ALTER COLUMN recipe_id ADD GENERATED BY DEFAULT AS IDENTITY (
+    SEQUENCE NAME recipe_ingredients_recipe_id_seq
+);
+
+CREATE TABLE recipe_supplies (
+    recipe_id bigint NOT NULL,
+    supply_id bigint NOT NULL
+);
+
+ALTER TABLE recipe_supplies ALTER COLUMN recipe_id ADD GENERATED BY DEFAULT AS IDENTITY (
+    SEQUENCE NAME recipe_supplies_recipe_id_seq
+);
+
+CREATE TABLE recipes (
+    id bigint NOT NULL,
+    name text NOT NULL,
+    instructions text,
+    difficulty text,
+    "time" integer,
+    ingredients text[] NOT NULL DEFAULT '{}',
+    supplies_needed text[] NOT NULL DEFAULT '{}'
+);
+
+ALTER TABLE recipes ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY (
+    SEQUENCE NAME recipes_id_seq
+);
+
+CREATE TABLE reviews (
+    review_id bigint NOT NULL,
+    recipe_id bigint NOT NULL,
+    customer_id bigint,
+    rating integer,
+    review text
+);
+
+ALTER TABLE reviews ALTER COLUMN review_id ADD GENERATED BY DEFAULT AS IDENTITY (
+    SEQUENCE NAME reviews_id_seq
+);
+
+CREATE TABLE supplies (
+    supply_id bigint NOT NULL,
+    supply_name text NOT NULL
+);
+
+ALTER TABLE supplies ALTER COLUMN supply_id ADD GENERATED BY DEFAULT AS IDENTITY (
+    SEQUENCE NAME supplies_id_seq
+);
+
+ALTER TABLE ONLY cart_items
+    ADD CONSTRAINT cart_items_pkey PRIMARY KEY (cart_id, item_id);
+
+ALTER TABLE ONLY carts
+    ADD CONSTRAINT carts_pkey PRIMARY KEY (cart_id);
+
+ALTER TABLE ONLY customers
+    ADD CONSTRAINT customers_pkey PRIMARY KEY (customer_id);
+
+ALTER TABLE ONLY ingredients
+    ADD CONSTRAINT ingredients_pkey PRIMARY KEY (ingredient_id);
+
+ALTER TABLE ONLY payments
+    ADD CONSTRAINT payments_pkey PRIMARY KEY (payment_id);
+
+ALTER TABLE ONLY recipe_ingredients
+    ADD CONSTRAINT recipe_ingredients_pkey PRIMARY KEY (recipe_id, ingredient_id);
+
+ALTER TABLE ONLY recipe_supplies
+    ADD CONSTRAINT recipe_supplies_pkey PRIMARY KEY (recipe_id, supply_id);
+
+ALTER TABLE ONLY recipes
+    ADD CONSTRAINT recipes_pkey PRIMARY KEY (id);
+
+ALTER TABLE ONLY reviews
+    ADD CONSTRAINT reviews_pkey PRIMARY KEY (review_id),
+    ADD CONSTRAINT fk_recipe FOREIGN KEY (recipe_id) REFERENCES recipes(id),
+    ADD CONSTRAINT fk_customer FOREIGN KEY (customer_id) REFERENCES customers(customer_id);
+
+ALTER TABLE ONLY supplies
+    ADD CONSTRAINT supplies_pkey PRIMARY KEY (supply_id);
+
+ALTER TABLE recipe_ingredients
+    ADD CONSTRAINT fk_recipe_ingredients_recipe FOREIGN KEY (recipe_id) REFERENCES recipes(id),
+    ADD CONSTRAINT fk_recipe_ingredients_ingredient FOREIGN KEY (ingredient_id) REFERENCES ingredients(ingredient_id);
+
+ALTER TABLE recipe_supplies
+    ADD CONSTRAINT fk_recipe_supplies_recipe FOREIGN KEY (recipe_id) REFERENCES recipes(id),
+    ADD CONSTRAINT fk_recipe_supplies_supply FOREIGN KEY (supply_id) REFERENCES supplies(supply_id);
+
+ALTER TABLE cart_items ENABLE ROW LEVEL SECURITY;
+ALTER TABLE carts ENABLE ROW LEVEL SECURITY;
+ALTER TABLE customers ENABLE ROW LEVEL SECURITY;
+ALTER TABLE ingredients ENABLE ROW LEVEL SECURITY;
+ALTER TABLE payments ENABLE ROW LEVEL SECURITY;
+ALTER TABLE recipe_ingredients ENABLE ROW LEVEL SECURITY;
+ALTER TABLE recipe_supplies ENABLE ROW LEVEL SECURITY;
+ALTER TABLE recipes ENABLE ROW LEVEL SECURITY;
+ALTER TABLE reviews ENABLE ROW LEVEL SECURITY;
+ALTER TABLE supplies ENABLE ROW LEVEL SECURITY;
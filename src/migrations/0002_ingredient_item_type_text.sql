@@ -0,0 +1,4 @@
+-- The API has always taken item_type as a string, the original integer
+-- column rejected anything that is not a number.
+
+ALTER TABLE ingredients ALTER COLUMN item_type TYPE text USING item_type::text;
@@ -0,0 +1,14 @@
+-- Deleting a recipe deletes its ingredient and supply links and its reviews,
+-- DELETE /recipes/{id} only deletes the recipe row.
+
+ALTER TABLE reviews
+    DROP CONSTRAINT fk_recipe,
+    ADD CONSTRAINT fk_recipe FOREIGN KEY (recipe_id) REFERENCES recipes(id) ON DELETE CASCADE;
+
+ALTER TABLE recipe_ingredients
+    DROP CONSTRAINT fk_recipe_ingredients_recipe,
+    ADD CONSTRAINT fk_recipe_ingredients_recipe FOREIGN KEY (recipe_id) REFERENCES recipes(id) ON DELETE CASCADE;
+
+ALTER TABLE recipe_supplies
+    DROP CONSTRAINT fk_recipe_supplies_recipe,
+    ADD CONSTRAINT fk_recipe_supplies_recipe FOREIGN KEY (recipe_id) REFERENCES recipes(id) ON DELETE CASCADE;
@@ -0,0 +1,142 @@
+-- One ingredient and one supply per normalized name, recipe writes upsert
+-- them ON CONFLICT on these unique indexes. Before them the names were only
+-- checked with a SELECT before the INSERT, so two concurrent writes could
+-- both insert a name.
+--
+-- Every name's copies are folded into its lowest id first: the recipe links
+-- and cart items of the copies move to it (a recipe or cart already having
+-- it keeps one link, a cart adds up the quantities), then the copies are
+-- deleted. src/migrate.py runs these statements one at a time outside a
+-- transaction, each one can run again, so rerunning the step after a
+-- failure, a build that ran into a name inserted meanwhile among them,
+-- cleans up again before it retries.
+
+WITH names AS (
+    SELECT ingredient_id,
+        min(ingredient_id) OVER (PARTITION BY lower(ingredient_name)) AS keeper_id,
+        count(*) OVER (PARTITION BY lower(ingredient_name)) AS copies
+    FROM ingredients
+), ranked AS (
+    SELECT recipe_ingredients.recipe_id,
+        recipe_ingredients.ingredient_id,
+        row_number() OVER (
+            PARTITION BY recipe_ingredients.recipe_id, names.keeper_id
+            ORDER BY recipe_ingredients.ingredient_id
+        ) AS position
+    FROM recipe_ingredients
+    JOIN names ON names.ingredient_id = recipe_ingredients.ingredient_id
+    WHERE names.copies > 1
+)
+DELETE FROM recipe_ingredients
+USING ranked
+WHERE ranked.position > 1
+    AND recipe_ingredients.recipe_id = ranked.recipe_id
+    AND recipe_ingredients.ingredient_id = ranked.ingredient_id;
+
+WITH names AS (
+    SELECT ingredient_id,
+        min(ingredient_id) OVER (PARTITION BY lower(ingredient_name)) AS keeper_id
+    FROM ingredients
+)
+UPDATE recipe_ingredients
+SET ingredient_id = names.keeper_id
+FROM names
+WHERE names.ingredient_id = recipe_ingredients.ingredient_id
+    AND names.ingredient_id <> names.keeper_id;
+
+WITH names AS (
+    SELECT ingredient_id,
+        min(ingredient_id) OVER (PARTITION BY lower(ingredient_name)) AS keeper_id,
+        count(*) OVER (PARTITION BY lower(ingredient_name)) AS copies
+    FROM ingredients
+), ranked AS (
+    SELECT cart_items.cart_id,
+        cart_items.item_id,
+        row_number() OVER (
+            PARTITION BY cart_items.cart_id, names.keeper_id
+            ORDER BY cart_items.item_id
+        ) AS position,
+        sum(cart_items.quantity) OVER (PARTITION BY cart_items.cart_id, names.keeper_id) AS quantity
+    FROM cart_items
+    JOIN names ON names.ingredient_id = cart_items.item_id
+    WHERE names.copies > 1
+), merged AS (
+    UPDATE cart_items
+    SET quantity = ranked.quantity
+    FROM ranked
+    WHERE ranked.position = 1
+        AND cart_items.cart_id = ranked.cart_id
+        AND cart_items.item_id = ranked.item_id
+)
+DELETE FROM cart_items
+USING ranked
+WHERE ranked.position > 1
+    AND cart_items.cart_id = ranked.cart_id
+    AND cart_items.item_id = ranked.item_id;
+
+WITH names AS (
+    SELECT ingredient_id,
+        min(ingredient_id) OVER (PARTITION BY lower(ingredient_name)) AS keeper_id
+    FROM ingredients
+)
+UPDATE cart_items
+SET item_id = names.keeper_id
+FROM names
+WHERE names.ingredient_id = cart_items.item_id
+    AND names.ingredient_id <> names.keeper_id;
+
+WITH names AS (
+    SELECT ingredient_id,
+        min(ingredient_id) OVER (PARTITION BY lower(ingredient_name)) AS keeper_id
+    FROM ingredients
+)
+DELETE FROM ingredients
+USING names
+WHERE names.ingredient_id = ingredients.ingredient_id
+    AND names.ingredient_id <> names.keeper_id;
+
+WITH names AS (
+    SELECT supply_id,
+        min(supply_id) OVER (PARTITION BY lower(supply_name)) AS keeper_id,
+        count(*) OVER (PARTITION BY lower(supply_name)) AS copies
+    FROM supplies
+), ranked AS (
+    SELECT recipe_supplies.recipe_id,
+        recipe_supplies.supply_id,
+        row_number() OVER (
+            PARTITION BY recipe_supplies.recipe_id, names.keeper_id
+            ORDER BY recipe_supplies.supply_id
+        ) AS position
+    FROM recipe_supplies
+    JOIN names ON names.supply_id = recipe_supplies.supply_id
+    WHERE names.copies > 1
+)
+DELETE FROM recipe_supplies
+USING ranked
+WHERE ranked.position > 1
+    AND recipe_supplies.recipe_id = ranked.recipe_id
+    AND recipe_supplies.supply_id = ranked.supply_id;
+
+WITH names AS (
+    SELECT supply_id,
+        min(supply_id) OVER (PARTITION BY lower(supply_name)) AS keeper_id
+    FROM supplies
+)
+UPDATE recipe_supplies
+SET supply_id = names.keeper_id
+FROM names
+WHERE names.supply_id = recipe_supplies.supply_id
+    AND names.supply_id <> names.keeper_id;
+
+WITH names AS (
+    SELECT supply_id,
+        min(supply_id) OVER (PARTITION BY lower(supply_name)) AS keeper_id
+    FROM supplies
+)
+DELETE FROM supplies
+USING names
+WHERE names.supply_id = supplies.supply_id
+    AND names.supply_id <> names.keeper_id;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_ingredients_lower_name ON ingredients (lower(ingredient_name));
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_supplies_lower_name ON supplies (lower(supply_name));
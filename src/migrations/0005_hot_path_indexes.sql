@@ -0,0 +1,17 @@
+-- The indexes the hot paths need, built CONCURRENTLY so writes to the
+-- tables carry on while they build. src/migrate.py runs these one at a
+-- time outside a transaction, IF NOT EXISTS lets a rerun after a failure
+-- skip the ones already built. Loading a recipe's links and a cart's items
+-- is served by the (recipe_id, ...) and (cart_id, item_id) primary keys.
+
+-- ingredient lookups by exact name, see docs/performance_writeup.md
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_ingredient_name ON ingredients (ingredient_name);
+
+-- the recipes using an ingredient or supply, for the foreign key checks of
+-- ingredient and supply deletes and for lookups from the ingredient side
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_recipe_ingredients_ingredient ON recipe_ingredients (ingredient_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_recipe_supplies_supply ON recipe_supplies (supply_id);
+
+-- a recipe's top reviews, and paging through its reviews
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_reviews_recipe_rating ON reviews (recipe_id, rating DESC, review_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_reviews_recipe_review ON reviews (recipe_id, review_id);
@@ -0,0 +1,36 @@
+-- Per-recipe review aggregates, maintained by src/review_stats.py and
+-- filled here from the existing reviews. Reviews the previous release
+-- writes after this step are not counted, rebuild the aggregates with
+-- `python -m src.review_stats` once it stopped serving writes.
+
+-- rating_counts[n + 1] is how many reviews rated the recipe n
+CREATE TABLE recipe_review_stats (
+    recipe_id bigint PRIMARY KEY REFERENCES recipes(id) ON DELETE CASCADE,
+    review_count integer NOT NULL DEFAULT 0,
+    rating_sum bigint NOT NULL DEFAULT 0,
+    average_rating numeric GENERATED ALWAYS AS (ROUND(rating_sum::numeric / NULLIF(review_count, 0), 2)) STORED,
+    rating_counts integer[] NOT NULL DEFAULT '{0,0,0,0,0,0}',
+    top_review_ids bigint[] NOT NULL DEFAULT '{}'
+);
+
+ALTER TABLE recipe_review_stats ENABLE ROW LEVEL SECURITY;
+
+-- block review writes until the aggregates are in
+LOCK TABLE reviews IN SHARE MODE;
+
+-- src/review_stats.py rebuild() as of this step, top_review_ids holds 3 reviews
+INSERT INTO recipe_review_stats (recipe_id, review_count, rating_sum, rating_counts, top_review_ids)
+SELECT recipe_id,
+    COUNT(rating),
+    COALESCE(SUM(rating), 0),
+    ARRAY[
+        COUNT(*) FILTER (WHERE rating = 0),
+        COUNT(*) FILTER (WHERE rating = 1),
+        COUNT(*) FILTER (WHERE rating = 2),
+        COUNT(*) FILTER (WHERE rating = 3),
+        COUNT(*) FILTER (WHERE rating = 4),
+        COUNT(*) FILTER (WHERE rating = 5)
+    ],
+    (array_agg(review_id ORDER BY rating DESC, review_id ASC))[1:3]
+FROM reviews
+GROUP BY recipe_id;
@@ -0,0 +1,27 @@
+-- Running per-cart totals, maintained by src/cart_totals.py and filled here
+-- from the existing cart items. Items the previous release changes after
+-- this step are not counted, fix the totals with
+-- `python -m src.cart_totals --repair` once it stopped serving writes.
+
+ALTER TABLE carts
+    ADD COLUMN item_count integer NOT NULL DEFAULT 0,
+    ADD COLUMN total_amount double precision NOT NULL DEFAULT 0;
+
+COMMENT ON COLUMN carts.item_count IS 'Maintained by src/cart_totals.py, check with `python -m src.cart_totals`';
+COMMENT ON COLUMN carts.total_amount IS 'Maintained by src/cart_totals.py, check with `python -m src.cart_totals`';
+
+-- block item changes until the totals are in
+LOCK TABLE cart_items IN SHARE MODE;
+
+UPDATE carts
+SET item_count = COALESCE(items.item_count, 0),
+    total_amount = COALESCE(items.total_amount, 0)
+FROM (
+    SELECT cart_items.cart_id,
+        SUM(cart_items.quantity) AS item_count,
+        SUM(cart_items.quantity * COALESCE(ingredients.price, 0)) AS total_amount
+    FROM cart_items
+    JOIN ingredients ON ingredients.ingredient_id = cart_items.item_id
+    GROUP BY cart_items.cart_id
+) AS items
+WHERE items.cart_id = carts.cart_id;
@@ -0,0 +1,16 @@
+-- The price of a cart line as of when its quantity was last set, carts.total_amount
+-- sums quantity times this price, so later ingredient price changes do not put
+-- the stored totals and `python -m src.cart_totals` at odds. Lines are priced at
+-- the current ingredient prices here, the totals 0007 filled in used the same.
+
+ALTER TABLE cart_items ADD COLUMN price double precision;
+
+COMMENT ON COLUMN cart_items.price IS 'Maintained by src/cart_totals.py, the ingredient price when the quantity was last set';
+
+-- block item changes until every line has its price
+LOCK TABLE cart_items IN SHARE MODE;
+
+UPDATE cart_items
+SET price = COALESCE(ingredients.price, 0)
+FROM ingredients
+WHERE ingredients.ingredient_id = cart_items.item_id;
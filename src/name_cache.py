@@ -0,0 +1,89 @@
+"""
+Process-wide normalized name -> id caches for ingredients and supplies.
+
+The vocabulary is small and rows are never renamed or deleted, so once a
+name has an id it keeps it. Each cache is an LRU bounded to CAPACITY names,
+warmed from the database at startup. resolve_ingredients/resolve_supplies
+only ask Postgres about the names they miss, and add what they resolved
+with db.after_commit, so an id inserted by a transaction that rolls back
+never gets in.
+
+Lookups are counted in the name_cache_lookups_total metric by cache and
+hit/miss.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Dict, List
+from src import metrics
+import sqlalchemy
+
+CAPACITY = 20000
+
+lookups = metrics.Counter(
+    "name_cache_lookups_total", "Name to id cache lookups by cache and result.", ("cache", "result")
+)
+metrics.REGISTRY.append(lookups)
+
+
+class NameCache:
+    """ LRU map from normalized (stripped, lower case) names to ids """
+
+    def __init__(self, name: str, table: str, id_column: str, name_column: str, capacity: int = CAPACITY):
+        self.name = name
+        self.capacity = capacity
+        self._query = f"""
+            SELECT {id_column} AS id, lower({name_column}) AS name
+            FROM {table}
+            ORDER BY {id_column}
+            LIMIT :capacity
+            """
+        self._lock = threading.Lock()
+        self._ids: "OrderedDict[str, int]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, connection):
+        """ fill the cache from the database, up to capacity """
+
+        rows = connection.execute(sqlalchemy.text(self._query), {"capacity": self.capacity}).all()
+        with self._lock:
+            self._ids.clear()
+            for row in rows:
+                self._ids[row.name] = row.id
+
+    def get_many(self, names: List[str]) -> Dict[str, int]:
+        """ the cached ids of the given normalized names, the rest are missing from the result """
+
+        found = {}
+        with self._lock:
+            for name in names:
+                row_id = self._ids.get(name)
+                if row_id is not None:
+                    self._ids.move_to_end(name)
+                    found[name] = row_id
+            misses = len(set(names)) - len(found)
+            self.hits += len(found)
+            self.misses += misses
+
+        lookups.inc((self.name, "hit"), len(found))
+        lookups.inc((self.name, "miss"), misses)
+        return found
+
+    def put_many(self, ids: Dict[str, int]):
+        """ only call this with ids that are committed """
+
+        with self._lock:
+            for name, row_id in ids.items():
+                self._ids[name] = row_id
+                self._ids.move_to_end(name)
+            while len(self._ids) > self.capacity:
+                self._ids.popitem(last=False)
+
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+ingredients = NameCache("ingredients", "ingredients", "ingredient_id", "ingredient_name")
+supplies = NameCache("supplies", "supplies", "supply_id", "supply_name")
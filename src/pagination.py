@@ -0,0 +1,92 @@
+"""
+Keyset pagination and NDJSON streaming helpers for the list endpoints.
+
+Paged endpoints take an optional `limit` and `cursor`. The cursor is an
+opaque, url safe token holding the sort key of the last row that was
+returned, and the cursor for the following page is sent back in the
+Next-Cursor response header so the response bodies keep their shape.
+
+With `stream=true` an endpoint instead writes one JSON document per line
+as rows come off a server side cursor, so memory stays flat no matter how
+many rows match.
+"""
+
+import base64
+import json
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+from fastapi import HTTPException, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from src import database as db
+import sqlalchemy
+
+NEXT_CURSOR_HEADER = "Next-Cursor"
+MAX_LIMIT = 1000
+STREAM_BATCH_SIZE = 500
+
+
+def encode_cursor(*key) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode()
+
+
+def decode_cursor(cursor: Optional[str], size: int) -> Optional[List[Any]]:
+    """ the key stored in a cursor, or None when there is no cursor """
+
+    if cursor is None:
+        return None
+
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    if not isinstance(key, list) or len(key) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    return key
+
+
+def check_limit(limit: Optional[int]):
+    if limit is not None and not 1 <= limit <= MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_LIMIT}")
+
+
+def page(rows: List[Any], limit: Optional[int], response: Response, key: Callable[[Any], Iterable]) -> List[Any]:
+    """
+    Trim rows fetched with LIMIT limit + 1 down to one page and set the
+    Next-Cursor header when there is more to read.
+    """
+
+    if limit is None or len(rows) <= limit:
+        return rows
+
+    rows = rows[:limit]
+    response.headers[NEXT_CURSOR_HEADER] = encode_cursor(*key(rows[-1]))
+    return rows
+
+
+def ndjson(items: Iterable[Any]) -> StreamingResponse:
+    def lines():
+        for item in items:
+            yield json.dumps(jsonable_encoder(item)) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+def iterate_rows(query: str, params: Dict[str, Any]) -> Iterator[Any]:
+    """ a query's rows read through a server side cursor, on a connection of its own """
+
+    # the handler's own connection is closed by the time the body is sent,
+    # so the stream holds its own until the last row is written
+    with db.read_engine().connect() as connection:
+        result = connection.execution_options(yield_per=STREAM_BATCH_SIZE).execute(
+            sqlalchemy.text(query), params
+        )
+        for row in result.mappings():
+            yield row
+
+
+def stream_rows(query: str, params: Dict[str, Any], to_item: Callable[[Any], Any]) -> StreamingResponse:
+    """ stream a query's rows as NDJSON, one item per row """
+
+    return ndjson(map(to_item, iterate_rows(query, params)))
@@ -0,0 +1,254 @@
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+import sqlalchemy
+
+
+def normalize(name: str) -> str:
+    return name.strip().lower()
+
+
+class PantryMatcher:
+    """
+    Bitset matching engine for filtering the whole recipe catalog against a pantry.
+
+    Ingredient and supply names get dense bit positions, and every recipe gets
+    a slot. The slots of removed recipes are reused, so there are never more
+    slots than the most recipes there ever were at once. Two views are kept as packed python ints:
+      - per recipe: which ingredient / supply bits it uses (for coverage and
+        "only supplies I own" checks)
+      - per ingredient / supply / difficulty: which recipe slots use it (so
+        "contains any of my ingredients" is an OR of a few bitsets)
+
+    Like the ingredient index, it is loaded at startup and kept up to date by
+    the recipe endpoints after their transactions commit.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.loaded = False
+        self._ingredient_bits: Dict[str, int] = {}
+        self._supply_bits: Dict[str, int] = {}
+        self._slots: Dict[int, int] = {}
+        self._recipe_ids: List[Optional[int]] = []
+        self._recipe_ingredients: List[int] = []
+        self._recipe_supplies: List[int] = []
+        self._free_slots: List[int] = []
+        self._recipes_by_ingredient: Dict[int, int] = {}
+        self._recipes_by_supply: Dict[int, int] = {}
+        self._recipes_by_difficulty: Dict[str, int] = {}
+        self._live = 0
+
+    def load(self, connection):
+        """ rebuild the matcher from the database """
+
+        recipes = connection.execute(sqlalchemy.text(
+            """
+            SELECT id, difficulty
+            FROM recipes
+            """
+        )).all()
+
+        ingredients = connection.execute(sqlalchemy.text(
+            """
+            SELECT ri.recipe_id, i.ingredient_name
+            FROM recipe_ingredients AS ri
+            INNER JOIN ingredients AS i ON i.ingredient_id = ri.ingredient_id
+            """
+        )).all()
+
+        supplies = connection.execute(sqlalchemy.text(
+            """
+            SELECT rs.recipe_id, s.supply_name
+            FROM recipe_supplies AS rs
+            INNER JOIN supplies AS s ON s.supply_id = rs.supply_id
+            """
+        )).all()
+
+        ingredients_by_recipe = {}
+        for row in ingredients:
+            ingredients_by_recipe.setdefault(row.recipe_id, []).append(row.ingredient_name)
+
+        supplies_by_recipe = {}
+        for row in supplies:
+            supplies_by_recipe.setdefault(row.recipe_id, []).append(row.supply_name)
+
+        with self._lock:
+            self._reset()
+            for row in recipes:
+                self._set_recipe(
+                    row.id,
+                    row.difficulty,
+                    ingredients_by_recipe.get(row.id, []),
+                    supplies_by_recipe.get(row.id, [])
+                )
+            self.loaded = True
+
+    def ensure_loaded(self, connection):
+        if not self.loaded:
+            self.load(connection)
+
+    def _reset(self):
+        self._ingredient_bits.clear()
+        self._supply_bits.clear()
+        self._slots.clear()
+        self._recipe_ids.clear()
+        self._recipe_ingredients.clear()
+        self._recipe_supplies.clear()
+        self._free_slots.clear()
+        self._recipes_by_ingredient.clear()
+        self._recipes_by_supply.clear()
+        self._recipes_by_difficulty.clear()
+        self._live = 0
+
+    @staticmethod
+    def _bits(names: Iterable[str], table: Dict[str, int], create: bool) -> List[int]:
+        """ bit positions of the given names, assigning new ones when create is set """
+
+        bits = []
+        for name in names:
+            name = normalize(name)
+            if name not in table:
+                if not create:
+                    continue
+                table[name] = len(table)
+            bits.append(table[name])
+        return bits
+
+    @staticmethod
+    def _mask(bits: Iterable[int]) -> int:
+        mask = 0
+        for bit in bits:
+            mask |= 1 << bit
+        return mask
+
+    @staticmethod
+    def _positions(mask: int) -> List[int]:
+        """ set bit positions of a (dense) mask, lowest first """
+
+        digits = bin(mask)[:1:-1]
+        return [position for position, digit in enumerate(digits) if digit == "1"]
+
+    def set_recipe(self, recipe_id: int, difficulty: Optional[str], ingredients: Iterable[str], supplies: Iterable[str]):
+        """ add or replace a recipe """
+
+        with self._lock:
+            self._set_recipe(recipe_id, difficulty, ingredients, supplies)
+
+    def _set_recipe(self, recipe_id, difficulty, ingredients, supplies):
+        self._remove_recipe(recipe_id)
+
+        if self._free_slots:
+            slot = self._free_slots.pop()
+        else:
+            slot = len(self._recipe_ids)
+            self._recipe_ids.append(None)
+            self._recipe_ingredients.append(0)
+            self._recipe_supplies.append(0)
+        slot_bit = 1 << slot
+        ingredient_bits = self._bits(ingredients, self._ingredient_bits, create=True)
+        supply_bits = self._bits(supplies, self._supply_bits, create=True)
+
+        self._slots[recipe_id] = slot
+        self._recipe_ids[slot] = recipe_id
+        self._recipe_ingredients[slot] = self._mask(ingredient_bits)
+        self._recipe_supplies[slot] = self._mask(supply_bits)
+        self._live |= slot_bit
+
+        for bit in ingredient_bits:
+            self._recipes_by_ingredient[bit] = self._recipes_by_ingredient.get(bit, 0) | slot_bit
+        for bit in supply_bits:
+            self._recipes_by_supply[bit] = self._recipes_by_supply.get(bit, 0) | slot_bit
+        if difficulty is not None:
+            self._recipes_by_difficulty[difficulty] = self._recipes_by_difficulty.get(difficulty, 0) | slot_bit
+
+    def remove_recipe(self, recipe_id: int):
+        with self._lock:
+            self._remove_recipe(recipe_id)
+
+    def _remove_recipe(self, recipe_id):
+        slot = self._slots.pop(recipe_id, None)
+        if slot is None:
+            return
+
+        # clear the slot everywhere before the next recipe gets it
+        slot_bit = 1 << slot
+        self._live &= ~slot_bit
+        self._unset(self._recipes_by_ingredient, self._positions(self._recipe_ingredients[slot]), slot_bit)
+        self._unset(self._recipes_by_supply, self._positions(self._recipe_supplies[slot]), slot_bit)
+        self._unset(self._recipes_by_difficulty, list(self._recipes_by_difficulty), slot_bit)
+        self._recipe_ids[slot] = None
+        self._recipe_ingredients[slot] = 0
+        self._recipe_supplies[slot] = 0
+        self._free_slots.append(slot)
+
+    @staticmethod
+    def _unset(recipes_by: Dict, keys: Iterable, slot_bit: int):
+        for key in keys:
+            remaining = recipes_by.get(key, 0) & ~slot_bit
+            if remaining:
+                recipes_by[key] = remaining
+            else:
+                recipes_by.pop(key, None)
+
+    def match(
+        self,
+        ingredients: Optional[Iterable[str]] = None,
+        difficulty: Optional[str] = None,
+        supplies: Optional[Iterable[str]] = None,
+        all_supplies: bool = False
+    ) -> List[Tuple[int, Optional[float]]]:
+        """
+        Recipes matching the filters as (recipe_id, coverage) in recipe id order.
+
+        - ingredients: recipe uses at least one of them
+        - difficulty: recipe has exactly this difficulty
+        - supplies: recipe uses at least one of them, or with all_supplies
+          every supply the recipe needs is in the list
+        Coverage is the fraction of the recipe's ingredients found in the
+        pantry, or None when no ingredients were given.
+        """
+
+        with self._lock:
+            candidates = self._live
+
+            if difficulty is not None:
+                candidates &= self._recipes_by_difficulty.get(difficulty, 0)
+
+            pantry = None
+            if ingredients is not None:
+                pantry_bits = self._bits(ingredients, self._ingredient_bits, create=False)
+                pantry = self._mask(pantry_bits)
+                any_ingredient = 0
+                for bit in pantry_bits:
+                    any_ingredient |= self._recipes_by_ingredient.get(bit, 0)
+                candidates &= any_ingredient
+
+            if supplies is not None:
+                owned_bits = self._bits(supplies, self._supply_bits, create=False)
+                owned = self._mask(owned_bits)
+                if all_supplies:
+                    # drop the recipes needing any supply that is not owned
+                    needs_other = 0
+                    for bit, recipes in self._recipes_by_supply.items():
+                        if not owned >> bit & 1:
+                            needs_other |= recipes
+                    candidates &= ~needs_other
+                else:
+                    any_supply = 0
+                    for bit in owned_bits:
+                        any_supply |= self._recipes_by_supply.get(bit, 0)
+                    candidates &= any_supply
+
+            matches = []
+            for slot in self._positions(candidates):
+                coverage = None
+                if pantry is not None:
+                    needed = self._recipe_ingredients[slot]
+                    coverage = (needed & pantry).bit_count() / needed.bit_count()
+                matches.append((self._recipe_ids[slot], coverage))
+
+        matches.sort()
+        return matches
+
+
+matcher = PantryMatcher()
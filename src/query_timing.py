@@ -0,0 +1,188 @@
+"""
+Per-request SQL timing.
+
+instrument(engine, name) hooks SQLAlchemy's before/after_cursor_execute events and
+adds every statement's duration to the stats of the request it ran for. The
+QueryTimingMiddleware starts those stats for each HTTP request and reports
+them in a Server-Timing header, e.g.
+
+    Server-Timing: db;desc="3 queries";dur=4.21, db-slowest;dur=2.10
+
+Statements slower than SLOW_QUERY_MS (default 100) are written to the
+src.query_timing logger as one JSON document each, with their parameters,
+and so are requests whose statements add up to more than that, with their
+slowest statement. Card details never reach the log: the REDACTED_PARAMS
+are masked wherever they appear, and so is every parameter of a statement
+on one of the REDACTED_TABLES.
+With EXPLAIN_SLOW_QUERIES=1 a slow SELECT is run again under
+EXPLAIN (ANALYZE, BUFFERS) on the same connection and the plan is added to
+the log record. Only SELECTs are explained, ANALYZE executes the statement,
+and not those on REDACTED_TABLES, their plans show the bound values.
+
+Streamed response bodies are read after the headers are sent, their
+statements are logged but not counted in the header.
+
+Every statement's duration is also observed in the
+db_statement_duration_seconds metric under the name of its engine.
+"""
+
+import contextvars
+import json
+import logging
+import os
+import re
+import time
+from typing import Any, Dict, Optional
+from sqlalchemy import event
+from src import metrics
+
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 100))
+EXPLAIN_SLOW_QUERIES = os.environ.get("EXPLAIN_SLOW_QUERIES", "0").lower() in ("1", "true", "yes")
+REDACTED_PARAMS = {"card_num", "cvv", "exp_date"}
+REDACTED_TABLES = re.compile(r"\bpayments\b", re.IGNORECASE)
+MAX_PARAM_LENGTH = 200
+
+logger = logging.getLogger(__name__)
+
+# the name instrument() was given for each engine, labels the statement metric
+_engine_names: Dict[Any, str] = {}
+
+
+class QueryStats:
+    """ what one request spent in the database """
+
+    __slots__ = ("path", "count", "total_ms", "slowest_ms", "slowest_statement", "slowest_params")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        self.total_ms = 0.0
+        self.slowest_ms = 0.0
+        self.slowest_statement: Optional[str] = None
+        self.slowest_params: Optional[Dict[str, Any]] = None
+
+    def add(self, statement: str, params: Optional[Dict[str, Any]], elapsed_ms: float):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        if elapsed_ms > self.slowest_ms:
+            self.slowest_ms = elapsed_ms
+            self.slowest_statement = statement
+            self.slowest_params = params
+
+    def server_timing(self) -> str:
+        return f'db;desc="{self.count} queries";dur={self.total_ms:.2f}, db-slowest;dur={self.slowest_ms:.2f}'
+
+
+_current: contextvars.ContextVar[Optional[QueryStats]] = contextvars.ContextVar("query_stats", default=None)
+
+
+def current() -> Optional[QueryStats]:
+    """ the stats of the request being handled, None outside of one """
+    return _current.get()
+
+
+def _params(statement: str, context) -> Optional[Dict[str, Any]]:
+    """ the statement's bound parameters by name, safe to log """
+
+    compiled = getattr(context, "compiled_parameters", None)
+    if not compiled or len(compiled) != 1:
+        return None
+
+    redact_all = bool(REDACTED_TABLES.search(statement))
+    params = {}
+    for name, value in compiled[0].items():
+        if redact_all or name in REDACTED_PARAMS:
+            params[name] = "<redacted>"
+        else:
+            text = repr(value)
+            params[name] = value if len(text) <= MAX_PARAM_LENGTH else text[:MAX_PARAM_LENGTH] + "..."
+    return params
+
+
+def _explain(connection, statement: str, parameters) -> Optional[Any]:
+    # a raw DBAPI cursor, so the EXPLAIN does not go through these events again
+    cursor = connection.connection.cursor()
+    try:
+        cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + statement, parameters)
+        return cursor.fetchone()[0]
+    except Exception as exc:
+        return f"EXPLAIN failed: {exc}"
+    finally:
+        cursor.close()
+
+
+def _before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    elapsed_ms = (time.perf_counter() - context._query_started) * 1000
+    metrics.statement_duration.observe(elapsed_ms / 1000, (_engine_names.get(connection.engine, "unknown"),))
+    stats = _current.get()
+    params = _params(statement, context)
+
+    if stats is not None:
+        stats.add(statement, params, elapsed_ms)
+
+    if elapsed_ms < SLOW_QUERY_MS:
+        return
+
+    record = {
+        "event": "slow_query",
+        "path": stats.path if stats else None,
+        "duration_ms": round(elapsed_ms, 2),
+        "statement": " ".join(statement.split()),
+        "params": params,
+    }
+    if EXPLAIN_SLOW_QUERIES and not executemany and statement.lstrip().upper().startswith("SELECT") \
+            and not REDACTED_TABLES.search(statement):
+        record["plan"] = _explain(connection, statement, parameters)
+    logger.warning(json.dumps(record, default=str))
+
+
+def instrument(engine, name: str):
+    """ time every statement run on a (sync) engine, name labels its metric """
+
+    _engine_names[engine] = name
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class QueryTimingMiddleware:
+    """ ASGI middleware that collects the stats of each request and sends them in Server-Timing """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats(scope["path"])
+        token = _current.set(stats)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [
+                    (b"server-timing", stats.server_timing().encode())
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+
+        if stats.total_ms >= SLOW_QUERY_MS:
+            logger.warning(json.dumps({
+                "event": "slow_request",
+                "path": stats.path,
+                "statements": stats.count,
+                "db_ms": round(stats.total_ms, 2),
+                "slowest_ms": round(stats.slowest_ms, 2),
+                "slowest_statement": " ".join(stats.slowest_statement.split()),
+                "slowest_params": stats.slowest_params,
+            }, default=str))
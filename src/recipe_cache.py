@@ -0,0 +1,197 @@
+"""
+Response cache for GET /recipes/{id}.
+
+Entries hold the serialized JSON body and its ETag (a hash of the body, so
+it means the same thing in every worker and across restarts). Requests whose
+If-None-Match matches get a 304, and cache hits never touch the database.
+
+update_recipe invalidates its recipe after it commits, delete_recipe
+forgets it. Invalidations are numbered, and a body is only stored when its
+recipe was not invalidated after the read started, so a request racing a
+write cannot put the old body back. Only the recipes invalidated since
+their last delete are tracked, forgetting a recipe counts as an
+invalidation of every read in flight.
+
+Invalidation only reaches the worker process the write ran in, the other
+workers keep serving their copy until it expires. Entries expire after
+TTL_SECONDS (RECIPE_CACHE_TTL_SECONDS, 30 by default), which bounds how
+stale a multi-worker deployment can be after a write. The least recently
+used entries are evicted once the bodies take more than MEMORY_BUDGET
+bytes.
+"""
+
+import functools
+import hashlib
+import inspect
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import dotenv
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from src import metrics
+
+dotenv.load_dotenv()
+
+MEMORY_BUDGET = 16 * 1024 * 1024
+# how long other workers may serve a body after a write, see above
+TTL_SECONDS = float(os.environ.get("RECIPE_CACHE_TTL_SECONDS", 30))
+
+requests = metrics.Counter(
+    "recipe_cache_requests_total", "GET /recipes/{id} cache lookups by result.", ("result",)
+)
+metrics.REGISTRY.append(requests)
+
+
+class RecipeCache:
+    """ LRU of serialized recipe bodies with a memory budget and a TTL """
+
+    def __init__(self, memory_budget: int = MEMORY_BUDGET, ttl: float = TTL_SECONDS):
+        self.memory_budget = memory_budget
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # recipe id -> (body, etag, expires at)
+        self._entries: "OrderedDict[int, Tuple[bytes, str, float]]" = OrderedDict()
+        # recipe id -> number of its last invalidation, below _forgotten for the
+        # recipes no longer tracked
+        self._invalidated: Dict[int, int] = {}
+        self._invalidations = 0
+        self._forgotten = 0
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, recipe_id: int) -> Optional[Tuple[bytes, str]]:
+        with self._lock:
+            entry = self._entries.get(recipe_id)
+            if entry is not None and entry[2] < time.monotonic():
+                self._remove(recipe_id)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(recipe_id)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def version(self, recipe_id: int) -> int:
+        """ taken before reading a recipe, put() compares it to later invalidations """
+        return self._invalidations
+
+    def put(self, recipe_id: int, version: int, body: bytes, etag: str):
+        """ store a body read at version, unless the recipe was invalidated since """
+
+        with self._lock:
+            invalidated = self._invalidated.get(recipe_id, self._forgotten)
+            if invalidated > version or len(body) > self.memory_budget:
+                return
+
+            self._remove(recipe_id)
+            self._entries[recipe_id] = (body, etag, time.monotonic() + self.ttl)
+            self.size += len(body)
+
+            while self.size > self.memory_budget:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, recipe_id: int):
+        """ drop the recipe's body and keep reads already in flight from storing theirs """
+
+        with self._lock:
+            self._invalidations += 1
+            self._invalidated[recipe_id] = self._invalidations
+            self._remove(recipe_id)
+
+    def forget(self, recipe_id: int):
+        """ invalidate a deleted recipe without tracking it any longer """
+
+        with self._lock:
+            self._invalidations += 1
+            self._forgotten = self._invalidations
+            self._invalidated.pop(recipe_id, None)
+            self._remove(recipe_id)
+
+    def _remove(self, recipe_id: int):
+        entry = self._entries.pop(recipe_id, None)
+        if entry is not None:
+            self.size -= len(entry[0])
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "tracked": len(self._invalidated),
+                "bytes": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0
+            }
+
+
+cache = RecipeCache()
+
+
+def _etag(body: bytes) -> str:
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+
+def _response(request: Request, body: bytes, etag: str) -> Response:
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(body, media_type="application/json", headers={"ETag": etag})
+
+
+def _hit(request: Request, id: int) -> Optional[Response]:
+    cached = cache.get(id)
+    if cached is None:
+        requests.inc(("miss",))
+        return None
+
+    response = _response(request, *cached)
+    requests.inc(("not_modified" if response.status_code == 304 else "hit",))
+    return response
+
+
+def _store(request: Request, id: int, version: int, result) -> Response:
+    body = json.dumps(jsonable_encoder(result)).encode()
+    etag = _etag(body)
+    cache.put(id, version, body, etag)
+    return _response(request, body, etag)
+
+
+def cached(endpoint):
+    """
+    Serve a GET /recipes/{id} endpoint from the cache. Works on the sync and
+    the async endpoints db.transactional makes, only misses call endpoint.
+    """
+
+    if inspect.iscoroutinefunction(endpoint):
+        async def lookup(request: Request, id: int, **kwargs):
+            response = _hit(request, id)
+            if response is not None:
+                return response
+            version = cache.version(id)
+            return _store(request, id, version, await endpoint(id=id, **kwargs))
+    else:
+        def lookup(request: Request, id: int, **kwargs):
+            response = _hit(request, id)
+            if response is not None:
+                return response
+            version = cache.version(id)
+            return _store(request, id, version, endpoint(id=id, **kwargs))
+
+    functools.update_wrapper(lookup, endpoint)
+    del lookup.__wrapped__
+    signature = inspect.signature(endpoint)
+    request = inspect.Parameter("request", inspect.Parameter.POSITIONAL_OR_KEYWORD, annotation=Request)
+    lookup.__signature__ = signature.replace(parameters=[request] + list(signature.parameters.values()))
+    return lookup
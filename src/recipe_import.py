@@ -0,0 +1,289 @@
+"""
+Bulk recipe import.
+
+Takes a JSONL stream of CreateRecipe documents (the same shape as
+test/pancakes.json, one per line), validates them in chunks, COPYs the valid
+ones into temporary staging tables and merges everything into the real
+tables with a handful of set-based statements:
+  1. new ingredients and supplies, deduplicated across the whole batch
+  2. the recipes, with ids taken from the recipes sequence up front
+  3. the recipe_ingredients and recipe_supplies links
+
+Invalid records are reported by line number and skipped, the rest is
+imported in a single transaction. Lines are read as they come, only a chunk
+of them is held in memory at a time. Once the import committed, the
+imported recipes are added to the in-memory indexes.
+
+CLI: python -m src.recipe_import recipes.jsonl [--chunk-size N]
+"""
+
+import argparse
+import csv
+import io
+import json
+import sys
+import time
+from typing import Any, Dict, Iterable, List
+from fastapi import HTTPException
+from pydantic import ValidationError
+from src import database as db
+from src import ingredient_index
+from src import pantry
+from src import search_index
+from src.api.recipes import CreateRecipe, normalize_name, validate_recipe
+import sqlalchemy
+
+CHUNK_SIZE = 1000
+NULL = "\\N"
+
+STAGING_TABLES = """
+    CREATE TEMPORARY TABLE import_recipes (
+        line integer PRIMARY KEY,
+        recipe_id bigint,
+        name text,
+        instructions text,
+        "time" integer,
+        difficulty text
+    ) ON COMMIT DROP;
+
+    CREATE TEMPORARY TABLE import_ingredients (
+        line integer,
+        ingredient_name text,
+        amount_units text,
+        price double precision,
+        item_type text
+    ) ON COMMIT DROP;
+
+    CREATE TEMPORARY TABLE import_supplies (
+        line integer,
+        supply_name text
+    ) ON COMMIT DROP;
+"""
+
+
+def _parse(line: bytes) -> CreateRecipe:
+    """ the recipe on a line, raises ValueError with a readable message when it is invalid """
+
+    try:
+        line = line.decode("utf-8")
+    except UnicodeDecodeError as exc:
+        raise ValueError(f"invalid UTF-8: {exc}")
+
+    try:
+        recipe = CreateRecipe.parse_raw(line)
+    except ValidationError as exc:
+        raise ValueError("; ".join(f"{error['loc']}: {error['msg']}" for error in exc.errors()))
+    except ValueError as exc:
+        raise ValueError(f"invalid JSON: {exc}")
+
+    try:
+        validate_recipe(recipe)
+    except HTTPException as exc:
+        raise ValueError(exc.detail)
+
+    return recipe
+
+
+def _csv(rows: Iterable[Iterable[Any]]) -> io.StringIO:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    for row in rows:
+        writer.writerow([NULL if value is None else value for value in row])
+    buffer.seek(0)
+    return buffer
+
+
+def _copy(cursor, table: str, columns: str, rows: List[Iterable[Any]]):
+    if rows:
+        cursor.copy_expert(
+            f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '{NULL}')",
+            _csv(rows)
+        )
+
+
+def _stage_chunk(cursor, chunk: List[tuple]):
+    """ COPY a chunk of (line, recipe) pairs into the staging tables """
+
+    _copy(cursor, "import_recipes", 'line, name, instructions, "time", difficulty', [
+        (line, recipe.name.strip(), recipe.instructions, recipe.time, recipe.difficulty.strip())
+        for line, recipe in chunk
+    ])
+    _copy(cursor, "import_ingredients", "line, ingredient_name, amount_units, price, item_type", [
+        (line, normalize_name(ingredient.name), ingredient.amount_units, ingredient.price, ingredient.item_type)
+        for line, recipe in chunk
+        for ingredient in recipe.ingredients
+    ])
+    _copy(cursor, "import_supplies", "line, supply_name", [
+        (line, normalize_name(supply.supply_name))
+        for line, recipe in chunk
+        for supply in recipe.supplies
+    ])
+
+
+def _merge(connection) -> int:
+    """ move everything staged into the real tables, returns the number of recipes """
+
+    # new vocabulary first, the first line that mentions an ingredient sets its price and type
+    connection.execute(sqlalchemy.text(
+        """
+        INSERT INTO ingredients (ingredient_name, price, item_type)
+        SELECT DISTINCT ON (ingredient_name) ingredient_name, price, item_type
+        FROM import_ingredients
+        ORDER BY ingredient_name, line
+        ON CONFLICT ((lower(ingredient_name))) DO NOTHING
+        """
+    ))
+    connection.execute(sqlalchemy.text(
+        """
+        INSERT INTO supplies (supply_name)
+        SELECT DISTINCT supply_name
+        FROM import_supplies
+        ON CONFLICT ((lower(supply_name))) DO NOTHING
+        """
+    ))
+
+    # take the recipe ids from the sequence so the links can be joined on line
+    connection.execute(sqlalchemy.text(
+        """
+        UPDATE import_recipes
+        SET recipe_id = nextval(pg_get_serial_sequence('recipes', 'id'))
+        """
+    ))
+    imported = connection.execute(sqlalchemy.text(
+        """
+        INSERT INTO recipes (id, name, instructions, "time", difficulty)
+        SELECT recipe_id, name, instructions, "time", difficulty
+        FROM import_recipes
+        ORDER BY line
+        """
+    )).rowcount
+
+    connection.execute(sqlalchemy.text(
+        """
+        INSERT INTO recipe_ingredients (recipe_id, ingredient_id, amount_units)
+        SELECT r.recipe_id, i.ingredient_id, s.amount_units
+        FROM import_ingredients AS s
+        INNER JOIN import_recipes AS r ON r.line = s.line
+        INNER JOIN ingredients AS i ON lower(i.ingredient_name) = s.ingredient_name
+        """
+    ))
+    connection.execute(sqlalchemy.text(
+        """
+        INSERT INTO recipe_supplies (recipe_id, supply_id)
+        SELECT r.recipe_id, su.supply_id
+        FROM import_supplies AS s
+        INNER JOIN import_recipes AS r ON r.line = s.line
+        INNER JOIN supplies AS su ON lower(su.supply_name) = s.supply_name
+        """
+    ))
+
+    return imported
+
+
+def _imported(connection) -> List[Dict[str, Any]]:
+    """ what the in-memory indexes need to know about the merged recipes """
+
+    recipes = {
+        row.recipe_id: {
+            "recipe_id": row.recipe_id,
+            "name": row.name,
+            "instructions": row.instructions,
+            "difficulty": row.difficulty,
+            "ingredients": {},
+            "supplies": []
+        }
+        for row in connection.execute(sqlalchemy.text(
+            """
+            SELECT recipe_id, name, instructions, difficulty
+            FROM import_recipes
+            """
+        ))
+    }
+
+    for row in connection.execute(sqlalchemy.text(
+        """
+        SELECT r.recipe_id, i.ingredient_id, i.ingredient_name
+        FROM import_ingredients AS s
+        INNER JOIN import_recipes AS r ON r.line = s.line
+        INNER JOIN ingredients AS i ON lower(i.ingredient_name) = s.ingredient_name
+        """
+    )):
+        recipes[row.recipe_id]["ingredients"][row.ingredient_id] = row.ingredient_name
+
+    for row in connection.execute(sqlalchemy.text(
+        """
+        SELECT r.recipe_id, su.supply_name
+        FROM import_supplies AS s
+        INNER JOIN import_recipes AS r ON r.line = s.line
+        INNER JOIN supplies AS su ON lower(su.supply_name) = s.supply_name
+        """
+    )):
+        recipes[row.recipe_id]["supplies"].append(row.supply_name)
+
+    return list(recipes.values())
+
+
+def _index(recipes: List[Dict[str, Any]]):
+    for recipe in recipes:
+        ingredient_index.index.set_recipe(recipe["recipe_id"], recipe["ingredients"])
+        search_index.index.set_recipe(recipe["recipe_id"], recipe["name"], recipe["instructions"])
+        pantry.matcher.set_recipe(
+            recipe["recipe_id"], recipe["difficulty"], recipe["ingredients"].values(), recipe["supplies"]
+        )
+
+
+def import_recipes(lines: Iterable[bytes], chunk_size: int = CHUNK_SIZE) -> Dict[str, Any]:
+    """
+    Import a JSONL stream of recipes, lines of UTF-8 encoded bytes. Returns how many were imported, the
+    per-line errors of the ones that were not and the throughput.
+    """
+
+    started = time.perf_counter()
+    errors = []
+    chunk = []
+
+    with db.engine.begin() as connection:
+        connection.execute(sqlalchemy.text(STAGING_TABLES))
+        cursor = connection.connection.cursor()
+
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                chunk.append((number, _parse(line)))
+            except ValueError as exc:
+                errors.append({"line": number, "error": str(exc)})
+
+            if len(chunk) >= chunk_size:
+                _stage_chunk(cursor, chunk)
+                chunk = []
+
+        _stage_chunk(cursor, chunk)
+        imported = _merge(connection)
+        recipes = _imported(connection)
+
+    # only index the recipes once the transaction has committed
+    _index(recipes)
+
+    seconds = time.perf_counter() - started
+    return {
+        "recipes_imported": imported,
+        "recipes_failed": len(errors),
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "recipes_per_second": round(imported / seconds, 1) if seconds else None
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import recipes from a JSONL file")
+    parser.add_argument("file", help="JSONL file with one recipe per line, - for stdin")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+
+    source = sys.stdin.buffer if args.file == "-" else open(args.file, "rb")
+    with source:
+        report = import_recipes(source, args.chunk_size)
+    print(json.dumps(report, indent=2))
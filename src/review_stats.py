@@ -0,0 +1,118 @@
+"""
+Per-recipe review aggregates.
+
+recipe_review_stats keeps the review count, rating sum, average rating, how
+many reviews gave each rating from 0 to 5 and the ids of the current top 3
+reviews (highest rating first, oldest first on ties) for every recipe. The
+review endpoints update it inside their own transaction, so
+/recipes/highest-reviewed/ and the summary of GET /reviews/{recipe_id} can
+read it instead of scanning every review.
+
+Run `python -m src.review_stats` to rebuild the table from scratch.
+"""
+
+from src import database as db
+import sqlalchemy
+
+TOP_REVIEWS = 3
+RATINGS = range(0, 6)
+
+
+def _refresh_top_reviews(connection, recipe_id: int):
+    # separate statement so it sees reviews committed while we waited on the stats row lock
+    connection.execute(sqlalchemy.text(
+        """
+        UPDATE recipe_review_stats
+        SET top_review_ids = ARRAY(
+            SELECT review_id
+            FROM reviews
+            WHERE recipe_id = :recipe_id
+            ORDER BY rating DESC, review_id ASC
+            LIMIT :top_reviews
+        )
+        WHERE recipe_id = :recipe_id
+        """
+    ), {"recipe_id": recipe_id, "top_reviews": TOP_REVIEWS})
+
+
+def record_review(connection, recipe_id: int, rating: int):
+    """ account for a review that was just inserted """
+
+    rating_counts = [int(value == rating) for value in RATINGS]
+    connection.execute(sqlalchemy.text(
+        """
+        INSERT INTO recipe_review_stats (recipe_id, review_count, rating_sum, rating_counts)
+        VALUES (:recipe_id, 1, :rating, CAST(:rating_counts AS integer[]))
+        ON CONFLICT (recipe_id) DO UPDATE
+        SET review_count = recipe_review_stats.review_count + 1,
+            rating_sum = recipe_review_stats.rating_sum + EXCLUDED.rating_sum,
+            rating_counts[CAST(:rating AS integer) + 1] = recipe_review_stats.rating_counts[CAST(:rating AS integer) + 1] + 1
+        """
+    ), {"recipe_id": recipe_id, "rating": rating, "rating_counts": rating_counts})
+
+    _refresh_top_reviews(connection, recipe_id)
+
+
+def remove_review(connection, recipe_id: int, rating: int):
+    """ account for a review that was just deleted """
+
+    connection.execute(sqlalchemy.text(
+        """
+        UPDATE recipe_review_stats
+        SET review_count = review_count - 1,
+            rating_sum = rating_sum - :rating,
+            rating_counts[CAST(:rating AS integer) + 1] = rating_counts[CAST(:rating AS integer) + 1] - 1
+        WHERE recipe_id = :recipe_id
+        """
+    ), {"recipe_id": recipe_id, "rating": rating})
+
+    _refresh_top_reviews(connection, recipe_id)
+
+
+def summary(connection, recipe_id: int):
+    """ a recipe's name, review count, average rating and rating_counts, None if there is no such recipe """
+
+    return connection.execute(sqlalchemy.text(
+        """
+        SELECT recipes.name,
+            COALESCE(stats.review_count, 0) AS review_count,
+            stats.average_rating,
+            COALESCE(stats.rating_counts, '{0,0,0,0,0,0}') AS rating_counts
+        FROM recipes
+        LEFT JOIN recipe_review_stats AS stats ON stats.recipe_id = recipes.id
+        WHERE recipes.id = :recipe_id
+        """
+    ), {"recipe_id": recipe_id}).one_or_none()
+
+
+def rebuild(connection):
+    """ recompute every recipe's aggregates from the reviews table """
+
+    # block review writes so none land between the scan and the swap
+    connection.execute(sqlalchemy.text("LOCK TABLE reviews IN SHARE MODE"))
+    connection.execute(sqlalchemy.text("DELETE FROM recipe_review_stats"))
+    connection.execute(sqlalchemy.text(
+        """
+        INSERT INTO recipe_review_stats (recipe_id, review_count, rating_sum, rating_counts, top_review_ids)
+        SELECT recipe_id,
+            COUNT(rating),
+            COALESCE(SUM(rating), 0),
+            ARRAY[
+                COUNT(*) FILTER (WHERE rating = 0),
+                COUNT(*) FILTER (WHERE rating = 1),
+                COUNT(*) FILTER (WHERE rating = 2),
+                COUNT(*) FILTER (WHERE rating = 3),
+                COUNT(*) FILTER (WHERE rating = 4),
+                COUNT(*) FILTER (WHERE rating = 5)
+            ],
+            (array_agg(review_id ORDER BY rating DESC, review_id ASC))[1:(:top_reviews)]
+        FROM reviews
+        GROUP BY recipe_id
+        """
+    ), {"top_reviews": TOP_REVIEWS})
+
+
+if __name__ == "__main__":
+    with db.engine.begin() as connection:
+        rebuild(connection)
+    print("recipe_review_stats rebuilt")
@@ -0,0 +1,158 @@
+"""
+Full-text search over recipe names and instructions.
+
+SearchIndex is an in-process inverted index from words to the recipes using
+them, with how often each recipe does. Queries are scored with BM25, words
+in a recipe's name count NAME_WEIGHT times so a query matching the name
+beats one only mentioned in passing in the instructions.
+
+Like the ingredient index it is loaded at startup and kept up to date by the
+recipe endpoints after their transactions commit, a write only touches the
+postings of the recipe's own words.
+"""
+
+import heapq
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+import sqlalchemy
+
+# BM25 term frequency saturation and length normalization, the usual defaults
+K1 = 1.2
+B = 0.75
+NAME_WEIGHT = 3
+
+WORD = re.compile(r"[a-z0-9]+")
+
+
+def terms(text: Optional[str]) -> List[str]:
+    """ the lower case words of text, with a plural s dropped so "eggs" finds "egg" """
+
+    found = []
+    for word in WORD.findall((text or "").lower()):
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        found.append(word)
+    return found
+
+
+class SearchIndex:
+    """ BM25 inverted index of recipe names and instructions """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.loaded = False
+        # word -> recipe id -> weighted count of the word in the recipe
+        self._postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self._terms_by_recipe: Dict[int, Counter] = {}
+        self._lengths: Dict[int, int] = {}
+        self._total_length = 0
+        # BM25's length normalization per recipe, depends on the average length so
+        # every write drops it and the next search recomputes it
+        self._norms: Optional[Dict[int, float]] = None
+
+    def load(self, connection):
+        """ rebuild the whole index from the database """
+
+        recipes = connection.execute(sqlalchemy.text(
+            """
+            SELECT id, name, instructions
+            FROM recipes
+            """
+        )).all()
+
+        with self._lock:
+            self._postings.clear()
+            self._terms_by_recipe.clear()
+            self._lengths.clear()
+            self._total_length = 0
+            self._norms = None
+
+            for row in recipes:
+                self._set_recipe(row.id, row.name, row.instructions)
+
+            self.loaded = True
+
+    def ensure_loaded(self, connection):
+        if not self.loaded:
+            self.load(connection)
+
+    def set_recipe(self, recipe_id: int, name: Optional[str], instructions: Optional[str]):
+        """ add or replace a recipe """
+
+        with self._lock:
+            self._set_recipe(recipe_id, name, instructions)
+
+    def _set_recipe(self, recipe_id: int, name: Optional[str], instructions: Optional[str]):
+        self._remove_recipe(recipe_id)
+
+        frequencies = Counter(terms(instructions))
+        for term in terms(name):
+            frequencies[term] += NAME_WEIGHT
+
+        for term, frequency in frequencies.items():
+            self._postings[term][recipe_id] = frequency
+        self._terms_by_recipe[recipe_id] = frequencies
+        length = sum(frequencies.values())
+        self._lengths[recipe_id] = length
+        self._total_length += length
+        self._norms = None
+
+    def remove_recipe(self, recipe_id: int):
+        with self._lock:
+            self._remove_recipe(recipe_id)
+
+    def _remove_recipe(self, recipe_id: int):
+        frequencies = self._terms_by_recipe.pop(recipe_id, None)
+        if frequencies is None:
+            return
+
+        for term in frequencies:
+            postings = self._postings[term]
+            del postings[recipe_id]
+            if not postings:
+                del self._postings[term]
+        self._total_length -= self._lengths.pop(recipe_id)
+        self._norms = None
+
+    def search(self, query: str, limit: int, recipe_ids: Optional[Set[int]] = None) -> List[Tuple[int, float]]:
+        """
+        The limit best matches for query as (recipe_id, score), best first and
+        lowest id first on ties. Only recipes in recipe_ids are scored when it
+        is given.
+        """
+
+        with self._lock:
+            count = len(self._lengths)
+            # without a single term indexed nothing can match, and there is no average length
+            if not count or not self._total_length:
+                return []
+
+            norms = self._norms
+            if norms is None:
+                average_length = self._total_length / count
+                norms = self._norms = {
+                    recipe_id: K1 * (1 - B + B * length / average_length)
+                    for recipe_id, length in self._lengths.items()
+                }
+
+            scores: Dict[int, float] = defaultdict(float)
+            for term in set(terms(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+
+                weight = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5)) * (K1 + 1)
+                if recipe_ids is None:
+                    matched = postings.items()
+                else:
+                    matched = [(recipe_id, postings[recipe_id]) for recipe_id in postings.keys() & recipe_ids]
+                for recipe_id, frequency in matched:
+                    scores[recipe_id] += weight * frequency / (frequency + norms[recipe_id])
+
+        return heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
+
+
+index = SearchIndex()
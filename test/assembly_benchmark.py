@@ -0,0 +1,161 @@
+"""
+Micro-benchmark of GET /recipes result assembly, before and after removing
+the ingredient x supply cross product.
+
+    python test/assembly_benchmark.py --recipes 1000 --repeat 5
+
+"before" is the single query get_recipes used to run, recipes LEFT JOINed
+to both recipe_ingredients and recipe_supplies so every recipe came back as
+ingredients x supplies rows, assembled by map_to_recipes with a list scan
+per row. "after" is recipes.load_recipes: three queries that return one row
+per recipe, ingredient link and supply link, assembled in one pass with set
+lookups. For each the script prints the rows fetched, the wall time and the
+CPU time spent in Python (fetching and assembling), best of --repeat runs,
+and checks both produce the same recipes.
+
+Runs against the database at LOCAL_POSTGRES_URI as it is, seed it first
+with test/seed.py.
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+import seed
+
+ROOT = Path(__file__).resolve().parent.parent
+
+CROSS_PRODUCT_QUERY = """
+    SELECT
+        r.id,
+        r.name,
+        r.instructions,
+        r.time,
+        r.difficulty,
+        i.ingredient_name,
+        ri.amount_units,
+        i.price,
+        i.item_type,
+        s.supply_name
+    FROM recipes AS r
+    LEFT JOIN recipe_ingredients AS ri ON r.id = ri.recipe_id
+    LEFT JOIN ingredients AS i ON i.ingredient_id = ri.ingredient_id
+    LEFT JOIN recipe_supplies AS rs ON r.id = rs.recipe_id
+    LEFT JOIN supplies AS s ON rs.supply_id = s.supply_id
+    WHERE r.id = ANY(:recipe_ids)
+    ORDER BY r.id
+"""
+
+
+def cross_product_assembly(recipes, sql_result):
+    """ map_to_recipes as it was, deduplicating with a scan of each recipe's lists """
+
+    recipes_dict = {}
+    for row in sql_result:
+        recipe_id = row["id"]
+        if recipe_id not in recipes_dict:
+            recipes_dict[recipe_id] = {
+                "id": recipe_id,
+                "name": row["name"],
+                "instructions": row["instructions"],
+                "time": row["time"],
+                "difficulty": row["difficulty"],
+                "ingredients": [],
+                "supplies": [],
+            }
+        if row.get("ingredient_name"):
+            ingredient = recipes.Ingredient(
+                name=row["ingredient_name"],
+                amount_units=row.get("amount_units"),
+                price=row.get("price"),
+                item_type=row.get("item_type"),
+            )
+            if ingredient not in recipes_dict[recipe_id]["ingredients"]:
+                recipes_dict[recipe_id]["ingredients"].append(ingredient)
+        if row.get("supply_name"):
+            supply = recipes.Supply(supply_name=row["supply_name"])
+            if supply not in recipes_dict[recipe_id]["supplies"]:
+                recipes_dict[recipe_id]["supplies"].append(supply)
+
+    return {recipe_id: recipes.Recipe(**data) for recipe_id, data in recipes_dict.items()}
+
+
+def before(connection, recipes, sqlalchemy, recipe_ids):
+    rows = connection.execute(sqlalchemy.text(CROSS_PRODUCT_QUERY), {"recipe_ids": recipe_ids}).mappings().all()
+    return len(rows), cross_product_assembly(recipes, rows)
+
+
+def after(connection, recipes, sqlalchemy, recipe_ids):
+    rows = 0
+
+    # count what load_recipes fetches without changing how it fetches it
+    def count(conn, cursor, statement, parameters, context, executemany):
+        nonlocal rows
+        rows += max(cursor.rowcount, 0)
+
+    sqlalchemy.event.listen(connection, "after_cursor_execute", count)
+    try:
+        result = recipes.load_recipes(connection, recipe_ids)
+    finally:
+        sqlalchemy.event.remove(connection, "after_cursor_execute", count)
+    return rows, result
+
+
+def measure(connection, recipes, sqlalchemy, recipe_ids, assemble, repeat):
+    best_wall = best_cpu = float("inf")
+    for _ in range(repeat):
+        wall, cpu = time.perf_counter(), time.process_time()
+        rows, result = assemble(connection, recipes, sqlalchemy, recipe_ids)
+        best_wall = min(best_wall, time.perf_counter() - wall)
+        best_cpu = min(best_cpu, time.process_time() - cpu)
+    return rows, result, best_wall, best_cpu
+
+
+def normalized(result):
+    """ recipes with their ingredient and supply lists sorted, the two queries order them differently """
+
+    return {
+        recipe_id: (
+            recipe.name, recipe.instructions, recipe.time, recipe.difficulty,
+            sorted(tuple(ingredient.dict().items()) for ingredient in recipe.ingredients),
+            sorted(supply.supply_name for supply in recipe.supplies)
+        )
+        for recipe_id, recipe in result.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare GET /recipes result assembly before and after")
+    parser.add_argument("--recipes", type=int, default=1000, help="how many recipes to assemble")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per variant, the best one is reported")
+    args = parser.parse_args()
+
+    url = seed.database_connection_url()
+    if not url:
+        sys.exit("LOCAL_POSTGRES_URI is not set")
+
+    # point the app at the local database before it creates its engine
+    os.environ["POSTGRES_URI"] = url
+    sys.path.insert(0, str(ROOT))
+    from src import database as db
+    from src.api import recipes
+    import sqlalchemy
+
+    with db.engine.connect() as connection:
+        recipe_ids = list(connection.execute(
+            sqlalchemy.text("SELECT id FROM recipes ORDER BY id LIMIT :limit"), {"limit": args.recipes}
+        ).scalars())
+
+        results = {}
+        for name, assemble in (("before", before), ("after", after)):
+            rows, result, wall, cpu = measure(connection, recipes, sqlalchemy, recipe_ids, assemble, args.repeat)
+            results[name] = result
+            print(f"{name:<7} {len(result):>6} recipes  {rows:>9} rows  {wall * 1000:>10.1f} ms wall  {cpu * 1000:>10.1f} ms cpu")
+
+    if normalized(results["before"]) != normalized(results["after"]):
+        sys.exit("before and after assembled different recipes")
+
+
+if __name__ == "__main__":
+    main()
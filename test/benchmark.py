@@ -0,0 +1,317 @@
+"""
+Endpoint benchmark with regression gates.
+
+    python test/benchmark.py --scale 1 --requests 200 --concurrency 16 --baseline test/benchmark_baseline.json
+
+Seeds the database at LOCAL_POSTGRES_URI with test/seed.py (skip with
+--no-seed), then drives every router in src/api through an in-process ASGI
+client. Each endpoint gets --requests requests from --concurrency concurrent
+workers, and its p50/p95/p99 latency and throughput are written to --output.
+--driver picks the app's sync (psycopg2) or async (asyncpg) database layer.
+With --replica (repeatable) the app gets read replicas, seeded the same way
+as the primary, so the read-only endpoints run on them. The output then has
+each engine's statement count and mean statement latency. Two local
+Postgres instances (or two databases of one) are enough to try it.
+
+A response with a status code its scenario does not expect counts as an
+error, so does a request that could not be made because the scenario
+creating what it needs failed. The script exits with status 1 when any
+endpoint had errors.
+
+With --baseline the run is compared against an earlier output file and the
+script exits with status 1 when an endpoint had more errors, its p95 grew,
+or its throughput dropped, by more than --threshold (a fraction, 0.25 =
+25%). Baselines depend on the machine, so none is committed: when the file
+does not exist yet the run is saved to it instead of compared, pass
+--save-baseline to overwrite it. A run with errors is never saved.
+
+Needs the development requirements: pip install -r requirements-dev.txt
+DO NOT RUN IN PRODUCTION: seeding drops every table.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+import httpx
+import seed
+
+ROOT = Path(__file__).resolve().parent.parent
+PANCAKES = json.loads((ROOT / "test" / "pancakes.json").read_text())
+
+
+def recipe_body(rng):
+    return dict(PANCAKES, name=f"Benchmark Pancakes {rng.randrange(10 ** 9)}")
+
+
+# the status codes a scenario's responses should have, anything else is an error.
+# Reads answer 204 when nothing matches the random filters, that is fine.
+OK = (200,)
+OK_OR_EMPTY = (200, 204)
+CREATED = (201,)
+
+# Each scenario builds one request from the shared state and may record what it
+# created, so that later scenarios (update, delete, checkout) have ids to use.
+# Building raises IndexError when there is nothing to use, because the
+# scenario creating it failed or the requests used it all up. Scenarios run in
+# this order.
+SCENARIOS = [
+    ("customers.register", OK, lambda rng, state: (
+        "POST", "/customers/register", {"params": {"customer_name": f"bench {rng.randrange(10 ** 9)}"}}
+    ), None),
+    ("carts.create", OK, lambda rng, state: (
+        "POST", "/carts/create/", {"params": {"customer_id": state.setdefault("customer", rng.choice(state["customers"]))}}
+    ), lambda state, response: state["carts"].append(response.json()["cart_id"])),
+    ("carts.set_item_quantity", OK, lambda rng, state: (
+        "POST", f"/carts/{rng.choice(state['carts'])}/items/{rng.choice(state['ingredient_ids'])}",
+        {"params": {"quantity": rng.randint(1, 10)}}
+    ), lambda state, response: state["filled_carts"].add(int(response.request.url.path.split("/")[2]))),
+    ("carts.set_item_quantities", OK, lambda rng, state: (
+        "POST", f"/carts/{rng.choice(state['carts'])}/items",
+        {"json": [{"item_id": item_id, "quantity": rng.randint(1, 10)} for item_id in rng.sample(state["ingredient_ids"], 15)]}
+    ), lambda state, response: state["filled_carts"].add(int(response.request.url.path.split("/")[2]))),
+    ("carts.checkout", OK, lambda rng, state: (
+        "POST", f"/carts/{rng.choice(sorted(state['filled_carts']))}/checkout",
+        {"params": {"card_num": 4000000000000000, "exp_date": "12/30", "customer_id": state["customer"], "cvv": 123}}
+    ), None),
+    ("recipes.get", OK_OR_EMPTY, lambda rng, state: (
+        "GET", "/recipes/", {"params": {
+            "ingredients": rng.sample(state["ingredient_names"], 3),
+            "supplies": rng.sample(state["supply_names"], 2)
+        }}
+    ), None),
+    ("recipes.suggestions", OK_OR_EMPTY, lambda rng, state: (
+        "GET", "/recipes/suggestions", {"params": {"ingredients": rng.sample(state["ingredient_names"], 3)}}
+    ), None),
+    ("recipes.suggestions_cheapest", OK_OR_EMPTY, lambda rng, state: (
+        "GET", "/recipes/suggestions", {"params": {
+            "ingredients": rng.sample(state["ingredient_names"], 3), "sort": "cost", "limit": 10
+        }}
+    ), None),
+    ("meal_plans.get", OK_OR_EMPTY, lambda rng, state: (
+        "GET", "/meal-plans/", {"params": {"ingredients": rng.sample(state["ingredient_names"], 10), "meals": 7}}
+    ), None),
+    ("recipes.search", OK_OR_EMPTY, lambda rng, state: (
+        "GET", "/recipes/search", {"params": {"q": " ".join(rng.sample(state["ingredient_names"], 3))}}
+    ), None),
+    ("recipes.get_by_id", OK, lambda rng, state: (
+        "GET", f"/recipes/{rng.choice(state['recipe_ids'])}", {}
+    ), None),
+    ("recipes.highest_reviewed", OK_OR_EMPTY, lambda rng, state: (
+        "GET", "/recipes/highest-reviewed/", {}
+    ), None),
+    ("recipes.create", CREATED, lambda rng, state: (
+        "POST", "/recipes/", {"json": recipe_body(rng)}
+    ), lambda state, response: state["created_recipes"].append(response.json()["recipe_id"])),
+    ("recipes.update", OK, lambda rng, state: (
+        "PUT", f"/recipes/{state['created_recipes'][-1]}",
+        {"json": dict(recipe_body(rng), id=state["created_recipes"][-1])}
+    ), None),
+    ("recipes.delete", OK, lambda rng, state: (
+        "DELETE", f"/recipes/{state['created_recipes'].pop()}", {}
+    ), None),
+    ("reviews.get", OK, lambda rng, state: (
+        "GET", f"/reviews/{rng.choice(state['recipe_ids'])}", {}
+    ), None),
+    ("reviews.create", OK, lambda rng, state: (
+        "POST", f"/reviews/create/{rng.choice(state['recipe_ids'])}",
+        {"params": {"customer_id": rng.choice(state["customers"]), "rating": rng.randint(0, 5), "review": "benchmark"}}
+    ), lambda state, response: state["created_reviews"].append(response.json()["review_id"])),
+    ("reviews.delete", OK, lambda rng, state: (
+        "DELETE", f"/reviews/delete/{state['created_reviews'].pop()}", {}
+    ), None),
+    ("ingredients.get", OK_OR_EMPTY, lambda rng, state: (
+        "GET", "/ingredients/", {"params": {"name": rng.choice(state["ingredient_names"])}}
+    ), None),
+]
+
+
+def sample_state(db, sqlalchemy):
+    """ ids and names from the seeded database for the scenarios to pick from """
+
+    with db.engine.begin() as connection:
+        def column(query):
+            return list(connection.execute(sqlalchemy.text(query)).scalars())
+
+        return {
+            "customers": column("SELECT customer_id FROM customers ORDER BY customer_id LIMIT 1000"),
+            "recipe_ids": column("SELECT id FROM recipes ORDER BY id LIMIT 1000"),
+            "ingredient_ids": column("SELECT ingredient_id FROM ingredients ORDER BY ingredient_id LIMIT 1000"),
+            "ingredient_names": column("SELECT ingredient_name FROM ingredients ORDER BY ingredient_id LIMIT 1000"),
+            "supply_names": column("SELECT supply_name FROM supplies ORDER BY supply_id LIMIT 1000"),
+            "carts": [],
+            "filled_carts": set(),
+            "created_recipes": [],
+            "created_reviews": [],
+        }
+
+
+async def run_scenario(client, name, expected, build, collect, state, requests, concurrency, seed_value):
+    rng = random.Random(f"{seed_value}:{name}")
+    latencies = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            try:
+                method, url, kwargs = build(rng, state)
+            except IndexError:
+                # nothing created for it to use, the request could not be made at all
+                errors += 1
+                continue
+            started = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code not in expected:
+                errors += 1
+            elif collect:
+                collect(state, response)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    percentiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else (latencies or [0.0]) * 99
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": round(percentiles[49], 2),
+        "p95_ms": round(percentiles[94], 2),
+        "p99_ms": round(percentiles[98], 2),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+    }
+
+
+async def run(app, state, requests, concurrency, seed_value):
+    results = {}
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        for name, expected, build, collect in SCENARIOS:
+            results[name] = await run_scenario(
+                client, name, expected, build, collect, state, requests, concurrency, seed_value
+            )
+            print(f"{name:<28} p50 {results[name]['p50_ms']:>9.2f} ms  p95 {results[name]['p95_ms']:>9.2f} ms  "
+                  f"p99 {results[name]['p99_ms']:>9.2f} ms  {results[name]['throughput_rps']:>8.1f} req/s  "
+                  f"{results[name]['errors']} errors")
+    return results
+
+
+def failures(results):
+    """ messages for every endpoint with errors, an endpoint failing fast is not a fast endpoint """
+
+    return [f"{name}: {result['errors']} errors" for name, result in results.items() if result["errors"]]
+
+
+def regressions(results, baseline, threshold):
+    """ messages for every endpoint that got slower, or failed more often, than the baseline allows """
+
+    found = []
+    for name, before in baseline["endpoints"].items():
+        after = results.get(name)
+        if after is None:
+            continue
+        if after["errors"] > before.get("errors", 0):
+            found.append(f"{name}: errors {before.get('errors', 0)} -> {after['errors']}")
+        if after["p95_ms"] > before["p95_ms"] * (1 + threshold):
+            found.append(f"{name}: p95 {before['p95_ms']} ms -> {after['p95_ms']} ms")
+        if after["throughput_rps"] < before["throughput_rps"] * (1 - threshold):
+            found.append(f"{name}: throughput {before['throughput_rps']} -> {after['throughput_rps']} req/s")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every endpoint against a seeded local database")
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=365)
+    parser.add_argument("--zipf", type=float, default=0.0)
+    parser.add_argument("--no-seed", action="store_true", help="reuse the data already in the database")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--driver", choices=["sync", "async"], default="sync", help="database driver for the app")
+    parser.add_argument("--replica", action="append", default=[], help="read replica URL, repeatable")
+    parser.add_argument("--output", default="bench_output.json")
+    parser.add_argument("--baseline", help="earlier output to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--save-baseline", action="store_true", help="write this run to --baseline")
+    args = parser.parse_args()
+
+    url = seed.database_connection_url()
+    if not url:
+        sys.exit("LOCAL_POSTGRES_URI is not set")
+
+    if not args.no_seed:
+        for database_url in [url] + args.replica:
+            seed.seed_database(database_url, args.scale, args.seed, args.zipf, os.cpu_count(), seed.BATCH_SIZE)
+
+    # point the app at the local database before it creates its engine
+    os.environ["POSTGRES_URI"] = url
+    os.environ["POSTGRES_REPLICA_URIS"] = ",".join(args.replica)
+    os.environ["DATABASE_DRIVER"] = args.driver
+    sys.path.insert(0, str(ROOT))
+    from src import database as db
+    from src import metrics
+    from src.api import server
+    import sqlalchemy
+
+    server.load_indexes()
+    state = sample_state(db, sqlalchemy)
+    results = asyncio.run(run(server.app, state, args.requests, args.concurrency, args.seed))
+
+    engines = {
+        labels[0]: {"statements": count, "mean_ms": round(total / count * 1000, 3)}
+        for labels, (total, count) in sorted(metrics.statement_duration.totals().items())
+        if count
+    }
+    for name, engine in engines.items():
+        print(f"{name:<28} {engine['statements']:>9} statements  mean {engine['mean_ms']:>9.3f} ms")
+
+    report = {
+        "meta": {
+            "scale": args.scale,
+            "seed": args.seed,
+            "zipf": args.zipf,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "driver": args.driver,
+            "replicas": len(args.replica),
+        },
+        "endpoints": results,
+        "engines": engines,
+    }
+    Path(args.output).write_text(json.dumps(report, indent=2))
+
+    failed = failures(results)
+    if failed:
+        print("requests failed:")
+        for message in failed:
+            print(f"  {message}")
+
+    if args.baseline and (args.save_baseline or not Path(args.baseline).exists()):
+        if failed:
+            sys.exit(f"not saving a run with errors as the baseline {args.baseline}")
+        Path(args.baseline).write_text(json.dumps(report, indent=2))
+        if args.save_baseline:
+            print(f"baseline saved to {args.baseline}")
+        else:
+            print(f"there was no baseline at {args.baseline}, this run was saved as the baseline, nothing compared")
+    elif args.baseline:
+        found = regressions(results, json.loads(Path(args.baseline).read_text()), args.threshold)
+        if found:
+            print("regressions past the threshold:")
+            for message in found:
+                print(f"  {message}")
+            sys.exit(1)
+        print("no regressions")
+
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
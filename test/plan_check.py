@@ -0,0 +1,334 @@
+"""
+Query plan regression checks for the SQL the API runs.
+
+    python test/plan_check.py [--max-seq-scan-rows 10000] [--max-cost 25000]
+
+Every SQL string literal in SOURCES (src/api/*.py and the modules the
+endpoints run their hot SQL through) is bound to representative
+parameters and run under EXPLAIN (ANALYZE, FORMAT JSON) in a transaction
+that is rolled back, so writes are planned and executed but leave nothing
+behind. Each plan is checked for:
+
+- sequential scans of reviews or recipe_ingredients that actually read
+  more than --max-seq-scan-rows rows (the rows they returned and the rows
+  their filter removed, over all loops),
+- sorts that spilled to disk,
+- an estimated total cost above --max-cost, or above the statement's own
+  budget in COST_BUDGETS.
+
+Statements in WHOLE_TABLE read whole tables on purpose (the in-memory
+indexes loading at startup, maintenance jobs), only their sorts are checked.
+The ones in SKIPPED are not run.
+
+The parameters come from PARAMETERS, most of them looked up in the seeded
+database: ids are the busiest rows (the recipe with the most reviews, the
+cart with the most items), and limit is NULL like when a client does not
+page, so each statement is checked at its worst. A statement binding a
+parameter PARAMETERS does not know fails, add a value for it. Failing
+statements are printed with their parameters and full plan, and the script
+exits with status 1.
+
+Runs against the database at LOCAL_POSTGRES_URI as it is, seed it first
+with test/seed.py, --scale 1 for the thresholds to mean something.
+"""
+
+import argparse
+import ast
+import json
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+import sqlalchemy
+import seed
+
+ROOT = Path(__file__).resolve().parent.parent
+SOURCES = sorted((ROOT / "src" / "api").glob("*.py")) + [
+    ROOT / "src" / name for name in ("cart_totals.py", "ingredient_index.py", "pantry.py", "review_stats.py")
+]
+
+SQL = re.compile(r"^\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b")
+BIND = re.compile(r"(?<![:\w]):(\w+)")
+
+SEQ_SCAN_TABLES = ("reviews", "recipe_ingredients")
+MAX_SEQ_SCAN_ROWS = 10000
+MAX_COST = 25000
+# statements allowed more than MAX_COST, by "file:function"
+COST_BUDGETS: Dict[str, float] = {}
+# statements reading whole tables on purpose, by "file:function"
+WHOLE_TABLE = {
+    "cart_totals.py:<module>",
+    "ingredient_index.py:load",
+    "pantry.py:load",
+}
+# statements that cannot be planned on their own, by "file:function", with why
+SKIPPED = {
+    "review_stats.py:rebuild": "its INSERT relies on the DELETE before it in the same transaction",
+}
+
+
+class Lookup:
+    """ a parameter value read from the database """
+
+    def __init__(self, sql: str):
+        self.sql = sql
+
+
+BUSIEST_RECIPE = Lookup("SELECT recipe_id FROM reviews GROUP BY recipe_id ORDER BY count(*) DESC, recipe_id LIMIT 1")
+BUSIEST_RECIPES = Lookup(
+    "SELECT array_agg(recipe_id) FROM ("
+    "SELECT recipe_id FROM reviews GROUP BY recipe_id ORDER BY count(*) DESC, recipe_id LIMIT 50) AS busiest"
+)
+COMMON_INGREDIENTS = Lookup(
+    "SELECT array_agg(ingredient_id) FROM ("
+    "SELECT ingredient_id FROM recipe_ingredients GROUP BY ingredient_id ORDER BY count(*) DESC, ingredient_id LIMIT 20) AS common"
+)
+
+PARAMETERS: Dict[str, Any] = {
+    "id": BUSIEST_RECIPE,
+    "recipe_id": BUSIEST_RECIPE,
+    "desired_recipe_id": BUSIEST_RECIPE,
+    "recipe_ids": BUSIEST_RECIPES,
+    "ingredient_id": Lookup(
+        "SELECT ingredient_id FROM recipe_ingredients GROUP BY ingredient_id ORDER BY count(*) DESC, ingredient_id LIMIT 1"
+    ),
+    "ingredient_ids": COMMON_INGREDIENTS,
+    "missing_ids": COMMON_INGREDIENTS,
+    "item_ids": COMMON_INGREDIENTS,
+    "amount_units": Lookup("SELECT array_fill('1 cup'::text, ARRAY[20])"),
+    "supply_ids": Lookup(
+        "SELECT array_agg(supply_id) FROM ("
+        "SELECT supply_id FROM recipe_supplies GROUP BY supply_id ORDER BY count(*) DESC, supply_id LIMIT 10) AS common"
+    ),
+    "names": Lookup(
+        "SELECT array_agg(lower(ingredient_name)) FROM ("
+        "SELECT ingredient_id FROM recipe_ingredients GROUP BY ingredient_id ORDER BY count(*) DESC, ingredient_id LIMIT 20"
+        ") AS common JOIN ingredients USING (ingredient_id)"
+    ),
+    "prices": Lookup("SELECT array_fill(1.5::double precision, ARRAY[20])"),
+    "quantities": Lookup("SELECT array_fill(2, ARRAY[20])"),
+    "item_types": Lookup("SELECT array_fill('produce'::text, ARRAY[20])"),
+    "name": Lookup(
+        "SELECT ingredient_name FROM ingredients WHERE ingredient_id = ("
+        "SELECT ingredient_id FROM recipe_ingredients GROUP BY ingredient_id ORDER BY count(*) DESC, ingredient_id LIMIT 1)"
+    ),
+    "cart_id": Lookup("SELECT cart_id FROM cart_items GROUP BY cart_id ORDER BY count(*) DESC, cart_id LIMIT 1"),
+    "customer_id": Lookup(
+        "SELECT customer_id FROM reviews WHERE customer_id IS NOT NULL "
+        "GROUP BY customer_id ORDER BY count(*) DESC, customer_id LIMIT 1"
+    ),
+    "review_id": Lookup("SELECT max(review_id) FROM reviews"),
+    "customer_name": "Plan Check",
+    "instructions": "Mix everything and bake.",
+    "time": 30,
+    "difficulty": "easy",
+    "rating": 5,
+    "rating_counts": [0, 0, 0, 0, 0, 1],
+    "top_reviews": 3,
+    "review": "Would plan again",
+    "card_num": 4111111111111111,
+    "exp_date": "12/30",
+    "cvv": 123,
+    # the first page, unpaged
+    "after": None,
+    "after_recipe": None,
+    "after_recipe_id": None,
+    "after_row_num": None,
+    "limit": None,
+}
+
+# parameters meaning something else in a given function
+OVERRIDES: Dict[str, Dict[str, Any]] = {
+    # links a recipe does not have yet
+    "create_recipe": {
+        "ingredient_ids": Lookup(
+            f"SELECT array_agg(ingredient_id) FROM ("
+            f"SELECT ingredient_id FROM ingredients WHERE ingredient_id NOT IN ("
+            f"SELECT ingredient_id FROM recipe_ingredients WHERE recipe_id = ({BUSIEST_RECIPE.sql})"
+            f") ORDER BY ingredient_id LIMIT 20) AS unused"
+        ),
+        "supply_ids": Lookup(
+            f"SELECT array_agg(supply_id) FROM ("
+            f"SELECT supply_id FROM supplies WHERE supply_id NOT IN ("
+            f"SELECT supply_id FROM recipe_supplies WHERE recipe_id = ({BUSIEST_RECIPE.sql})"
+            f") ORDER BY supply_id LIMIT 10) AS unused"
+        ),
+    },
+    "resolve_supplies": {
+        "names": Lookup(
+            "SELECT array_agg(lower(supply_name)) FROM ("
+            "SELECT supply_id FROM recipe_supplies GROUP BY supply_id ORDER BY count(*) DESC, supply_id LIMIT 20"
+            ") AS common JOIN supplies USING (supply_id)"
+        ),
+    },
+}
+
+
+class Statement:
+    """ a SQL string literal found in SOURCES """
+
+    def __init__(self, path: Path, line: int, function: str, sql: str):
+        self.path = path
+        self.line = line
+        self.function = function
+        self.sql = sql
+
+    @property
+    def name(self) -> str:
+        return f"{self.path.name}:{self.function}"
+
+    @property
+    def location(self) -> str:
+        return f"{self.path.relative_to(ROOT)}:{self.line}"
+
+    @property
+    def binds(self) -> List[str]:
+        return list(dict.fromkeys(BIND.findall(self.sql)))
+
+
+def collect(paths: List[Path]) -> List[Statement]:
+    """ every SQL string literal in the given files, with the function it is in """
+
+    statements = []
+    for path in paths:
+        tree = ast.parse(path.read_text())
+        functions = [node for node in ast.walk(tree) if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))]
+        # strings standing on their own are docstrings, not queries, and the
+        # pieces of an f-string are not whole statements
+        skipped = {id(node.value) for node in ast.walk(tree) if isinstance(node, ast.Expr)}
+        skipped.update(
+            id(piece) for node in ast.walk(tree) if isinstance(node, ast.JoinedStr) for piece in node.values
+        )
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Constant) and isinstance(node.value, str) and SQL.match(node.value) \
+                    and id(node) not in skipped:
+                # the innermost function around the literal
+                enclosing = [
+                    function for function in functions
+                    if function.lineno <= node.lineno <= function.end_lineno
+                ]
+                function = max(enclosing, key=lambda function: function.lineno).name if enclosing else "<module>"
+                statements.append(Statement(path, node.lineno, function, node.value))
+    return sorted(statements, key=lambda statement: (statement.path, statement.line))
+
+
+def resolve(connection, value, cache: Dict[str, Any]):
+    if not isinstance(value, Lookup):
+        return value
+    if value.sql not in cache:
+        cache[value.sql] = connection.execute(sqlalchemy.text(value.sql)).scalar()
+    return cache[value.sql]
+
+
+def nodes(plan: Dict[str, Any]):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from nodes(child)
+
+
+def spilled(node: Dict[str, Any]) -> bool:
+    """ whether a sort node, plain or incremental, wrote to disk """
+
+    if node.get("Sort Space Type") == "Disk":
+        return True
+    return any(
+        isinstance(groups, dict) and groups.get("Sort Space Type") == "Disk"
+        for key, groups in node.items() if key.endswith("Groups")
+    )
+
+
+def rows_read(node: Dict[str, Any]) -> float:
+    """ rows an executed scan node read, those its filter removed included, over all its loops """
+    return (node.get("Actual Rows", 0) + node.get("Rows Removed by Filter", 0)) * node.get("Actual Loops", 1)
+
+
+def problems(plan: Dict[str, Any], max_seq_scan_rows: int, max_cost: float, whole_table: bool = False) -> List[str]:
+    found = []
+    for node in nodes(plan["Plan"]):
+        table = node.get("Relation Name")
+        if node["Node Type"] == "Seq Scan" and table in SEQ_SCAN_TABLES and not whole_table:
+            rows = rows_read(node)
+            if rows > max_seq_scan_rows:
+                found.append(f"sequential scan on {table} read {rows:.0f} rows, limit {max_seq_scan_rows}")
+        if spilled(node):
+            found.append(f"{node['Node Type']} spilled to disk")
+    cost = plan["Plan"]["Total Cost"]
+    if cost > max_cost and not whole_table:
+        found.append(f"estimated cost {cost:.1f} over the budget of {max_cost:.1f}")
+    return found
+
+
+def explain(connection, statement: Statement, params: Dict[str, Any]) -> Dict[str, Any]:
+    """ the executed plan of a statement, whatever it changed rolled back """
+
+    transaction = connection.begin()
+    try:
+        return connection.execute(
+            sqlalchemy.text("EXPLAIN (ANALYZE, FORMAT JSON) " + statement.sql), params
+        ).scalar()[0]
+    finally:
+        transaction.rollback()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the query plans of the SQL the API runs")
+    parser.add_argument("--max-seq-scan-rows", type=int, default=MAX_SEQ_SCAN_ROWS,
+                        help=f"rows a sequential scan of {' or '.join(SEQ_SCAN_TABLES)} may read")
+    parser.add_argument("--max-cost", type=float, default=MAX_COST, help="default estimated cost budget per statement")
+    args = parser.parse_args()
+
+    url = seed.database_connection_url()
+    if not url:
+        sys.exit("LOCAL_POSTGRES_URI is not set")
+
+    engine = sqlalchemy.create_engine(url)
+    statements = collect(SOURCES)
+    failures = 0
+    with engine.connect() as connection:
+        cache: Dict[str, Any] = {}
+
+        for statement in statements:
+            if statement.name in SKIPPED:
+                print(f"skip {statement.name:<45} {statement.location:<28} {SKIPPED[statement.name]}")
+                continue
+
+            values = {**PARAMETERS, **OVERRIDES.get(statement.function, {})}
+            unknown = [name for name in statement.binds if name not in values]
+            if unknown:
+                failures += 1
+                print(f"FAIL {statement.name:<45} {statement.location}")
+                print(f"     no representative value for {', '.join(':' + name for name in unknown)}, add one to PARAMETERS")
+                continue
+
+            params = {name: resolve(connection, values[name], cache) for name in statement.binds}
+            connection.commit()
+            started = time.perf_counter()
+            try:
+                plan = explain(connection, statement, params)
+            except sqlalchemy.exc.DBAPIError as error:
+                failures += 1
+                print(f"FAIL {statement.name:<45} {statement.location}")
+                print(f"     {error.orig}".rstrip())
+                continue
+            seconds = time.perf_counter() - started
+
+            max_cost = COST_BUDGETS.get(statement.name, args.max_cost)
+            found = problems(plan, args.max_seq_scan_rows, max_cost, statement.name in WHOLE_TABLE)
+            print(f"{'FAIL' if found else 'ok':<4} {statement.name:<45} {statement.location:<28} "
+                  f"cost {plan['Plan']['Total Cost']:>10.1f} {seconds * 1000:>9.1f} ms")
+            if found:
+                failures += 1
+                for problem in found:
+                    print(f"     {problem}")
+                print(f"     sql: {' '.join(statement.sql.split())}")
+                print(f"     params: {json.dumps(params, default=str)}")
+                print(json.dumps(plan, indent=2))
+
+    engine.dispose()
+    print(f"{len(statements)} statements, {failures} failed")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,386 @@
+"""
+Deterministic benchmark seeder.
+
+    python test/seed.py --scale 1 --seed 365 --workers 4 [--zipf 1.1]
+
+--scale 1 produces the ~1M row dataset from docs/performance_writeup.md.
+Every table is generated in numpy batches from its own random stream
+derived from --seed, so the same arguments always produce the same data,
+no matter how many worker processes generate the tables in parallel.
+The schema is built by running the migrations (`python -m src.migrate`)
+on the emptied database. The keys, foreign keys and indexes they built are
+then dropped, the batches are streamed into the bare tables with COPY FROM
+STDIN, every table at once, and the keys, indexes and foreign keys are
+built again from their catalog definitions after the load.
+
+With --zipf the recipes and ingredients are picked with Zipf-skewed
+popularity (the exponent, e.g. 1.1) instead of uniformly, so a few recipes
+collect most reviews and a few ingredients show up everywhere.
+
+Needs the development requirements: pip install -r requirements-dev.txt
+
+DO NOT RUN IN PRODUCTION: it drops and recreates every table in the
+database at LOCAL_POSTGRES_URI.
+"""
+
+import argparse
+import io
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import dotenv
+import numpy as np
+import sqlalchemy
+
+BASE_COUNTS = {
+    "customers": 70000,
+    "ingredients": 10000,
+    "recipes": 5000,
+    "recipe_ingredients": 150000,
+    "supplies": 10000,
+    "recipe_supplies": 100000,
+    "carts": 150000,
+    "cart_items": 250000,
+    "payments": 120000,
+    "reviews": 135000,
+}
+
+BATCH_SIZE = 50000
+
+WORDS = np.array("""
+    apple basil bean beef berry bread broth butter cabbage caramel carrot
+    cheese cherry chicken chili chive cinnamon citrus clove cocoa coconut cod
+    corn cream crisp crumb cumin curry dough egg fennel fig flour garlic
+    ginger glaze grain grape gravy herb honey kale lamb leek lemon lentil
+    lime maple melon milk mint mushroom mustard noodle nut oat olive onion
+    orange oregano paprika parsley pasta peach pear pepper pesto pickle pork
+    potato pumpkin radish raisin rice rosemary saffron sage salmon salsa salt
+    sauce sesame shrimp smoky soy spice spinach squash stew sugar syrup thyme
+    toast tofu tomato tuna turkey vanilla vinegar walnut wheat yam yeast
+    yogurt zest zucchini baked fried grilled roasted steamed fresh golden
+    quick hearty spicy sweet tangy crispy creamy rustic classic simple
+""".split())
+
+DIFFICULTIES = np.array(["easy", "medium", "hard"])
+
+# every table the migrations create, dropped before they run again
+TABLES = [
+    "carts",
+    "ingredients",
+    "cart_items",
+    "customers",
+    "payments",
+    "recipe_ingredients",
+    "recipe_supplies",
+    "supplies",
+    "recipes",
+    "reviews",
+    "recipe_review_stats",
+    "schema_migrations",
+]
+
+# the tables with generated rows, loaded all at once: their keys, foreign keys
+# and indexes are only built after the load
+LOADED_TABLES = [
+    "customers", "ingredients", "supplies", "recipes", "carts",
+    "recipe_ingredients", "recipe_supplies", "cart_items", "payments", "reviews",
+]
+
+IDENTITY_COLUMNS = [
+    ("customers", "customer_id"),
+    ("ingredients", "ingredient_id"),
+    ("supplies", "supply_id"),
+    ("recipes", "id"),
+    ("carts", "cart_id"),
+    ("payments", "payment_id"),
+    ("reviews", "review_id"),
+]
+
+
+def database_connection_url():
+    # DO NOT RUN IN PRODUCTION
+    dotenv.load_dotenv()
+    return os.environ.get("LOCAL_POSTGRES_URI")
+
+
+class Sampler:
+    """ draws ids in 1..n, uniformly or with Zipf-skewed popularity """
+
+    def __init__(self, n: int, zipf: float, seed: int, stream: int):
+        self.n = n
+        self.weights = None
+        if zipf:
+            # a fixed shuffle decides which ids are the popular ones
+            rng = np.random.default_rng([seed, stream])
+            ranks = rng.permutation(n) + 1
+            weights = 1.0 / ranks ** zipf
+            self.weights = weights / weights.sum()
+
+    def __call__(self, rng, size):
+        if self.weights is None:
+            return rng.integers(1, self.n + 1, size)
+        return rng.choice(self.n, size=size, p=self.weights) + 1
+
+
+def words(rng, rows: int, count: int) -> list:
+    picked = WORDS[rng.integers(0, len(WORDS), (rows, count))]
+    return [" ".join(row) for row in picked]
+
+
+def links(rng, owners: np.ndarray, per_owner: float, sample, bound: int):
+    """
+    Distinct (owner, item) pairs, about per_owner of them for each owner.
+    Owners of a batch are disjoint from other batches, so deduplicating
+    within the batch is enough.
+    """
+
+    counts = np.maximum(rng.poisson(per_owner, len(owners)), 1)
+    owner_ids = np.repeat(owners, counts)
+    item_ids = sample(rng, len(owner_ids))
+    pairs = np.unique(owner_ids * (bound + 1) + item_ids)
+    return pairs // (bound + 1), pairs % (bound + 1)
+
+
+class Generator:
+    """ produces the rows of every table, one batch of ids at a time """
+
+    def __init__(self, scale: float, seed: int, zipf: float):
+        self.seed = seed
+        self.counts = {table: max(int(count * scale), 1) for table, count in BASE_COUNTS.items()}
+        # sampler streams are numbered after the table streams so they never collide
+        self.recipes = Sampler(self.counts["recipes"], zipf, seed, len(BASE_COUNTS))
+        self.ingredients = Sampler(self.counts["ingredients"], zipf, seed, len(BASE_COUNTS) + 1)
+        self.customers = Sampler(self.counts["customers"], 0, seed, len(BASE_COUNTS) + 2)
+        self.supplies = Sampler(self.counts["supplies"], 0, seed, len(BASE_COUNTS) + 3)
+
+    def per(self, table: str, owner: str) -> float:
+        return self.counts[table] / self.counts[owner]
+
+    def customers_rows(self, rng, ids):
+        return ["customers", "customer_id, customer_name"], zip(ids, words(rng, len(ids), 2))
+
+    def ingredients_rows(self, rng, ids):
+        # names are unique (case insensitive), so number the words
+        names = [f"{name} {i}" for name, i in zip(words(rng, len(ids), 1), ids)]
+        prices = rng.integers(3, 16, len(ids))
+        return (["ingredients", "ingredient_id, ingredient_name, price, item_type"],
+                zip(ids, names, prices, words(rng, len(ids), 1)))
+
+    def supplies_rows(self, rng, ids):
+        names = [f"{name} {i}" for name, i in zip(words(rng, len(ids), 1), ids)]
+        return ["supplies", "supply_id, supply_name"], zip(ids, names)
+
+    def recipes_rows(self, rng, ids):
+        return (["recipes", 'id, name, instructions, difficulty, "time"'],
+                zip(ids, words(rng, len(ids), 4), words(rng, len(ids), 40),
+                    DIFFICULTIES[rng.integers(0, 3, len(ids))], rng.integers(10, 121, len(ids))))
+
+    def recipe_ingredients_rows(self, rng, ids):
+        recipe_ids, ingredient_ids = links(
+            rng, ids, self.per("recipe_ingredients", "recipes"), self.ingredients, self.counts["ingredients"]
+        )
+        amounts = [f"{amount} units" for amount in rng.integers(1, 6, len(recipe_ids))]
+        return (["recipe_ingredients", "recipe_id, ingredient_id, amount_units"],
+                zip(recipe_ids, ingredient_ids, amounts))
+
+    def recipe_supplies_rows(self, rng, ids):
+        recipe_ids, supply_ids = links(
+            rng, ids, self.per("recipe_supplies", "recipes"), self.supplies, self.counts["supplies"]
+        )
+        return ["recipe_supplies", "recipe_id, supply_id"], zip(recipe_ids, supply_ids)
+
+    def carts_rows(self, rng, ids):
+        return ["carts", "cart_id, customer_id"], zip(ids, self.customers(rng, len(ids)))
+
+    def cart_items_rows(self, rng, ids):
+        cart_ids, item_ids = links(
+            rng, ids, self.per("cart_items", "carts"), self.ingredients, self.counts["ingredients"]
+        )
+        return (["cart_items", "cart_id, item_id, quantity"],
+                zip(cart_ids, item_ids, rng.integers(1, 11, len(cart_ids))))
+
+    def payments_rows(self, rng, ids):
+        expirations = [f"{month:02d}/{year:02d}" for month, year in
+                       zip(rng.integers(1, 13, len(ids)), rng.integers(25, 33, len(ids)))]
+        return (["payments", "payment_id, card_num, exp_date, cvv, customer_id"],
+                zip(ids, rng.integers(4000000000000000, 5000000000000000, len(ids)), expirations,
+                    rng.integers(100, 1000, len(ids)), self.customers(rng, len(ids))))
+
+    def reviews_rows(self, rng, ids):
+        return (["reviews", "review_id, recipe_id, customer_id, rating, review"],
+                zip(ids, self.recipes(rng, len(ids)), self.customers(rng, len(ids)),
+                    rng.integers(1, 6, len(ids)), words(rng, len(ids), 15)))
+
+    # tables whose batches are made of owner ids rather than their own ids
+    OWNERS = {"recipe_ingredients": "recipes", "recipe_supplies": "recipes", "cart_items": "carts"}
+
+    def batches(self, table: str, batch_size: int):
+        """ (table, columns, rows) for each batch, every batch has its own random stream """
+
+        total = self.counts[self.OWNERS.get(table, table)]
+        if table in self.OWNERS:
+            # keep link batches to roughly batch_size rows
+            batch_size = max(int(batch_size / self.per(table, self.OWNERS[table])), 1)
+
+        table_number = list(BASE_COUNTS).index(table)
+        for batch, start in enumerate(range(1, total + 1, batch_size)):
+            rng = np.random.default_rng([self.seed, table_number, batch])
+            ids = np.arange(start, min(start + batch_size, total + 1))
+            (name, columns), rows = getattr(self, f"{table}_rows")(rng, ids)
+            yield name, columns, rows
+
+
+def copy_rows(cursor, table: str, columns: str, rows) -> int:
+    buffer = io.StringIO()
+    count = 0
+    for row in rows:
+        buffer.write("\t".join(map(str, row)))
+        buffer.write("\n")
+        count += 1
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN", buffer)
+    return count
+
+
+def load_table(url: str, table: str, scale: float, seed: int, zipf: float, batch_size: int):
+    """ generate and COPY one table, runs in a worker process """
+
+    started = time.perf_counter()
+    generator = Generator(scale, seed, zipf)
+    engine = sqlalchemy.create_engine(url)
+    rows = 0
+    with engine.begin() as connection:
+        cursor = connection.connection.cursor()
+        for name, columns, batch in generator.batches(table, batch_size):
+            rows += copy_rows(cursor, name, columns, batch)
+    engine.dispose()
+    return table, rows, time.perf_counter() - started
+
+
+def deferred_schema(connection):
+    """
+    The statements that drop the keys, foreign keys and indexes the migrations
+    built on the seeded tables, and the ones building them again, from their
+    definitions in the catalog. Foreign keys go first and come back last.
+    """
+
+    tables = [table for table in TABLES if table != "schema_migrations"]
+    constraints = connection.execute(sqlalchemy.text(
+        """
+        SELECT conrelid::regclass::text AS table_name, conname AS name, contype AS type,
+            pg_get_constraintdef(oid) AS definition
+        FROM pg_constraint
+        WHERE contype IN ('p', 'u', 'f')
+            AND conrelid = ANY(CAST(:tables AS regclass[]))
+        ORDER BY contype = 'f' DESC, conname
+        """
+    ), {"tables": tables}).all()
+    # indexes of their own, not the ones behind a primary key or unique constraint
+    indexes = connection.execute(sqlalchemy.text(
+        """
+        SELECT index_class.relname AS name, pg_get_indexdef(pg_index.indexrelid) AS definition
+        FROM pg_index
+        JOIN pg_class AS index_class ON index_class.oid = pg_index.indexrelid
+        WHERE pg_index.indrelid = ANY(CAST(:tables AS regclass[]))
+            AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE pg_constraint.conindid = pg_index.indexrelid)
+        ORDER BY index_class.relname
+        """
+    ), {"tables": tables}).all()
+
+    foreign_keys = [row for row in constraints if row.type == "f"]
+    keys = [row for row in constraints if row.type != "f"]
+    drop = (
+        [f'ALTER TABLE {row.table_name} DROP CONSTRAINT "{row.name}"' for row in foreign_keys]
+        + [f'DROP INDEX "{row.name}"' for row in indexes]
+        + [f'ALTER TABLE {row.table_name} DROP CONSTRAINT "{row.name}"' for row in keys]
+    )
+    create = (
+        [f'ALTER TABLE {row.table_name} ADD CONSTRAINT "{row.name}" {row.definition}' for row in keys]
+        + [row.definition for row in indexes]
+        + [f'ALTER TABLE {row.table_name} ADD CONSTRAINT "{row.name}" {row.definition}' for row in foreign_keys]
+    )
+    return drop, create
+
+
+def run_job(url: str, *job: str):
+    subprocess.run(
+        [sys.executable, "-m", *job],
+        cwd=Path(__file__).resolve().parent.parent,
+        env={**os.environ, "POSTGRES_URI": url},
+        check=True
+    )
+
+
+def seed_database(url: str, scale: float, seed: int, zipf: float, workers: int, batch_size: int):
+    engine = sqlalchemy.create_engine(url)
+    started = time.perf_counter()
+
+    with engine.begin() as connection:
+        for table in TABLES:
+            connection.execute(sqlalchemy.text(f"DROP TABLE IF EXISTS {table} CASCADE"))
+
+    # the schema comes from the migrations, like any other deployment's, but
+    # COPY is much faster into bare tables: the keys, foreign keys and indexes
+    # they built are dropped for the load and built again afterwards
+    run_job(url, "src.migrate")
+    with engine.begin() as connection:
+        drop, create = deferred_schema(connection)
+        for statement in drop:
+            connection.execute(sqlalchemy.text(statement))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        loads = [
+            pool.submit(load_table, url, table, scale, seed, zipf, batch_size)
+            for table in LOADED_TABLES
+        ]
+        for load in loads:
+            table, rows, seconds = load.result()
+            print(f"{table:<20} {rows:>10} rows {seconds:8.2f}s")
+
+    index_started = time.perf_counter()
+    with engine.begin() as connection:
+        for statement in create:
+            connection.execute(sqlalchemy.text(statement))
+    print(f"{'keys and indexes':<20} {len(create):>10} built {time.perf_counter() - index_started:6.2f}s")
+
+    analyze_started = time.perf_counter()
+    with engine.begin() as connection:
+        # ids were given explicitly, move the identity sequences past them
+        for table, column in IDENTITY_COLUMNS:
+            connection.execute(sqlalchemy.text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', '{column}'), "
+                f"COALESCE((SELECT MAX({column}) FROM {table}), 0) + 1, false)"
+            ))
+        # cart lines are priced at the ingredient's price, like setting their quantity does
+        connection.execute(sqlalchemy.text(
+            "UPDATE cart_items SET price = COALESCE(ingredients.price, 0) "
+            "FROM ingredients WHERE ingredients.ingredient_id = cart_items.item_id"
+        ))
+        connection.execute(sqlalchemy.text("ANALYZE"))
+    print(f"{'analyze':<20} {'':>15} {time.perf_counter() - analyze_started:8.2f}s")
+
+    # the review aggregates and cart totals are derived data, rebuild them
+    run_job(url, "src.review_stats")
+    run_job(url, "src.cart_totals", "--repair")
+
+    engine.dispose()
+    print(f"{'total':<20} {'':>15} {time.perf_counter() - started:8.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed a local benchmark database")
+    parser.add_argument("--scale", type=float, default=1.0, help="1.0 is the ~1M row dataset")
+    parser.add_argument("--seed", type=int, default=365)
+    parser.add_argument("--zipf", type=float, default=0.0, help="Zipf exponent for recipe and ingredient popularity, 0 for uniform")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    url = database_connection_url()
+    if not url:
+        sys.exit("LOCAL_POSTGRES_URI is not set")
+
+    seed_database(url, args.scale, args.seed, args.zipf, args.workers, args.batch_size)
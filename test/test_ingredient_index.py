@@ -0,0 +1,163 @@
+import random
+import pytest
+from src.ingredient_index import IngredientIndex, SIMILARITY_THRESHOLD, SUGGESTION_SORTS, word_grams
+
+SYLLABLES = ["ba", "na", "to", "ma", "sa", "lt", "eg", "g", "oil", "ve"]
+
+
+def random_name(rng: random.Random) -> str:
+    words = ["".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 3))) for _ in range(rng.randint(1, 2))]
+    name = " ".join(words)
+    # the index normalizes, so give it the odd capital and stray space
+    if rng.random() < 0.2:
+        name = name.title()
+    if rng.random() < 0.1:
+        name = " " + name + " "
+    return name
+
+
+def random_catalog(seed: int, ingredients: int = 40, recipes: int = 60):
+    """ an index of random recipes, and the same recipes kept plainly for the brute-force answers """
+
+    rng = random.Random(seed)
+    names = {ingredient_id: random_name(rng) for ingredient_id in range(1, ingredients + 1)}
+    prices = {ingredient_id: rng.choice([None, 0.0, 1.0, 2.0, 5.0]) for ingredient_id in names}
+    index = IngredientIndex()
+    index.set_prices(prices)
+    needs = {}
+    added = set()
+    for recipe_id in range(1, recipes + 1):
+        chosen = rng.sample(sorted(names), rng.randint(1, 6))
+        needs[recipe_id] = set(chosen)
+        added.update(chosen)
+        index.set_recipe(recipe_id, {ingredient_id: names[ingredient_id] for ingredient_id in chosen})
+
+    # rewrite and remove a few, the index has to forget what they used
+    for recipe_id in rng.sample(sorted(needs), 10):
+        if rng.random() < 0.5:
+            index.remove_recipe(recipe_id)
+            del needs[recipe_id]
+        else:
+            chosen = rng.sample(sorted(names), rng.randint(1, 6))
+            needs[recipe_id] = set(chosen)
+            added.update(chosen)
+            index.set_recipe(recipe_id, {ingredient_id: names[ingredient_id] for ingredient_id in chosen})
+
+    # prices change after the recipes are in
+    changed = {ingredient_id: rng.choice([None, 3.0, 4.0]) for ingredient_id in rng.sample(sorted(names), 5)}
+    index.set_prices(changed)
+    prices.update(changed)
+
+    # only ingredients some recipe used get a name, and keep it after the recipe is gone
+    named = {ingredient_id: names[ingredient_id].strip().lower() for ingredient_id in added}
+    return index, rng, named, prices, needs
+
+
+def brute_suggest(names, prices, needs, patterns, sort, limit, max_missing):
+    patterns = {pattern.strip().lower() for pattern in patterns}
+    owned = {ingredient_id for ingredient_id, name in names.items() if name in patterns}
+
+    ranked = []
+    for recipe_id, ingredients in needs.items():
+        if not any(pattern in names[ingredient_id] for ingredient_id in ingredients for pattern in patterns):
+            continue
+        missing = ingredients - owned
+        if not missing or (max_missing is not None and len(missing) > max_missing):
+            continue
+        have = len(ingredients) - len(missing)
+        key = {
+            "id": (recipe_id,),
+            "missing": (len(missing), recipe_id),
+            "cost": (sum(prices[ingredient_id] or 0 for ingredient_id in missing), len(missing), recipe_id),
+            "coverage": (-have / len(ingredients), len(missing), recipe_id),
+        }[sort]
+        ranked.append((key, recipe_id, missing))
+
+    ranked.sort()
+    if limit is not None:
+        ranked = ranked[:limit]
+    return [(recipe_id, missing) for _, recipe_id, missing in ranked]
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_suggest_matches_brute_force(seed):
+    index, rng, names, prices, needs = random_catalog(seed)
+    known = sorted(set().union(*needs.values()))
+
+    for _ in range(20):
+        patterns = []
+        for _ in range(rng.randint(1, 3)):
+            name = names[rng.choice(known)]
+            # whole names are owned, pieces of names only match
+            if rng.random() < 0.5:
+                start = rng.randrange(len(name))
+                name = name[start:start + rng.randint(1, 5)]
+            patterns.append(name.upper() if rng.random() < 0.2 else name)
+        sort = rng.choice(SUGGESTION_SORTS)
+        limit = rng.choice([None, 1, 3, 10])
+        max_missing = rng.choice([None, 1, 2, 4])
+
+        found = index.suggest(patterns, sort=sort, limit=limit, max_missing=max_missing)
+
+        assert found == brute_suggest(names, prices, needs, patterns, sort, limit, max_missing), (patterns, sort, limit, max_missing)
+
+
+def test_suggest_ignores_removed_recipes_and_complete_ones():
+    index = IngredientIndex()
+    index.set_recipe(1, {1: "Egg", 2: "Salt"})
+    index.set_recipe(2, {1: "egg"})
+    index.set_recipe(3, {1: "egg", 3: "milk"})
+    index.remove_recipe(3)
+
+    # recipe 2 needs nothing the user does not have
+    assert index.suggest(["egg"]) == [(1, {2})]
+    assert index.recipes_using(3) == set()
+    assert index.ingredient_ids([" EGG "]) == {1}
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_complete_matches_brute_force(seed):
+    index, rng, names, _, _ = random_catalog(seed)
+    known = sorted(names)
+
+    for _ in range(20):
+        name = names[rng.choice(known)]
+        text = name[:rng.randint(0, len(name))]
+        if rng.random() < 0.3:
+            # a typo: one character swapped for another
+            position = rng.randrange(len(name))
+            text = name[:position] + rng.choice("abz ") + name[position + 1:]
+        limit = rng.randint(1, 12)
+        fuzzy = rng.random() < 0.5
+
+        prefixed = sorted(
+            (names[ingredient_id], ingredient_id)
+            for ingredient_id in known
+            if names[ingredient_id].startswith(text.strip().lower())
+        )
+        expected = [(ingredient_id, name) for name, ingredient_id in prefixed][:limit]
+        if fuzzy and len(expected) < limit:
+            query = word_grams(text.strip().lower())
+            taken = {ingredient_id for ingredient_id, _ in expected}
+            similar = []
+            for ingredient_id in known:
+                name_grams = word_grams(names[ingredient_id])
+                similarity = len(query & name_grams) / len(query | name_grams) if query else 0
+                if query & name_grams and similarity >= SIMILARITY_THRESHOLD and ingredient_id not in taken:
+                    similar.append((-similarity, names[ingredient_id], ingredient_id))
+            expected += [(ingredient_id, name) for _, name, ingredient_id in sorted(similar)[:limit - len(expected)]]
+
+        assert index.complete(text, limit, fuzzy=fuzzy) == expected, (text, limit, fuzzy)
+
+
+def test_snapshot_costs_follow_price_changes():
+    index = IngredientIndex()
+    index.set_prices({1: 2.0, 2: None})
+    index.set_recipe(1, {1: "egg", 2: "salt", 3: "milk"})
+    index.set_prices({3: 4.0})
+
+    ingredients, costs, prices = index.snapshot([1, 2])
+
+    assert ingredients == {1: {1, 2, 3}}
+    assert costs == {1: 6.0}
+    assert prices == {1: 2.0, 2: None, 3: 4.0}
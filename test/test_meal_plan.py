@@ -0,0 +1,116 @@
+import itertools
+import random
+import time
+import pytest
+from src import ingredient_index, meal_plan, pantry
+from src.ingredient_index import IngredientIndex
+from src.pantry import PantryMatcher
+
+
+@pytest.fixture
+def catalog(monkeypatch):
+    """ fills fresh in-memory indexes with random recipes, returns their ingredients and the prices """
+
+    monkeypatch.setattr(ingredient_index, "index", IngredientIndex())
+    monkeypatch.setattr(pantry, "matcher", PantryMatcher())
+
+    def fill(seed: int, recipes: int, ingredients: int):
+        rng = random.Random(seed)
+        # whole prices, so sums in any order agree and ties are real ties
+        prices = {ingredient_id: float(rng.randint(0, 9)) for ingredient_id in range(1, ingredients + 1)}
+        names = {ingredient_id: f"ingredient {ingredient_id}" for ingredient_id in prices}
+        needs = {}
+        for recipe_id in range(1, recipes + 1):
+            chosen = rng.sample(sorted(prices), rng.randint(1, 5))
+            needs[recipe_id] = set(chosen)
+            ingredient_index.index.set_recipe(recipe_id, {ingredient_id: names[ingredient_id] for ingredient_id in chosen})
+            pantry.matcher.set_recipe(recipe_id, "easy", [names[ingredient_id] for ingredient_id in chosen], [])
+        ingredient_index.index.set_prices(prices)
+        return needs, prices
+
+    return fill
+
+
+def key(recipe_ids, needs, prices, owned):
+    """ what the planner minimizes: cost to buy, then minus the ingredient uses that need nothing new """
+
+    bought = set().union(*(needs[recipe_id] for recipe_id in recipe_ids)) - owned
+    uses = sum(len(needs[recipe_id]) for recipe_id in recipe_ids)
+    return sum(prices[ingredient_id] for ingredient_id in bought), len(bought) - uses
+
+
+def greedy(needs, prices, owned, meals):
+    """ the greedy plan, every marginal cost worked out from scratch at each step """
+
+    planned, needed = [], set()
+    while len(planned) < meals and len(planned) < len(needs):
+        def marginal(recipe_id):
+            new = needs[recipe_id] - owned - needed
+            return sum(prices[ingredient_id] for ingredient_id in new), len(new) - len(needs[recipe_id]), recipe_id
+
+        best = min((recipe_id for recipe_id in needs if recipe_id not in planned), key=marginal)
+        planned.append(best)
+        needed |= needs[best]
+    return planned
+
+
+def owned_ids(names):
+    return {int(name.split()[1]) for name in names}
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_no_budget_returns_the_greedy_plan(catalog, seed):
+    needs, prices = catalog(seed, recipes=60, ingredients=30)
+    pantry_names = ["ingredient 1", "ingredient 2", "ingredient 3"]
+
+    found = meal_plan.plan(pantry_names, 5, time_budget_ms=0)
+
+    assert sorted(found.recipe_ids) == sorted(greedy(needs, prices, owned_ids(pantry_names), 5))
+    assert not found.complete
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_search_is_never_worse_than_greedy(catalog, seed):
+    needs, prices = catalog(seed, recipes=60, ingredients=30)
+    pantry_names = ["ingredient 4", "ingredient 5"]
+    owned = owned_ids(pantry_names)
+
+    found = meal_plan.plan(pantry_names, 5, time_budget_ms=5000)
+
+    assert found.complete
+    assert len(found.recipe_ids) == 5
+    assert key(found.recipe_ids, needs, prices, owned) <= key(greedy(needs, prices, owned, 5), needs, prices, owned)
+    assert found.cost == key(found.recipe_ids, needs, prices, owned)[0]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_finds_the_best_plan_of_small_catalogs(catalog, seed):
+    needs, prices = catalog(seed, recipes=9, ingredients=12)
+    owned = owned_ids(["ingredient 1"])
+
+    found = meal_plan.plan(["ingredient 1"], 3, time_budget_ms=5000)
+    best = min(key(combination, needs, prices, owned) for combination in itertools.combinations(needs, 3))
+
+    assert key(found.recipe_ids, needs, prices, owned) == best
+
+
+def test_same_request_same_plan(catalog):
+    catalog(3, recipes=400, ingredients=80)
+
+    plans = [meal_plan.plan(["ingredient 7", "ingredient 9"], 7, time_budget_ms=5000) for _ in range(2)]
+
+    assert plans[0].complete and plans[1].complete
+    assert plans[0].recipe_ids == plans[1].recipe_ids
+    assert plans[0].cost == plans[1].cost
+
+
+def test_stops_at_the_time_budget(catalog):
+    catalog(4, recipes=3000, ingredients=400)
+
+    started = time.perf_counter()
+    found = meal_plan.plan([], meal_plan.MAX_MEALS, time_budget_ms=20)
+    elapsed = time.perf_counter() - started
+
+    assert len(found.recipe_ids) == meal_plan.MAX_MEALS
+    # the greedy plan is always finished, the search gets what is left of the budget
+    assert elapsed < 0.02 + 0.5
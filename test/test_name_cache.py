@@ -0,0 +1,53 @@
+import random
+from collections import OrderedDict
+from src.name_cache import NameCache
+
+
+def cache(capacity: int) -> NameCache:
+    return NameCache("test", "ingredients", "ingredient_id", "ingredient_name", capacity=capacity)
+
+
+def test_hits_and_misses():
+    names = cache(10)
+    names.put_many({"egg": 1, "salt": 2})
+
+    assert names.get_many(["egg", "milk", "salt", "milk"]) == {"egg": 1, "salt": 2}
+    # repeated names count once
+    assert (names.hits, names.misses) == (2, 1)
+    assert names.hit_rate() == 2 / 3
+
+
+def test_evicts_the_least_recently_used():
+    names = cache(3)
+    names.put_many({"egg": 1, "salt": 2, "milk": 3})
+    names.get_many(["egg"])
+    names.put_many({"flour": 4})
+
+    assert names.get_many(["egg", "salt", "milk", "flour"]) == {"egg": 1, "milk": 3, "flour": 4}
+
+
+def test_matches_a_reference_lru():
+    rng = random.Random(0)
+    names = cache(20)
+    reference = OrderedDict()
+    vocabulary = [f"name {number}" for number in range(60)]
+
+    for _ in range(2000):
+        chosen = rng.sample(vocabulary, rng.randint(1, 8))
+        if rng.random() < 0.5:
+            expected = {}
+            for name in chosen:
+                if name in reference:
+                    reference.move_to_end(name)
+                    expected[name] = reference[name]
+            assert names.get_many(chosen) == expected
+        else:
+            ids = {name: vocabulary.index(name) for name in chosen}
+            names.put_many(ids)
+            for name, row_id in ids.items():
+                reference[name] = row_id
+                reference.move_to_end(name)
+            while len(reference) > 20:
+                reference.popitem(last=False)
+
+    assert names.get_many(vocabulary) == dict(reference)
@@ -0,0 +1,99 @@
+import random
+import pytest
+from src.pantry import PantryMatcher, normalize
+
+INGREDIENTS = [f"ingredient {number}" for number in range(40)]
+SUPPLIES = [f"supply {number}" for number in range(12)]
+DIFFICULTIES = ["easy", "medium", "hard", None]
+
+
+def brute_force(recipes, ingredients=None, difficulty=None, supplies=None, all_supplies=False):
+    """ what match() should return, straight from the recipes """
+
+    pantry = None if ingredients is None else {normalize(name) for name in ingredients}
+    owned = None if supplies is None else {normalize(name) for name in supplies}
+    found = []
+    for recipe_id, (recipe_difficulty, needed, tools) in recipes.items():
+        if difficulty is not None and recipe_difficulty != difficulty:
+            continue
+        if pantry is not None and not needed & pantry:
+            continue
+        if owned is not None and not (tools <= owned if all_supplies else tools & owned):
+            continue
+        coverage = None if pantry is None else len(needed & pantry) / len(needed)
+        found.append((recipe_id, coverage))
+    return sorted(found)
+
+
+def random_recipe(rng):
+    ingredients = rng.sample(INGREDIENTS, rng.randint(0, 6))
+    supplies = rng.sample(SUPPLIES, rng.randint(0, 3))
+    # the endpoints pass names as they were written
+    ingredients = [name.upper() if rng.random() < 0.2 else name for name in ingredients]
+    return rng.choice(DIFFICULTIES), ingredients, supplies
+
+
+def random_query(rng):
+    query = {}
+    if rng.random() < 0.7:
+        query["ingredients"] = rng.sample(INGREDIENTS, rng.randint(0, 8)) + ["not an ingredient"]
+    if rng.random() < 0.3:
+        query["difficulty"] = rng.choice(DIFFICULTIES[:3])
+    if rng.random() < 0.5:
+        query["supplies"] = rng.sample(SUPPLIES, rng.randint(0, 8))
+        query["all_supplies"] = rng.random() < 0.5
+    return query
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_brute_force_through_updates_and_deletes(seed):
+    rng = random.Random(seed)
+    matcher = PantryMatcher()
+    recipes = {}
+
+    for _ in range(600):
+        recipe_id = rng.randint(1, 80)
+        if rng.random() < 0.3:
+            matcher.remove_recipe(recipe_id)
+            recipes.pop(recipe_id, None)
+        else:
+            difficulty, ingredients, supplies = random_recipe(rng)
+            matcher.set_recipe(recipe_id, difficulty, ingredients, supplies)
+            recipes[recipe_id] = (difficulty, {normalize(name) for name in ingredients}, set(supplies))
+
+        query = random_query(rng)
+        assert matcher.match(**query) == brute_force(recipes, **query)
+
+
+def test_removed_slots_are_reused():
+    rng = random.Random(7)
+    matcher = PantryMatcher()
+    live = set()
+    most_live = 0
+
+    for _ in range(5000):
+        recipe_id = rng.randint(1, 300)
+        if rng.random() < 0.4:
+            matcher.remove_recipe(recipe_id)
+            live.discard(recipe_id)
+        else:
+            matcher.set_recipe(recipe_id, *random_recipe(rng))
+            live.add(recipe_id)
+        most_live = max(most_live, len(live))
+
+    assert len(matcher._recipe_ids) == most_live
+    # nothing of the removed recipes is left behind in the per name bitsets
+    every_slot = 0
+    for recipes in matcher._recipes_by_ingredient.values():
+        every_slot |= recipes
+    assert every_slot & ~matcher._live == 0
+
+
+def test_all_supplies_keeps_recipes_without_supplies():
+    matcher = PantryMatcher()
+    matcher.set_recipe(1, "easy", ["egg"], [])
+    matcher.set_recipe(2, "easy", ["egg"], ["Pan"])
+    matcher.set_recipe(3, "easy", ["egg"], ["pan", "whisk"])
+
+    assert matcher.match(supplies=[" pan "], all_supplies=True) == [(1, None), (2, None)]
+    assert matcher.match(supplies=[], all_supplies=True) == [(1, None)]
@@ -0,0 +1,97 @@
+import random
+from src import recipe_cache
+from src.recipe_cache import RecipeCache
+
+
+def test_stores_and_serves_bodies():
+    cache = RecipeCache()
+    cache.put(1, cache.version(1), b'{"id": 1}', '"a"')
+
+    assert cache.get(1) == (b'{"id": 1}', '"a"')
+    assert cache.get(2) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_read_racing_an_invalidation_is_not_stored():
+    cache = RecipeCache()
+    version = cache.version(1)
+    cache.invalidate(1)
+    cache.put(1, version, b"old", '"old"')
+    assert cache.get(1) is None
+
+    # other recipes and reads started after the invalidation are stored
+    cache.put(2, version, b"two", '"two"')
+    cache.put(1, cache.version(1), b"new", '"new"')
+    assert cache.get(1) == (b"new", '"new"')
+    assert cache.get(2) == (b"two", '"two"')
+
+
+def test_forgotten_recipes_are_not_tracked():
+    cache = RecipeCache()
+    for recipe_id in range(100):
+        cache.invalidate(recipe_id)
+    version = cache.version(5)
+    for recipe_id in range(100):
+        cache.forget(recipe_id)
+
+    assert cache.stats()["tracked"] == 0
+    # a read that started before the delete still cannot store the old body
+    cache.put(5, version, b"deleted", '"deleted"')
+    assert cache.get(5) is None
+
+
+def test_matches_a_model_through_random_operations():
+    rng = random.Random(3)
+    cache = RecipeCache(memory_budget=40)
+    current = {}
+    pending = []
+
+    for _ in range(3000):
+        recipe_id = rng.randint(1, 10)
+        action = rng.random()
+        if action < 0.3:
+            # a read starts, it stores what the recipe was at that point later on
+            pending.append((recipe_id, cache.version(recipe_id), current.get(recipe_id)))
+        elif action < 0.5 and pending:
+            read_id, version, body = pending.pop(rng.randrange(len(pending)))
+            if body is not None:
+                cache.put(read_id, version, body, '"etag"')
+        elif action < 0.7:
+            current[recipe_id] = f"{recipe_id}:{rng.random():.6f}".encode()
+            cache.invalidate(recipe_id)
+        elif action < 0.8:
+            current.pop(recipe_id, None)
+            cache.forget(recipe_id)
+        else:
+            found = cache.get(recipe_id)
+            if found is not None:
+                # never a body the recipe no longer has
+                assert found[0] == current.get(recipe_id)
+
+        assert cache.size <= 40
+        assert cache.stats()["tracked"] <= len(current)
+
+
+def test_evicts_least_recently_used_over_budget():
+    cache = RecipeCache(memory_budget=10)
+    cache.put(1, 0, b"aaaa", '"1"')
+    cache.put(2, 0, b"bbbb", '"2"')
+    cache.get(1)
+    cache.put(3, 0, b"cccc", '"3"')
+
+    assert cache.get(2) is None
+    assert cache.get(1) is not None and cache.get(3) is not None
+    assert cache.evictions == 1
+
+
+def test_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(recipe_cache.time, "monotonic", lambda: now[0])
+    cache = RecipeCache(ttl=30)
+    cache.put(1, 0, b"body", '"1"')
+
+    now[0] += 29
+    assert cache.get(1) is not None
+    now[0] += 2
+    assert cache.get(1) is None
+    assert cache.size == 0
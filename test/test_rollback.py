@@ -0,0 +1,162 @@
+"""
+A transaction that rolls back must leave the in-memory indexes as they were.
+Runs the recipe endpoints against the database in POSTGRES_URI, skipped
+without one.
+"""
+
+import copy
+import inspect
+import os
+import uuid
+import anyio
+import dotenv
+import pytest
+import sqlalchemy
+
+dotenv.load_dotenv()
+if not os.environ.get("POSTGRES_URI"):
+    pytest.skip("needs a migrated database in POSTGRES_URI", allow_module_level=True)
+
+from src import database as db
+from src import ingredient_index, name_cache, pantry, recipe_cache, search_index
+from src.api import recipes
+
+
+class Rollback(Exception):
+    pass
+
+
+def call(endpoint, **kwargs):
+    result = endpoint(**kwargs)
+    if inspect.isawaitable(result):
+        async def wait():
+            try:
+                return await result
+            finally:
+                # asyncpg connections belong to the event loop, every call gets a new one
+                for engine in [db.async_engine] + db.async_replica_engines:
+                    await engine.dispose()
+        return anyio.run(wait)
+    return result
+
+
+def state():
+    """ everything the indexes and caches hold, but their locks and hit counters """
+
+    indexes = {
+        "ingredient_index": ingredient_index.index,
+        "search_index": search_index.index,
+        "pantry": pantry.matcher,
+        "recipe_cache": recipe_cache.cache,
+        "ingredient_names": name_cache.ingredients,
+        "supply_names": name_cache.supplies,
+    }
+    return {
+        name: copy.deepcopy({
+            field: value for field, value in vars(index).items()
+            if field not in ("_lock", "hits", "misses")
+        })
+        for name, index in indexes.items()
+    }
+
+
+@pytest.fixture
+def indexes(monkeypatch):
+    """ fresh indexes and caches, the endpoints update them like the app's """
+
+    monkeypatch.setattr(ingredient_index, "index", ingredient_index.IngredientIndex())
+    monkeypatch.setattr(search_index, "index", search_index.SearchIndex())
+    monkeypatch.setattr(pantry, "matcher", pantry.PantryMatcher())
+    monkeypatch.setattr(recipe_cache, "cache", recipe_cache.RecipeCache())
+    monkeypatch.setattr(
+        name_cache, "ingredients", name_cache.NameCache("ingredients", "ingredients", "ingredient_id", "ingredient_name")
+    )
+    monkeypatch.setattr(name_cache, "supplies", name_cache.NameCache("supplies", "supplies", "supply_id", "supply_name"))
+
+
+@pytest.fixture
+def recipe(indexes):
+    """ a committed recipe with ingredients and supplies of its own, removed afterwards """
+
+    tag = f"rollback test {uuid.uuid4().hex[:8]}"
+    created = call(recipes.create_recipe, recipe=recipes.CreateRecipe(
+        name=tag,
+        instructions=f"{tag} instructions",
+        time=5,
+        difficulty="easy",
+        ingredients=[recipes.Ingredient(name=f"{tag} egg", amount_units="1", price=1.5, item_type="dairy")],
+        supplies=[recipes.Supply(supply_name=f"{tag} pan")]
+    ))
+
+    yield created["recipe_id"], tag
+
+    with db.engine.begin() as connection:
+        connection.execute(sqlalchemy.text("DELETE FROM recipes WHERE id = :id"), {"id": created["recipe_id"]})
+        connection.execute(sqlalchemy.text(
+            "DELETE FROM ingredients WHERE ingredient_name LIKE :tag"
+        ), {"tag": f"{tag}%"})
+        connection.execute(sqlalchemy.text(
+            "DELETE FROM supplies WHERE supply_name LIKE :tag"
+        ), {"tag": f"{tag}%"})
+
+
+@pytest.fixture
+def failing_commit(monkeypatch):
+    """ the handler runs to the end, then its transaction rolls back """
+
+    run = db._run
+
+    def run_then_fail(*args):
+        run(*args)
+        raise Rollback()
+
+    monkeypatch.setattr(db, "_run", run_then_fail)
+
+
+def changed_recipe(tag: str, **fields) -> dict:
+    recipe = dict(
+        name=f"{tag} renamed",
+        instructions=f"{tag} rewritten",
+        time=7,
+        difficulty="hard",
+        ingredients=[recipes.Ingredient(name=f"{tag} new flour", amount_units="2", price=3.0, item_type="dry")],
+        supplies=[recipes.Supply(supply_name=f"{tag} new bowl")]
+    )
+    recipe.update(fields)
+    return recipe
+
+
+def test_rolled_back_writes_leave_the_indexes_unchanged(recipe, request):
+    recipe_id, tag = recipe
+    before = state()
+    request.getfixturevalue("failing_commit")
+
+    with pytest.raises(Rollback):
+        call(recipes.create_recipe, recipe=recipes.CreateRecipe(**changed_recipe(tag)))
+    with pytest.raises(Rollback):
+        call(recipes.update_recipe, id=recipe_id, recipe=recipes.Recipe(id=recipe_id, **changed_recipe(tag)))
+    with pytest.raises(Rollback):
+        call(recipes.delete_recipe, id=recipe_id)
+
+    assert state() == before
+    # and the database agrees with them
+    with db.engine.begin() as connection:
+        name = connection.execute(
+            sqlalchemy.text("SELECT name FROM recipes WHERE id = :id"), {"id": recipe_id}
+        ).scalar_one()
+        new_ingredients = connection.execute(sqlalchemy.text(
+            "SELECT count(*) FROM ingredients WHERE ingredient_name LIKE :tag"
+        ), {"tag": f"{tag} new%"}).scalar_one()
+    assert name == tag
+    assert new_ingredients == 0
+
+
+def test_committed_writes_reach_the_indexes(recipe):
+    recipe_id, tag = recipe
+
+    call(recipes.update_recipe, id=recipe_id, recipe=recipes.Recipe(id=recipe_id, **changed_recipe(tag)))
+
+    assert [found for found, _ in search_index.index.search(f"{tag} renamed", 1)] == [recipe_id]
+    assert ingredient_index.index.recipes_using(*ingredient_index.index.ingredient_ids([f"{tag} new flour"])) == {recipe_id}
+    assert [found for found, _ in pantry.matcher.match(ingredients=[f"{tag} new flour"])] == [recipe_id]
+    assert list(name_cache.ingredients.get_many([f"{tag} new flour"])) == [f"{tag} new flour"]
@@ -0,0 +1,91 @@
+import math
+import random
+from collections import Counter
+import pytest
+from src.search_index import B, K1, NAME_WEIGHT, SearchIndex, terms
+
+WORDS = ["egg", "eggs", "salt", "pasta", "pastas", "glass", "tomato", "basil", "oil", "fry", "bake", "stir"]
+
+
+def random_text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS).title() if rng.random() < 0.1 else rng.choice(WORDS) for _ in range(words))
+
+
+def brute_search(recipes, query, limit, recipe_ids=None):
+    """ BM25 over the recipes as they are now, worked out from scratch """
+
+    frequencies = {}
+    for recipe_id, (name, instructions) in recipes.items():
+        counts = Counter(terms(instructions))
+        for term in terms(name):
+            counts[term] += NAME_WEIGHT
+        frequencies[recipe_id] = counts
+
+    average_length = sum(sum(counts.values()) for counts in frequencies.values()) / len(recipes)
+    scores = {}
+    for term in set(terms(query)):
+        using = [recipe_id for recipe_id, counts in frequencies.items() if counts[term]]
+        weight = math.log(1 + (len(recipes) - len(using) + 0.5) / (len(using) + 0.5)) * (K1 + 1)
+        for recipe_id in using:
+            if recipe_ids is not None and recipe_id not in recipe_ids:
+                continue
+            frequency = frequencies[recipe_id][term]
+            norm = K1 * (1 - B + B * sum(frequencies[recipe_id].values()) / average_length)
+            scores[recipe_id] = scores.get(recipe_id, 0.0) + weight * frequency / (frequency + norm)
+
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+
+def test_terms_drop_plurals_but_not_double_s():
+    assert terms("Eggs, GLASS and bus-stop!") == ["egg", "glass", "and", "bus", "stop"]
+    assert terms(None) == []
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_search_matches_brute_force(seed):
+    rng = random.Random(seed)
+    index = SearchIndex()
+    recipes = {}
+
+    for _ in range(200):
+        recipe_id = rng.randint(1, 40)
+        action = rng.random()
+        if action < 0.2:
+            index.remove_recipe(recipe_id)
+            recipes.pop(recipe_id, None)
+        else:
+            name, instructions = random_text(rng, rng.randint(1, 3)), random_text(rng, rng.randint(0, 12))
+            index.set_recipe(recipe_id, name, instructions)
+            recipes[recipe_id] = (name, instructions)
+
+        if recipes and action > 0.7:
+            query = random_text(rng, rng.randint(1, 3))
+            limit = rng.randint(1, 10)
+            recipe_ids = set(rng.sample(sorted(recipes), rng.randint(1, len(recipes)))) if rng.random() < 0.3 else None
+
+            found = index.search(query, limit, recipe_ids)
+            expected = brute_search(recipes, query, limit, recipe_ids)
+
+            assert [recipe_id for recipe_id, _ in found] == [recipe_id for recipe_id, _ in expected], query
+            assert [score for _, score in found] == pytest.approx([score for _, score in expected])
+
+
+def test_name_beats_instructions():
+    index = SearchIndex()
+    index.set_recipe(1, "Tomato soup", "boil the basil")
+    index.set_recipe(2, "Basil pesto", "crush the tomato")
+    index.set_recipe(3, "Toast", "toast the bread")
+
+    assert [recipe_id for recipe_id, _ in index.search("basil", 10)] == [2, 1]
+    assert index.search("caviar", 10) == []
+    index.remove_recipe(2)
+    assert [recipe_id for recipe_id, _ in index.search("basil", 10)] == [1]
+
+
+def test_recipes_without_terms():
+    index = SearchIndex()
+    index.set_recipe(1, "!!!", None)
+    assert index.search("egg", 5) == []
+
+    index.set_recipe(2, "Egg", "")
+    assert [recipe_id for recipe_id, _ in index.search("egg", 5)] == [2]